@@ -0,0 +1,188 @@
+from collections import deque
+from datetime import datetime
+
+
+class Autoscaler(object):
+    """ Decides which stage of the pipeline gets another process and which
+    one gives a process back, so a fixed number of processes is spent where
+    it raises the number of executed queries.
+
+    Every second, sample() records the depth of each queue and the numbers
+    of items put into and taken out of it, see SharedRingBuffer.counts().
+    Over a sliding window of these samples the fill of a queue is its mean
+    depth relative to the target size, clipped to [0, 1]. A stage whose
+    input queue is full and whose output queue is empty can't keep up with
+    its neighbours, so the score of a stage is the fill of its input minus
+    the fill of its output, taking the input of the first stage as full and
+    the output of the last stage as empty. The stage with the highest score
+    is the bottleneck and gets another process if its score is at least
+    .5, taking one from the stage with the lowest score if there are no
+    processes left. Stages scoring -.5 or less have more processes than
+    they need and give one back. If adding a process to a stage didn't
+    raise the rate of executed queries by 5 percent, the stage isn't
+    scaled up again for 6 windows. After each decision a whole window
+    passes before the next one, so the queues can settle. With a target
+    rate, the QueryGenerators wait for their turn, so their input fills up
+    while the target is met; no process is added then. Likewise, the stage
+    executing the queries gets no process while the in-flight window is
+    nearly full on average, as more processes would only wait for it.
+    Fixed stages, like the fused workers that each own a shard, are scored
+    but never get or give back a process.
+
+    :param list stages: (name, input queue, output queue) of each stage in pipeline order, the queues are None at the ends of the pipeline
+    :param ring executed: the queue of the executed queries, its gets are counted as the end-to-end throughput
+    :param int target_size: target size of the queues
+    :param optional int window: number of samples of the sliding window. default = 5
+    :param optional float target_rate: target rate of the queries, if the load is open-loop. default = None
+    :param optional in_flight: the SharedInFlightWindow of the connections. default = None
+    :param optional fixed: names of the stages with a fixed number of processes. default = ()
+    """
+    def __init__(self, stages, executed, target_size, window=5,
+                 target_rate=None, in_flight=None, fixed=()):
+        self.stages = stages
+        self.fixed = fixed
+        self.executed = executed
+        self.target_size = float(target_size)
+        self.window = window
+        self.target_rate = target_rate
+        self.in_flight = in_flight
+        # samples of (time, {queue: (depth, puts, gets)}), oldest first
+        self.samples = deque(maxlen=window)
+        # the queries in flight at each sample
+        self.in_flight_samples = deque(maxlen=window)
+        # number of samples until the next decision
+        self.cooldown = window
+        # the last stage scaled up and the throughput before that
+        self.last_added = None
+        self.throughput_before = None
+        # remaining windows in which a stage isn't scaled up, by name
+        self.saturated = {}
+
+    def sample(self, now):
+        """ Records the state of all queues.
+
+        :param float now: current time in seconds
+        """
+        queues = {}
+        for _, queue_in, queue_out in self.stages:
+            for queue in (queue_in, queue_out):
+                if queue is not None and id(queue) not in queues:
+                    queues[id(queue)] = (queue.qsize(),) + queue.counts()
+        self.samples.append((now, queues))
+        if self.in_flight is not None:
+            self.in_flight_samples.append(self.in_flight.in_flight())
+
+    def fill(self, queue):
+        """ Returns the mean depth of a queue in the window relative to the
+        target size, clipped to [0, 1].
+        """
+        depths = [queues[id(queue)][0] for _, queues in self.samples]
+        return min(1., sum(depths) / (len(depths) * self.target_size))
+
+    def rate(self, queue, index):
+        """ Returns the items per second put into (index 1) or taken out of
+        (index 2) a queue over the window.
+        """
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        if end <= start:
+            return 0.
+        return (last[id(queue)][index] - first[id(queue)][index]) / (end - start)
+
+    def scores(self):
+        """ Returns the score and throughput in items per second of each
+        stage by its name.
+        """
+        result = {}
+        for name, queue_in, queue_out in self.stages:
+            if queue_in is None:
+                fill_in = 1.
+                throughput = self.rate(queue_out, 1)
+            else:
+                fill_in = self.fill(queue_in)
+                throughput = self.rate(queue_in, 2)
+            fill_out = 0. if queue_out is None else self.fill(queue_out)
+            result[name] = (fill_in - fill_out, throughput)
+        return result
+
+    def executing_stages(self):
+        """ Returns the names of the stages putting the executed queries
+        into their output queue.
+        """
+        return [name for name, _, queue_out in self.stages
+                if queue_out is self.executed]
+
+    def window_full(self):
+        """ Returns whether the in-flight window was at least 90 percent
+        full on average over the samples of the window.
+        """
+        if self.in_flight is None or self.in_flight.size is None or \
+                not self.in_flight_samples:
+            return False
+        mean = sum(self.in_flight_samples) / float(len(self.in_flight_samples))
+        return mean >= .9 * self.in_flight.size
+
+    def decide(self, processes, room):
+        """ Returns what to do after the latest sample.
+
+        :param dict processes: number of processes of each stage by name
+        :param bool room: whether another process may be started
+        :return: ('add' or 'retire', name of the stage), or None
+        :rtype: tuple or None
+        """
+        self.cooldown -= 1
+        if self.cooldown > 0 or len(self.samples) < self.window:
+            return None
+        scores = self.scores()
+        throughput = self.rate(self.executed, 2)
+        timepoint = datetime.now().replace(microsecond=0)
+
+        # check whether the last process added paid off
+        if self.last_added is not None:
+            if throughput < 1.05 * self.throughput_before:
+                print '%s autoscaler: adding a %s raised the throughput only ' \
+                      'from %.0f to %.0f queries/s, not adding more for now' % (
+                          timepoint, self.last_added, self.throughput_before,
+                          throughput)
+                self.saturated[self.last_added] = 6
+            self.last_added = None
+        for name in self.saturated.keys():
+            self.saturated[name] -= 1
+            if self.saturated[name] <= 0:
+                del self.saturated[name]
+
+        order = [name for name, _, _ in self.stages]
+        candidates = [name for name in order
+                      if name not in self.saturated and name not in self.fixed]
+        if self.window_full():
+            candidates = [name for name in candidates
+                          if name not in self.executing_stages()]
+        bottleneck = max(candidates or order, key=lambda name: scores[name][0])
+        # stages that could give a process back, the most idle one first
+        excess = sorted([name for name in order
+                         if processes.get(name, 0) > 1 and name != bottleneck
+                         and name not in self.fixed],
+                        key=lambda name: scores[name][0])
+        # more processes can't raise the rate beyond the target
+        at_target = (self.target_rate is not None and
+                     throughput >= .98 * self.target_rate)
+        decision = None
+        if scores[bottleneck][0] >= .5 and bottleneck in candidates \
+                and not at_target:
+            if room:
+                decision = ('add', bottleneck)
+                self.last_added = bottleneck
+                self.throughput_before = throughput
+            elif excess and scores[excess[0]][0] <= 0:
+                decision = ('retire', excess[0])
+        elif excess and scores[excess[0]][0] <= -.5:
+            decision = ('retire', excess[0])
+
+        if decision is not None:
+            stats = ', '.join('%s: %i processes, score %.2f, %.0f items/s' % (
+                name, processes.get(name, 0), scores[name][0], scores[name][1])
+                for name in order)
+            print '%s autoscaler: %s a %s at %.0f queries/s (%s)' % (
+                timepoint, 'adding' if decision[0] == 'add' else 'retiring',
+                decision[1], throughput, stats)
+            self.cooldown = self.window
+        return decision
@@ -0,0 +1,107 @@
+""" Compares the generation of collections by PythonTypes with the way it
+was done before distinct_values(), for collections of 10, 1000 and 100000
+integers, sets of the integers 0..n-1 and sets of booleans. Prints the
+milliseconds per collection. Run from the root of the repository:
+
+    python -m benchmarks.collections_benchmark
+
+Generating a tuple of 100000 elements the previous way alone takes about
+half a minute.
+"""
+from time import time
+
+from randomdata.counterrandom import CounterCassandraTypes
+
+sizes = (10, 1000, 100000)
+# number of elements generated per measurement, spread over the collections
+elements_per_run = 20000
+
+
+# the previous implementations, appending to a tuple and drawing distinct
+# values until there are enough of them, with the unknown types left out
+def previous_pylist(generator, elems, elem_type='int', **elem_args):
+    result = []
+    for _ in xrange(elems):
+        result.append(generator.methods_switch[elem_type](**elem_args))
+    return result
+
+
+def previous_pytuple(generator, elems, elem_type='int', **elem_args):
+    result = ()
+    for _ in xrange(elems):
+        result += (generator.methods_switch[elem_type](**elem_args),)
+    return result
+
+
+def previous_pydict(generator, elems, key_type='int', elem_type='int', **elem_args):
+    result = dict()
+    while len(result) < elems:
+        result[generator.methods_switch[key_type]()] = (
+            generator.methods_switch[elem_type](**elem_args))
+    return result
+
+
+def previous_pyset(generator, elems, elem_type='int', **elem_args):
+    result = set()
+    while len(result) < elems:
+        result.add(generator.methods_switch[elem_type](**elem_args))
+    return result
+
+
+def current(name):
+    """ Returns a function generating a collection of exactly elems
+    elements with the method of the given name.
+    """
+    def generate(generator, elems, **elem_args):
+        return getattr(generator, name)(min_elems=elems, max_elems=elems,
+                                        **elem_args)
+    return generate
+
+
+def dense(elems):
+    return {'low': 0, 'high': elems - 1}
+
+
+def booleans(elems):
+    return {'elem_type': 'boolean'}
+
+
+# label, arguments by size, previous and current function; the previous
+# function is None if it never terminates
+cases = [('tuple', None, previous_pytuple, current('pytuple')),
+         ('list', None, previous_pylist, current('pylist')),
+         ('set', None, previous_pyset, current('pyset')),
+         ('dict', None, previous_pydict, current('pydict')),
+         ('set of 0..n-1', dense, previous_pyset, current('pyset')),
+         ('set of booleans', booleans, None, current('pyset'))]
+
+
+def measure(generate, generator, elems, elem_args):
+    """ Returns the milliseconds needed per collection.
+    """
+    runs = max(1, elements_per_run // elems)
+    start = time()
+    for _ in xrange(runs):
+        generate(generator, elems, **elem_args)
+    return (time() - start) / runs * 1e3
+
+
+def main():
+    generator = CounterCassandraTypes(1)
+    print '%-26s' % 'ms per collection' + ''.join(
+        '%14s' % ('%i elems' % elems) for elems in sizes)
+    for label, arguments, previous, present in cases:
+        print label
+        for version, generate in (('before', previous), ('after', present)):
+            if generate is None:
+                print '%-16s%-10s%s' % ('', version, '  never terminates for more than 2 elements')
+                continue
+            row = []
+            for elems in sizes:
+                elem_args = arguments(elems) if arguments is not None else {}
+                row.append('%14.3f' % measure(generate, generator, elems, elem_args))
+            print '%-16s%-10s%s' % ('', version, ''.join(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" Compares the throughput of the SharedRingBuffer between the generators
+with the queue of a multiprocessing manager used before, for one and two
+producer and consumer processes and for items the size of the ones of the
+WorkloadGenerator and of the DataGenerator. Prints the items passed per
+second. Run from the root of the repository:
+
+    python -m benchmarks.ringbuffer_benchmark
+"""
+from multiprocessing import Process, Queue
+from multiprocessing.managers import SyncManager
+from time import time
+
+from sharedmemory.ringbuffer import SharedRingBuffer
+
+# an item of the workload queue and one of the data queue, about 1.1 KB
+items = [('workload item', (3, [(True, (123456789, 987654321, 55555))])),
+         ('data item, 1.1 KB', (3, [(True, ['a' * 100, 12345, 'b' * 1000])]))]
+# numbers of producers and consumers
+processes = [(1, 1), (2, 2)]
+# items passed per measurement, fewer through the slower manager queue
+passes = {'manager.Queue': 20000, 'SharedRingBuffer': 100000}
+
+
+def produce(queue, item, number):
+    put = queue.put
+    for _ in xrange(number):
+        put(item)
+
+
+def consume(queue, number):
+    get = queue.get
+    for _ in xrange(number):
+        get()
+
+
+def measure(queue, item, producers, consumers, number):
+    """ Returns the items passed per second.
+    """
+    workers = [Process(target=produce, args=(queue, item, number // producers))
+               for _ in xrange(producers)]
+    workers += [Process(target=consume, args=(queue, number // consumers))
+                for _ in xrange(consumers)]
+    start = time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return number / (time() - start)
+
+
+def main():
+    manager = SyncManager()
+    manager.start()
+    queues = [('manager.Queue', manager.Queue),
+              ('SharedRingBuffer', lambda: SharedRingBuffer(1 << 20))]
+    print '%-20s%-8s' % ('items per second', '') + ''.join(
+        '%18s' % name for name, _ in queues)
+    for label, item in items:
+        for producers, consumers in processes:
+            row = ['%18.0f' % measure(make(), item, producers, consumers,
+                                      passes[name])
+                   for name, make in queues]
+            print '%-20s%-8s%s' % (label, '%i->%i' % (producers, consumers),
+                                   ''.join(row))
+            label = ''
+    manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from datetime import datetime
-from time import sleep
+from threading import Lock
+from time import sleep, time
 
 from cassandra.cluster import Cluster
 
@@ -12,8 +13,8 @@ class CassandraConnection(ConnectionInterface):
     execute_unprepared_stmt = None
     prepare = None
 
-    def __init__(self, **connection_args):
-        ConnectionInterface.__init__(self, **connection_args)
+    def __init__(self, window=None, **connection_args):
+        ConnectionInterface.__init__(self, window=window, **connection_args)
 
     def connect(self):
         """ Create connection to cassandra cluster.
@@ -26,6 +27,11 @@ class CassandraConnection(ConnectionInterface):
         # method to prepare statements
         self.prepare = self.session.prepare
 
+        # number of queries whose callbacks haven't run yet, the callbacks
+        # run in the threads of the driver
+        self.in_flight = 0
+        self.in_flight_lock = Lock()
+
     def shutdown(self):
         """ Terminate connection to cassandra cluster.
         """
@@ -41,9 +47,19 @@ class CassandraConnection(ConnectionInterface):
         :param tuple metadata: metadata needed for logging. default = None
         """
 
+        # wait for a slot of the in-flight window, so the requests can't
+        # pile up in the driver
+        if self.window is not None:
+            self.window.acquire()
         # execute query asynchronously, returning a ResponseFuture-object
         # to which callbacks can be added
-        future = self.session.execute_async(statement, parameters)
+        with self.in_flight_lock:
+            self.in_flight += 1
+        try:
+            future = self.session.execute_async(statement, parameters)
+        except:
+            self.finished()
+            raise
         # Add a callback to fn which puts data needed by the LogGenerator into
         # the queue. The errback calls the stated function with the error as
         # first positional parameter, the normal callback just calls it with
@@ -56,15 +72,39 @@ class CassandraConnection(ConnectionInterface):
                             )
         # queue_out.put(([], datetime.now(), datetime.now(), metadata))
 
+    def wait_idle(self, timeout=None):
+        if timeout is not None:
+            deadline = time() + timeout
+        while self.in_flight > 0:
+            if timeout is not None and time() > deadline:
+                return False
+            sleep(.01)
+        return True
+
     def success(self, res, start, mdata, queue_out, parameters):
         # print 'CassandraConnection success: ', None, start, datetime.now(), mdata
-        queue_out.put((None, start, datetime.now(), mdata))
+        end = datetime.now()
+        # Give the slot back before putting the result, which may block on
+        # a full queue or fail, so the window never leaks slots.
+        self.finished()
+        queue_out.put((None, start, end, mdata))
 
     def failure(self, response, start, mdata, queue_out):
         # print 'CassandraConnection failure: ', response, start, datetime.now(), mdata
         response = 'ERROR! %s' % (response)
         # TODO: test this case
-        queue_out.put((response, start, datetime.now(), mdata))
+        end = datetime.now()
+        self.finished()
+        queue_out.put((response, start, end, mdata))
+
+    def finished(self):
+        """ Counts a query as done, giving its slot of the in-flight
+        window back.
+        """
+        with self.in_flight_lock:
+            self.in_flight -= 1
+        if self.window is not None:
+            self.window.release()
 
     def fn(self, err, start, mdata, queue):
         print 'CassandraConnection: ', err, start, datetime.now(), mdata
@@ -7,9 +7,13 @@ class ConnectionInterface(object):
         * clearing a connection, and
         * non-blocking, asynchronous query execution
     have to be implemented by subclasses.
+
+    Executing a query takes a slot of the in-flight window, if given, and
+    its result gives the slot back, see SharedInFlightWindow.
     """
 
-    def __init__(self, **connection_args):
+    def __init__(self, window=None, **connection_args):
+        self.window = window
         self.connection_args = connection_args
         self.connect()
 
@@ -26,6 +30,16 @@ class ConnectionInterface(object):
         self.shutdown()
         self.connect()
 
+    def wait_idle(self, timeout=None):
+        """ Waits until all queries executed so far have put their results
+        into the queue.
+
+        :param optional float timeout: seconds to wait at most, forever if None. default = None
+        :return: whether no query is executing anymore
+        :rtype: bool
+        """
+        raise NotImplementedError
+
     def execute(self, query, parameters, out_queue, metadata=None):
         """ Binds parameters to a given query and executes it non-blocking and
         asynchronously, putting an object interpretable by the LogGenerator
@@ -1,19 +1,27 @@
-from multiprocessing import Process
+from multiprocessing import Event, Process
+from Queue import Empty, Full, Queue
+from random import Random
 from time import time
 from datetime import datetime
 
+from latencysummary import LatencySummary, merge_into
+from randomdata.aliastable import AliasTable
+from randomdata.batchtypes import batch_available, generate_batch
+from randomdata.counterrandom import CounterRandom
+from sharedmemory.keybitmap import NoLock
+from sharedmemory.valuepool import pool_key
+from workloadplan import INSERT, UPDATE, DELETE
+
 
 class BaseGenerator(Process):
     """Prototype for all generators. It has queues for data in- and
-    output, events to notify a need for supervision and to signal a
-    wanted shutdown, and parameters for the queue target size and the
-    queue size limit for the signal raising.
+    output, an event to signal a wanted shutdown, and the target size of
+    the output queue.
 
     """
     def __init__(self, queue_in=None, queue_out=None,
-                 queue_target_size=0, queue_notify_size=0,
-                 needs_more_input=None, shutdown=None,
-                 config=None):
+                 queue_target_size=0, shutdown=None,
+                 plan=None):
 
         Process.__init__(self)
 
@@ -23,15 +31,15 @@ class BaseGenerator(Process):
 
         # queue sizes
         self.queue_target_size = queue_target_size
-        self.queue_notify_size = queue_notify_size
 
         # events
-        self.needs_more_input = needs_more_input
         self.shutdown = shutdown
 
-        # configuration
-        # TODO: pass only needed information
-        self.config = config
+        # the compiled workloads, see WorkloadPlan
+        self.plan = plan
+
+        # set by the coordinator to end this generator alone, see _run
+        self.retire = Event()
 
     def after_init(self):
         """ Method called once between the process creation and process running
@@ -39,33 +47,50 @@ class BaseGenerator(Process):
         """
         pass
 
+    def before_exit(self):
+        """ Method called once before a retired generator ends, to finish
+        the work it started.
+        """
+        pass
+
     def run(self):
         self.after_init()
         self._run()
 
     def _run(self):
-        # TODO: docstring
+        """ Processes items until the shutdown signal or the retire signal
+        is set. The queues are SharedRingBuffers, which the coordinator
+        closes on shutdown and interrupts when retiring a generator.
+        """
         while True:
-            # Check whether there is already enough data in the
-            # output queue, and wait while there is.
-            while (self.queue_out is not None) and\
-                    (self.queue_out.qsize() > self.queue_target_size) and\
-                    not self.shutdown.is_set():
-                # wait for more input, but don't ignore the shutdown signal
-                # TODO: How long should be waited?
-                self.shutdown.wait(.00001)
-
             # if it was decided it is time to shut down - do so!
             if self.shutdown.is_set():
                 break
+            # A retired generator only leaves between two items, so no
+            # item gets lost.
+            if self.retire.is_set():
+                self.before_exit()
+                break
 
-            # check whether more input is needed
-            if (self.queue_in is not None) and\
-                    (self.queue_in.qsize() < self.queue_notify_size):
-                self.needs_more_input.set()
+            # Check whether there is already enough data in the output
+            # queue, and block while there is. The consumers wake us as
+            # they drain the queue, closing or interrupting it ends the
+            # wait. The queue is still full then, so check the signals
+            # again instead of producing another item.
+            if (self.queue_out is not None) and\
+                    (self.queue_out.qsize() > self.queue_target_size):
+                if not self.queue_out.wait_below(self.queue_target_size):
+                    continue
 
             # there is something to do, so let's go!
-            self.process_item()
+            try:
+                self.process_item()
+            except Empty:
+                # the input queue was closed while waiting for an item
+                continue
+            except Full:
+                # the output queue was closed while waiting for space
+                continue
 
     def process_item(self):
     # TODO: docstring
@@ -76,190 +101,261 @@ class WorkloadGenerator(BaseGenerator):
     # TODO: DocString
     # TODO: the WorkloadGenerator is too Cassandra-specific, either solve that or put it into a own module
     generator = None
+    partition_generator = None
     def __init__(self, queue_in=None, queue_out=None,
-                 queue_target_size=0, queue_notify_size=0,
-                 needs_more_input=None, shutdown=None,
-                 config=None, key_structs=None, generator_class=None):
+                 queue_target_size=0, shutdown=None,
+                 plan=None, key_structs=None, generator_class=None,
+                 shard=0, key_model='bitmap', gate=None):
 
         self.generator_class = generator_class
 
         BaseGenerator.__init__(self, queue_in=queue_in, queue_out=queue_out,
                            queue_target_size=queue_target_size,
-                           queue_notify_size=queue_notify_size,
-                           needs_more_input=needs_more_input,
-                           shutdown=shutdown, config=config)
+                           shutdown=shutdown, plan=plan)
 
         self.key_structs = key_structs
-
-        # aggregate the chances and map the chances
-        # of each workload into [0,ratio_sum]
-        self.ratio_sum = 0
-        self.ratio_nums = {}
-        for workload_name, workload_data in config['workloads'].items():
-            self.ratio_nums[self.ratio_sum] = workload_name
-            self.ratio_sum += workload_data['ratio']
+        # the shard of the key bitmaps new seeds are appended to
+        self.shard = shard
+        # 'bitmap' or 'stateless', see bitmap_seeds() and stateless_seeds()
+        self.key_model = key_model
+        # changes of the key state pass the gate of the checkpoint, if
+        # there is one, see CheckpointGate
+        if gate is None:
+            gate = NoLock()
+        self.gate = gate
+
+        # alias table choosing the index of a workload according to the
+        # ratios of the workloads in constant time
+        self.workloads = AliasTable(range(len(plan.names)), plan.ratios)
+        # the queries of each workload with the key structures of their
+        # tables looked up
+        self.queries = tuple(
+            tuple((query_type, key_structs.get(table), chance, attributes)
+                  for query_type, table, chance, attributes in queries)
+            for queries in plan.queries)
+        # function returning the random numbers for choosing workloads
+        self.workload_random = None
+        # generator choosing the existing keys queries work on
+        self.key_random = None
 
     def after_init(self):
         self.generator = self.generator_class()
+        # The partition seed of a new item is drawn from a generator
+        # seeded with the item's seed, and drawn again the same way to find
+        # it later. That generator is kept apart, so reseeding it never
+        # changes the state of self.generator.
+        self.partition_generator = self.generator_class()
+        # The choice of the workload and of the existing keys need random
+        # numbers of their own, from generators that are never reseeded.
+        # Otherwise they would be determined by the seeds of the previous
+        # item and fall into short cycles.
+        self.workload_random = Random().random
+        self.key_random = Random()
 
     def process_item(self):
-        # choose a workload to work on by picking
-        # a random int between 0 and ratio_sum
-        choice = self.generator.random() * self.ratio_sum
-        choice = max(key for key in self.ratio_nums if key <= choice)
-
-        # get the chosen workload
-        workload_name = self.ratio_nums[choice]
-        workload = self.config['workloads'][workload_name]
+        # choose a workload to work on
+        workload = self.workloads.choice(self.workload_random())
 
         queries = []
-        for query in workload['queries']:
-            query_data = []
+        access = self.plan.access[workload]
+        for query_type, key_struct, chance, attributes in self.queries[workload]:
             # queries without attributes don't need seeds
-            if len(query['attributes']) == 0:
-                queries.append((False, query_data))
+            if len(attributes) == 0:
+                queries.append((False, ()))
                 continue
-            # we need the bitmap of seeds that were used as primary keys and
-            # (maybe) also the dictionary of updated keys
-            table = query['table']
-            bitmap = self.key_structs[table]['bitmap']
-            update_dict = self.key_structs[table]['update_dict']
-            # check if a new data item might be generated
-            if query['type'] == 'insert':
-                # lock the bitmap for the table the item will be stored in
-                with bitmap.lock:
-                    cluster_seed = bitmap.length()/3
-                    partition_seed = cluster_seed
-                    # seed the generator to produce regeneratable results
-                    self.generator.seed(partition_seed)
-                    # determine if this seed just generates
-                    # a new cluster for an old primary key
-                    new_cluster = query['chance'] <= self.generator.random()
-                    if new_cluster and partition_seed > 0:
-                        # We need an old key that created a completely new
-                        # item, so we randomly iterate over old keys until we
-                        # find one that did. If no key was ever used to create
-                        # a completely new item, we fall back to seed zero,
-                        # which always generates a completely new item.
-                        while True:
-                            partition_seed = self.generator.randrange(0, cluster_seed)
-                            if partition_seed == 0 or bitmap[partition_seed*3]:
-                                break
-                    # Tell the other processes what happened by appending the
-                    # choice we made to the bitmap. The or-part makes sure that
-                    # bitmap[0] is always 1, i.e. seed zero always generates a
-                    # completely new item
-                    bitmap.extend((not(new_cluster) or cluster_seed == partition_seed, 0, 0))
-                update_seed = cluster_seed
-
-            # query types other than insert need the partition and cluster key
-            # to access specific data.
-            elif query['type'] in ('select', 'update', 'delete'):
-                # Both a partition key and a cluster key are needed. Choose a
-                # random old seed and look what happened with that seed. If it
-                # generated a new cluster for another partition key, get that
-                # key by following the steps that originally led to that key.
-                with bitmap.lock:
-                    # determine the highest used seed
-                    # Notice that the data item produced by this seed might not
-                    # be in the database if an error occurred while processing.
-                    # See comment on max_inserted LogGenerator for more details.
-                    ks_length = bitmap.length()/3
-                    if ks_length > 1:
-                        was_deleted = True
-                        # search for a seed that has not been deleted
-                        while was_deleted:
-                            cluster_seed = self.generator.randrange(0, ks_length)
-                            is_primary, was_updated, was_deleted =\
-                                tuple(bitmap[cluster_seed*3:cluster_seed*3+3])
-
-                    else:
-                        # A workload other than insert has been chosen, but
-                        # there has been not data generated yet that could be
-                        # used. Return to the _run method and hope this won't
-                        # happen again.
-                        # TODO: better handling of that case
-                        print 'No data has been created yet,',
-                        print 'but a query in the chosen workload needs data.'
-                        return
-
-                    partition_seed = cluster_seed
-                    # if this seed did not produce a completely new item the
-                    # partition key it did produce a new cluster for is needed
-                    if not (cluster_seed >= ks_length) and\
-                            not is_primary:
-                        self.generator.seed(partition_seed)
-                        # When generating a new cluster it is first tested if
-                        # a new cluster will be generated by using a random
-                        # number, so we need to advance the generator one step.
-                        self.generator.random()
-                        # now we can search for the partition key that was used
-                        # notice this takes 1/chance steps on average
-                        while True:
-                            partition_seed = self.generator.randrange(0, cluster_seed)
-                            is_primary, was_updated, was_deleted =\
-                                tuple(bitmap[cluster_seed*3:cluster_seed*3+3])
-                            if (not was_deleted) and\
-                                    (partition_seed == 0 or is_primary):
-                                break
-                update_seed = cluster_seed
-                # if the item has been updated get the seed used for that
-                if was_updated:
-                    with update_dict.lock:
-                        update_seed = update_dict[cluster_seed]
-
-                # if an item will get an update, determine the seed for that,
-                # put it in the update_dict and set the was_updated-bit in the
-                # key bitmap if necessary
-                if query['type'] == 'update':
-                    if not was_updated:
-                        # use the cluster key to compute the first seed to use
-                        with update_dict.lock:
-                            update_seed = self.generator.lcg_random(cluster_seed)
-                            update_dict[cluster_seed] = update_seed
-                        with bitmap.lock:
-                            # set the was_updated bit
-                            bitmap[cluster_seed*3+1] = True
-                    else:
-                        # use the old update seed to compute the next seed
-                        with update_dict.lock:
-                            update_seed = self.generator.lcg_random(update_dict[cluster_seed])
-                            update_dict[cluster_seed] = update_seed
-
-                # set the was_deleted bit if an item should be deleted and
-                # delete the entry in the update_dict if it has one
-                if query['type'] == 'delete':
-                    with bitmap.lock:
-                        bitmap[cluster_seed*3+2] = True
-                    if was_updated:
-                        with update_dict.lock:
-                            del update_dict[cluster_seed]
-
+            # determine the seeds for the keys and attributes of the query
+            if self.key_model == 'stateless':
+                seeds = self.stateless_seeds(query_type, key_struct, access)
             else:
-                msg = 'unsupported query type %s' % query[type]
-                raise NotImplementedError(msg)
-
-            # Finally iterate over all the attributes of this query and append
-            # the needed metadata to the list of queries.
-            for attribute in query['attributes']:
-                if attribute['level'] == 'partition':
-                    seed = partition_seed
-                elif attribute['level'] == 'cluster':
-                    seed = cluster_seed
+                seeds = self.bitmap_seeds(query_type, chance, key_struct,
+                                          access)
+            if seeds is None:
+                # A workload other than insert has been chosen, but
+                # there is no data that could be used, either because
+                # none was generated yet or because all of it was
+                # deleted. Return to the _run method and hope this
+                # won't happen again.
+                # TODO: better handling of that case
+                print 'There is no live data,',
+                print 'but a query in the chosen workload needs data.'
+                return
+
+            # Finally pick the seed of the level of each attribute and make
+            # it unique per attribute. The data generators know the rest
+            # from the plan. Append a marker for new objects.
+            queries.append((query_type == INSERT,
+                            tuple(seeds[level] + column_hash
+                                  for level, column_hash in attributes)))
+
+        # put the workload with its seeds into the queue
+        self.queue_out.put((workload, queries))
+
+    def bitmap_seeds(self, query_type, chance, key_struct, access=None):
+        """ Determines the seeds for a query using the key bitmap of its
+        table, see stateless_seeds() for the alternative.
+
+        :param int query_type: code of the type of the query, see workloadplan
+        :param float chance: chance of an insert query to create a new partition
+        :param dict key_struct: the key bitmap and update_dict of the table
+        :param optional KeyAccess access: distribution of the existing keys to choose, uniform if None. default = None
+        :return: the partition, cluster and update seed, or None if the query needs data but there is none
+        :rtype: tuple or None
+        """
+        # we need the bitmap of seeds that were used as primary keys and
+        # (maybe) also the dictionary of updated keys
+        bitmap = key_struct['bitmap']
+        update_dict = key_struct['update_dict']
+        # check if a new data item might be generated
+        if query_type == INSERT:
+            # Lock the shard of the bitmap the item will be stored in. If
+            # the shard is exclusive to this process, no lock is needed.
+            shard = bitmap.shards[self.shard]
+            with self.gate, shard.lock:
+                index = len(shard)
+                cluster_seed = bitmap.seed(self.shard, index)
+                partition_seed = cluster_seed
+                # seed the generator to produce regeneratable results
+                partition_generator = self.partition_generator
+                partition_generator.seed(partition_seed)
+                # determine if this seed just generates
+                # a new cluster for an old primary key
+                new_cluster = chance <= partition_generator.random()
+                if new_cluster and index > 0:
+                    # We need an old key of the same shard that created a
+                    # completely new item, so we pick a random one of the
+                    # primary seeds appended before. The first seed of a
+                    # shard always generates a completely new item, so
+                    # there is at least one. Staying within the shard
+                    # makes the choice independent of the progress of
+                    # other shards.
+                    rank = partition_generator.randrange(0, shard.primary_count.value)
+                    partition_seed = bitmap.seed(self.shard, shard.select(rank))
+                # Tell the other processes what happened by appending the
+                # choice we made to the bitmap. The or-part makes sure that
+                # the first seed of a shard is always primary, i.e. it
+                # always generates a completely new item
+                shard.append(not(new_cluster) or cluster_seed == partition_seed)
+            update_seed = cluster_seed
+
+        # query types other than insert need the partition and cluster key
+        # to access specific data.
+        else:
+            # Both a partition key and a cluster key are needed. Choose a
+            # random old seed and look what happened with that seed. If it
+            # generated a new cluster for another partition key, get that
+            # key by following the steps that originally led to that key.
+            # The flags of a seed are written before it is appended, so
+            # reading the shared bitmap needs no lock.
+
+            # Pick a random seed that has not been deleted, using the
+            # live index of the bitmap. Skewed accesses choose by age.
+            # Notice that the data item produced by this seed might not
+            # be in the database if an error occurred while processing.
+            # See comment on max_inserted LogGenerator for more details.
+            while True:
+                live = bitmap.live()
+                if live == 0:
+                    return None
+                if access is None:
+                    cluster_seed = bitmap.nth_live(
+                        self.key_random.randrange(0, live))
                 else:
-                    seed = update_seed
-                # make the seed unique per attribute
-                seed += attribute['column name hash']
-                data = (attribute['type'], seed, attribute['generator args'])
-                # append the attribute data to the list of attributes for that
-                # query
-                query_data.append(data)
-            # append a marker for new objects and the data for this query to
-            # the list of queries for that workload
-            queries.append((query['type'] == 'insert', query_data))
+                    cluster_seed = bitmap.nth_live_by_age(
+                        access.rank(self.key_random.random, live))
+                # seeds might have been deleted concurrently, so check
+                # whether the chosen one is still alive
+                if cluster_seed is not None:
+                    is_primary, was_updated, was_deleted = bitmap[cluster_seed]
+                    if not was_deleted:
+                        break
+
+            partition_seed = cluster_seed
+            # if this seed did not produce a completely new item the
+            # partition key it did produce a new cluster for is needed
+            if not is_primary:
+                partition_generator = self.partition_generator
+                partition_generator.seed(partition_seed)
+                # When generating a new cluster it is first tested if
+                # a new cluster will be generated by using a random
+                # number, so we need to advance the generator one step.
+                partition_generator.random()
+                # Now we can get the partition key that was used by
+                # repeating the steps of the insert. The is_primary bits
+                # of older seeds never change, so the number of primary
+                # seeds before this one is the same as it was on insert,
+                # leading to the same partition seed.
+                shard_num, index = bitmap.locate(cluster_seed)
+                shard = bitmap.shards[shard_num]
+                rank = partition_generator.randrange(0, shard.rank(index))
+                partition_seed = bitmap.seed(shard_num, shard.select(rank))
+            update_seed = cluster_seed
+            # if the item has been updated get the seed used for that
+            if was_updated:
+                # A concurrent delete might already have removed the
+                # entry, fall back to the cluster seed in that case.
+                update_seed = update_dict.get(cluster_seed, cluster_seed)
+
+            # if an item will get an update, determine the seed for that,
+            # put it in the update_dict and set the was_updated-bit in the
+            # key bitmap if necessary
+            if query_type == UPDATE:
+                with self.gate:
+                    # Atomically use the old update seed to compute the
+                    # next seed. If the item was not updated before, the
+                    # cluster key is used to compute the first seed.
+                    update_seed = update_dict.modify(
+                        cluster_seed, self.generator.lcg_random, cluster_seed)
+                    # Set the was_updated bit only after the update_dict
+                    # holds the seed, so readers always find it there.
+                    if not was_updated:
+                        bitmap.set_updated(cluster_seed)
 
-        # put the workload with its data into the queue
-        self.queue_out.put((workload_name, queries))
+            # set the was_deleted bit if an item should be deleted and
+            # delete the entry in the update_dict if it has one
+            if query_type == DELETE:
+                with self.gate:
+                    bitmap.set_deleted(cluster_seed)
+                    if was_updated:
+                        update_dict.pop(cluster_seed, None)
+
+        return partition_seed, cluster_seed, update_seed
+
+    def stateless_seeds(self, query_type, key_struct, access=None):
+        """ Determines the seeds for a query without any state per seed. The
+        partition seed of a cluster seed is a function of the seed itself:
+        within each shard, the seeds are grouped into partitions of a fixed
+        number of seeds (the fanout of the table), derived from the chance of
+        its insert queries. Hence the layout of the data is like the one of
+        the key bitmap, but finding a key costs O(1) arithmetic, only the
+        number of seeds per shard is stored and no lock is needed if the
+        key space is sharded.
+        Updates and deletions are not tracked: updates draw a new random
+        update seed and reads might target deleted items.
+
+        :param int query_type: code of the type of the query, see workloadplan
+        :param dict key_struct: the key space of the table
+        :param optional KeyAccess access: distribution of the existing keys to choose, uniform if None. default = None
+        :return: the partition, cluster and update seed, or None if the query needs data but there is none
+        :rtype: tuple or None
+        """
+        keyspace = key_struct['keyspace']
+        if query_type == INSERT:
+            cluster_seed = keyspace.append(self.shard)
+        else:
+            seeds = len(keyspace)
+            if seeds == 0:
+                return None
+            if access is None:
+                cluster_seed = keyspace.nth(self.key_random.randrange(0, seeds))
+            else:
+                cluster_seed = keyspace.nth_by_age(
+                    access.rank(self.key_random.random, seeds))
+        partition_seed = keyspace.partition(cluster_seed)
+        if query_type == UPDATE:
+            update_seed = self.generator.lcg_random(self.generator.getrandbits(63))
+        else:
+            update_seed = cluster_seed
+        return partition_seed, cluster_seed, update_seed
 
 
 class DataGenerator(BaseGenerator):
@@ -268,52 +364,143 @@ class DataGenerator(BaseGenerator):
     generator = None
 
     def __init__(self, queue_in=None, queue_out=None,
-                 queue_target_size=0, queue_notify_size=0,
-                 needs_more_input=None, shutdown=None,
-                 config=None,
-                 generator_class=None):
+                 queue_target_size=0, shutdown=None,
+                 plan=None,
+                 generator_class=None, batch_size=1, pools=None):
 
         self.generator_class = generator_class
+        # maximal number of items whose values are generated at once
+        self.batch_size = batch_size
+        # the ValuePools of the attributes asking for one, see pool_key()
+        self.pools = pools
 
         BaseGenerator.__init__(self, queue_in=queue_in, queue_out=queue_out,
                            queue_target_size=queue_target_size,
-                           queue_notify_size=queue_notify_size,
-                           needs_more_input=needs_more_input,
-                           shutdown=shutdown, config=config)
+                           shutdown=shutdown, plan=plan)
 
     def after_init(self):
         self.generator = self.generator_class()
+        # bind the generator methods and their arguments of each attribute
+        self.generators = tuple(
+            tuple(tuple(self.bind(*generator) for generator in attributes)
+                  for attributes in queries)
+            for queries in self.plan.generators)
+
+        # Batches reproduce the values of the counter-based generators
+        # only, see randomdata.batchtypes.
+        self.batching = self.batch_size > 1 and batch_available and\
+            issubclass(self.generator_class, CounterRandom)
+        if self.batching:
+            # Attributes with the same type and generator args form a
+            # column, whose values are generated together. Number the
+            # columns and find the column of each attribute.
+            self.columns = []
+            numbers = {}
+            self.column_numbers = tuple(
+                tuple(tuple(self.column_number(numbers, *generator)
+                            for generator in attributes)
+                      for attributes in queries)
+                for queries in self.plan.generators)
+
+    def column_number(self, numbers, type, generator_args, pool_size):
+        """ Returns the number of the column of the given type, generator
+        args and pool size, adding the column to self.columns if it is new.
+
+        :param dict numbers: the numbers of the columns found so far
+        """
+        key = pool_key(type, generator_args, pool_size)
+        if key not in numbers:
+            numbers[key] = len(self.columns)
+            self.columns.append((type, generator_args, pool_size,
+                                 self.bind(type, generator_args, pool_size)))
+        return numbers[key]
+
+    def bind(self, type, generator_args, pool_size):
+        """ Returns a function computing the value of the given type with the
+        given arguments from its seed.
+        """
+        # values of attributes with a pool are just picked from it
+        if pool_size:
+            return self.pools[pool_key(type, generator_args, pool_size)].get
+        try:
+            method = self.generator.methods_switch[type]
+        except KeyError:
+            msg = "generator for type %s not implemented!" % type
+            raise NotImplementedError(msg)
+        seed = self.generator.seed
+        if len(generator_args) == 0:
+            def generate(value_seed):
+                # reseed the generator to generate the wanted item
+                seed(value_seed)
+                return method()
+        else:
+            def generate(value_seed):
+                seed(value_seed)
+                return method(**generator_args)
+        return generate
 
     def process_item(self):
         """ Generates the data for workload from the input queue and
         puts the result into the output queue.
         """
+        if self.batching:
+            self.process_batch()
+            return
 
         # get and unpack the item we want to process
-        workload_name, queries = self.queue_in.get()
+        workload, queries = self.queue_in.get()
 
         # Each workload could have multiple queries. Each query could need
         # multiple columns. Each column could be needed more than once. Each
         # column instance could be needed with different configurations.
         workload_data = []
-        for new, query in queries:
-            query_values = []
-            for type, seed, generator_args in query:
-
-                # reseed the generator to generate the wanted item
-                self.generator.seed(seed)
-                try:
-                    val = self.generator.methods_switch[type](**generator_args)
-                except KeyError:
-                    msg = "generator for type %s not implemented!" % type
-                    raise NotImplementedError(msg)
-                query_values.append(val)
+        for (new, seeds), generators in zip(queries, self.generators[workload]):
+            query_values = [generate(attribute_seed) for generate, attribute_seed
+                            in zip(generators, seeds)]
 
             # append the data for that query to the workload data
             workload_data.append((new, query_values))
 
         # repack the item and put it into the output queue
-        self.queue_out.put((workload_name, workload_data))
+        self.queue_out.put((workload, workload_data))
+
+    def process_batch(self):
+        """ Like process_item, but takes up to batch_size items from the
+        input queue and generates the values of each column for all of them
+        at once.
+        """
+        # wait for the first item only, take what is there besides it
+        items = [self.queue_in.get()]
+        try:
+            while len(items) < self.batch_size:
+                items.append(self.queue_in.get_nowait())
+        except Empty:
+            pass
+
+        # collect the seeds of each column
+        seeds = [[] for _ in self.columns]
+        for workload, queries in items:
+            for (new, query_seeds), numbers in zip(queries, self.column_numbers[workload]):
+                for seed, number in zip(query_seeds, numbers):
+                    seeds[number].append(seed)
+
+        # generate the values of each column, using the scalar methods for
+        # the types and arguments that can't be vectorized and for pools
+        values = []
+        for (type, generator_args, pool_size, generate), column_seeds in zip(self.columns, seeds):
+            column_values = None
+            if len(column_seeds) > 0 and not pool_size:
+                column_values = generate_batch(type, column_seeds, generator_args)
+            if column_values is None:
+                column_values = [generate(seed) for seed in column_seeds]
+            values.append(iter(column_values).next)
+
+        # hand the values out in the order the seeds were collected
+        for workload, queries in items:
+            workload_data = []
+            for (new, _), numbers in zip(queries, self.column_numbers[workload]):
+                workload_data.append((new, [values[number]() for number in numbers]))
+            self.queue_out.put((workload, workload_data))
 
 
 class QueryGenerator(BaseGenerator):
@@ -322,22 +509,31 @@ class QueryGenerator(BaseGenerator):
     connection = None
 
     def __init__(self, queue_in=None, queue_out=None,
-                 queue_target_size=0, queue_notify_size=0,
-                 needs_more_input=None, shutdown=None,
-                 config=None,
-                 connection_class=None, connection_args=None):
+                 queue_target_size=0, shutdown=None,
+                 plan=None,
+                 connection_class=None, connection_args=None,
+                 token_bucket=None, window=None):
 
         self.connection_class = connection_class
         self.connection_args = connection_args
+        # limits the queries to a target rate if given, see
+        # SharedTokenBucket
+        self.token_bucket = token_bucket
+        # counts and bounds the queries executing on this host, see
+        # SharedInFlightWindow
+        self.window = window
 
         BaseGenerator.__init__(self, queue_in=queue_in, queue_out=queue_out,
                            queue_target_size=queue_target_size,
-                           queue_notify_size=queue_notify_size,
-                           needs_more_input=needs_more_input,
-                           shutdown=shutdown, config=config)
+                           shutdown=shutdown, plan=plan)
 
     def after_init(self):
-        self.connection = self.connection_class(**self.connection_args)
+        self.connection = self.connection_class(window=self.window,
+                                                **self.connection_args)
+
+    def before_exit(self):
+        # let the queries still executing report their results
+        self.connection.wait_idle(timeout=10)
 
     def process_item(self):
         """ Generates queries with data from the input queue,
@@ -346,81 +542,157 @@ class QueryGenerator(BaseGenerator):
         """
 
         # get and unpack the item we want to process
-        workload_name, workload_data = self.queue_in.get()
+        workload, workload_data = self.queue_in.get()
 
         query_num = 0
-        queries = self.config['workloads'][workload_name]['queries']
+        statements = self.plan.statements[workload]
         for new, query_values in workload_data:
             # for each query, get the prepared statement and call the connection
             # object to bind and execute the query, which automatically puts
             # resulting execution times into the out_queue
-            prep_stmnt = queries[query_num]['prepared_statement']
+            prep_stmnt = statements[query_num]
+            # In open-loop mode, wait for the intended start of the query,
+            # which the LogGenerators measure the response time from.
+            if self.token_bucket is not None:
+                arrival = self.token_bucket.take(self.shutdown)
+                if arrival is None:
+                    # shutting down, the rest of the item is dropped
+                    return
+                intended = datetime.fromtimestamp(arrival)
+            else:
+                intended = None
             self.connection.execute(prep_stmnt, query_values, self.queue_out,
-                                    metadata=(workload_name, query_num, new))
+                                    metadata=(workload, query_num, new,
+                                              intended))
 
             query_num += 1
 
 
+class FusedGenerator(BaseGenerator):
+    """ Runs the stages of a WorkloadGenerator, a DataGenerator and a
+    QueryGenerator one after another in a single process, so the items
+    between them never leave the process and are never pickled. The key
+    state is shared with all other processes as usual, the executed queries
+    go to the LogGenerators through queue_out.
+
+    Each call of process_item() lets the workload stage produce batch_size
+    items and passes all of them through the other stages.
+
+    :param optional int batch_size: number of workloads per round, also the batch size of the data stage. default = 1
+    :param optional shard: the shard of the workload stage, see WorkloadGenerator
+    :param optional key_model: the key model of the workload stage, see WorkloadGenerator
+    :param optional token_bucket: the SharedTokenBucket of the query stage, see QueryGenerator. default = None
+    :param optional window: the SharedInFlightWindow of the query stage, see QueryGenerator. default = None
+    :param optional gate: the CheckpointGate of the workload stage, see WorkloadGenerator. default = None
+    """
+    def __init__(self, queue_out=None,
+                 queue_target_size=0, shutdown=None,
+                 plan=None, key_structs=None, generator_class=None,
+                 shard=0, key_model='bitmap', batch_size=1, pools=None,
+                 connection_class=None, connection_args=None,
+                 token_bucket=None, window=None, gate=None):
+
+        BaseGenerator.__init__(self, queue_out=queue_out,
+                           queue_target_size=queue_target_size,
+                           shutdown=shutdown, plan=plan)
+
+        self.batch_size = batch_size
+        self.shard = shard
+        # the queues between the stages, local to this process
+        self.next_workload = Queue()
+        self.workload_data = Queue()
+        # The stages are never started as processes of their own, only
+        # their process_item() is called.
+        self.workload_stage = WorkloadGenerator(
+            queue_out=self.next_workload, shutdown=shutdown, plan=plan,
+            key_structs=key_structs, generator_class=generator_class,
+            shard=shard, key_model=key_model, gate=gate)
+        self.data_stage = DataGenerator(
+            queue_in=self.next_workload, queue_out=self.workload_data,
+            shutdown=shutdown, plan=plan, generator_class=generator_class,
+            batch_size=batch_size, pools=pools)
+        self.query_stage = QueryGenerator(
+            queue_in=self.workload_data, queue_out=queue_out,
+            shutdown=shutdown, plan=plan, connection_class=connection_class,
+            connection_args=connection_args, token_bucket=token_bucket,
+            window=window)
+
+    def after_init(self):
+        self.workload_stage.after_init()
+        self.data_stage.after_init()
+        self.query_stage.after_init()
+
+    def before_exit(self):
+        self.query_stage.before_exit()
+
+    def process_item(self):
+        for _ in xrange(self.batch_size):
+            self.workload_stage.process_item()
+        # the data stage might take several items at once
+        while self.next_workload.qsize() > 0:
+            self.data_stage.process_item()
+        while self.workload_data.qsize() > 0:
+            self.query_stage.process_item()
+
+
 class LogGenerator(BaseGenerator):
     # TODO: DocString
     def __init__(self, queue_in=None, queue_out=None,
-                 queue_target_size=0, queue_notify_size=0,
-                 needs_more_input=None, shutdown=None,
-                 config=None,
-                 max_inserted=None, latencies=None,
-                 queue_max_time=None, needs_more_processes=None):
+                 queue_target_size=0, shutdown=None,
+                 plan=None,
+                 max_inserted=None, latencies=None):
 
         BaseGenerator.__init__(self, queue_in=queue_in, queue_out=queue_out,
                            queue_target_size=queue_target_size,
-                           queue_notify_size=queue_notify_size,
-                           needs_more_input=needs_more_input,
-                           shutdown=shutdown, config=config)
+                           shutdown=shutdown, plan=plan)
 
         self.max_inserted = max_inserted
-        # dict to log the execution times as datetime.timedelta
+        # dict to log the service times, from sending a query to its
+        # result, and the response times, from its intended start to its
+        # result, as a tuple of LatencySummaries per second. Without a
+        # target rate, queries start when they are sent, so both are the
+        # same.
         self.latencies = latencies
-        self.queue_max_time = queue_max_time
-        self.needs_more_processes = needs_more_processes
 
         self.now = int(time())
-        self.processed_latencies = []
+        self.service_times = LatencySummary()
+        self.response_times = LatencySummary()
 
     def process_item(self):
-        result, start, end, (workload_name, query_num, new) = self.queue_in.get()
-        now = time()
-        time_in_queue = (datetime.fromtimestamp(now) - end).total_seconds()
-
-        # check whether more LogGenerator processes are needed
-        if time_in_queue > self.queue_max_time or\
-                        self.queue_in.qsize() > self.queue_target_size:
-            self.needs_more_processes.set()
-            # print 'time in queue:', time_in_queue
-
-        now = int(now)
-        num_queries = len(self.processed_latencies)
+        result, start, end, (workload, query_num, new, intended) = self.queue_in.get()
+        now = int(time())
+        num_queries = self.service_times.count
         # check whether the next second is reached and if there is output data
         if (now > self.now) and num_queries > 0:
-            # put the results into the GeneratorCoordinator's
-            # synchronized objects and reset the variables
-            # TODO: check if synchronisation does work
-            with self.latencies.lock:
-                try:
-                    # print '%5i queries reported by %s' % (num_queries, self.name)
-                    latencies = self.latencies[self.now]
-                    latencies.extend(self.processed_latencies)
-                    self.latencies[self.now] = latencies
-                except KeyError:
-                    self.latencies[self.now] = self.processed_latencies
+            self.report()
             self.now = now
-            self.processed_latencies = []
 
         # do not log execution times of errors
         # TODO: test error case
         if result is None:
-                self.processed_latencies.append((end - start, workload_name, query_num))
+                service_time = (end - start).total_seconds() * 1000
+                self.service_times.add(service_time)
+                if intended is None:
+                    self.response_times.add(service_time)
+                else:
+                    self.response_times.add((end - intended).total_seconds() * 1000)
 
 
         # Report if errors occur when inserting new data.
         if new and (result is not None):
             msg = 'New item should have been inserted, but an error occured.'
-            raise Warning(msg)
\ No newline at end of file
+            raise Warning(msg)
+
+    def report(self):
+        """ Merges the latencies processed since the last report into the
+        summaries of the current second in the GeneratorCoordinator's
+        synchronized dict.
+        """
+        merge_into(self.latencies, self.now,
+                   (self.service_times, self.response_times))
+        self.service_times = LatencySummary()
+        self.response_times = LatencySummary()
+
+    def before_exit(self):
+        if self.service_times.count > 0:
+            self.report()
\ No newline at end of file
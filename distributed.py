@@ -0,0 +1,246 @@
+from ctypes import c_longlong
+from multiprocessing.connection import Client, Listener
+from multiprocessing.sharedctypes import RawArray
+from select import select
+from socket import error as socket_error
+from time import time, sleep
+from datetime import datetime
+
+from latencysummary import merge_into
+
+# number of bits of the seeds within the seed range of an agent, i.e. each
+# agent may use about 2.8e14 seeds
+seed_range_bits = 48
+# seconds the controller waits for the agents to say goodbye on shutdown
+goodbye_timeout = 30
+
+
+def parse_address(address):
+    """ Splits an address given as '<host>:<port>' in the config.
+
+    :rtype: tuple of string and int
+    """
+    host, _, port = str(address).rpartition(':')
+    return host, int(port)
+
+
+def read_settings(distributed):
+    """ Returns the address and authentication key from the 'distributed'
+    section of the config. As the hosts exchange pickles, which can
+    execute code when loaded, the key is required.
+    """
+    try:
+        authkey = str(distributed['authkey'])
+    except KeyError:
+        raise ValueError('A distributed run needs an authkey shared by the '
+                         'controller and the agents.')
+    return parse_address(distributed['address']), authkey
+
+
+class Controller(object):
+    """ The controller of a distributed run, with a GeneratorCoordinator
+    generating load on each of a number of agents, usually on other hosts.
+
+    The agents connect to the controller over TCP, see Agent. Each one gets
+    a number, which determines its range of seeds, see
+    SharedKeyBitmap.seed_base, and the ratios of the workloads and its
+    share of the target rate from the config of the controller, so the
+    workload mix and the load are set in one place. As
+    the seed ranges are disjoint, the agents never generate the same keys,
+    and as each agent only chooses the keys for reads, updates and
+    deletions from its own key state, every query targets a key some agent
+    has inserted, without exchanging any key state.
+
+    Every second the agents send the LatencySummaries of each second they
+    finished, which the controller merges into its own synchronized dict,
+    where watch_and_report finds them just like the ones of local
+    LogGenerators. The clocks of the hosts have to be synchronized, e.g.
+    by NTP. On shutdown, the controller tells the agents to shut down, too.
+
+    :param dict distributed: the 'distributed' section of the config
+    """
+    def __init__(self, distributed):
+        self.address, self.authkey = read_settings(distributed)
+        self.agents = int(distributed['agents'])
+        # connections to the agents by their number
+        self.connections = {}
+        # queries in flight on each agent, as last reported, shared with
+        # the process of watch_and_report
+        self.in_flight_counts = RawArray(c_longlong, self.agents)
+
+    def accept(self, ratios, target_rate=None):
+        """ Waits for all agents to connect and sends them their
+        assignments. Agents asking for a number, e.g. to resume from a
+        checkpoint of their key state, get it if it is free.
+
+        :param dict ratios: the ratios of the workloads by their name
+        :param optional dict target_rate: the 'target rate' section of the config, shared by the agents. default = None
+        """
+        listener = Listener(self.address, backlog=self.agents,
+                            authkey=self.authkey)
+        print 'waiting for %i agents at %s:%i' % ((self.agents,) + self.address)
+        try:
+            while len(self.connections) < self.agents:
+                connection = listener.accept()
+                message, wanted = connection.recv()
+                if message != 'join':
+                    connection.close()
+                    continue
+                free = [node for node in xrange(self.agents)
+                        if node not in self.connections]
+                node = wanted if wanted in free else free[0]
+                connection.send(('assignment', {'node': node,
+                                                'nodes': self.agents,
+                                                'seed base': node << seed_range_bits,
+                                                'ratios': ratios,
+                                                'target rate': target_rate}))
+                self.connections[node] = connection
+                print 'agent %i of %i joined from %s:%i' % (
+                    (node + 1, self.agents) + listener.last_accepted)
+        finally:
+            listener.close()
+
+    def collect(self, latencies, shutdown):
+        """ Merges the latency summaries sent by the agents into latencies
+        until the shutdown signal is set, then shuts the agents down. Sets
+        the shutdown signal itself if all agents left.
+
+        :param latencies: the synchronized dict of the GeneratorCoordinator
+        :param shutdown: the shutdown Event of the GeneratorCoordinator
+        """
+        while self.connections and not shutdown.is_set():
+            self.receive(latencies, 1)
+        if not self.connections:
+            print '%s all agents left, shutting down' % datetime.now().replace(microsecond=0)
+            shutdown.set()
+            return
+        for connection in self.connections.values():
+            try:
+                connection.send(('shutdown', None))
+            except (IOError, socket_error):
+                pass
+        # take the last summaries
+        deadline = time() + goodbye_timeout
+        while self.connections and time() < deadline:
+            self.receive(latencies, deadline - time())
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
+
+    def receive(self, latencies, timeout):
+        """ Handles the messages of the agents arriving within timeout
+        seconds.
+        """
+        nodes = dict((connection.fileno(), node)
+                     for node, connection in self.connections.items())
+        for fileno in select(nodes.keys(), [], [], timeout)[0]:
+            node = nodes[fileno]
+            connection = self.connections[node]
+            try:
+                message, content = connection.recv()
+            except (EOFError, IOError, socket_error):
+                message, content = 'goodbye', None
+            if message == 'latencies':
+                summaries, in_flight = content
+                for second, summary in summaries.iteritems():
+                    merge_into(latencies, second, summary)
+                self.in_flight_counts[node] = in_flight
+            elif message == 'goodbye':
+                print 'agent %i left' % (node + 1)
+                self.in_flight_counts[node] = 0
+                connection.close()
+                del self.connections[node]
+
+    def in_flight(self):
+        """ Returns the number of queries in flight on all agents.
+        """
+        return sum(self.in_flight_counts)
+
+
+class Agent(object):
+    """ An agent of a distributed run, see Controller. Connecting to the
+    controller waits until it is ready, which it is after creating the
+    schema, so the agent doesn't touch the schema itself.
+
+    :param dict distributed: the 'distributed' section of the config
+    """
+    def __init__(self, distributed):
+        address, authkey = read_settings(distributed)
+        waiting = False
+        while True:
+            try:
+                self.connection = Client(address, authkey=authkey)
+                break
+            except socket_error:
+                if not waiting:
+                    print 'waiting for the controller at %s:%i' % address
+                    waiting = True
+                sleep(1)
+        self.connection.send(('join', distributed.get('node')))
+        _, self.assignment = self.connection.recv()
+        print 'joined the controller at %s:%i as agent %i of %i' % (
+            address + (self.assignment['node'] + 1, self.assignment['nodes']))
+
+    def apply(self, config):
+        """ Sets the ratios of the workloads in the config to the ones of
+        the controller and the target rate to the share of this agent.
+
+        :param dict config: the parsed config, before the workloads are compiled
+        """
+        ratios = self.assignment['ratios']
+        if set(ratios) != set(config['workloads']):
+            raise ValueError('The workloads of the agent differ from the '
+                             'ones of the controller.')
+        for name, ratio in ratios.iteritems():
+            config['workloads'][name]['ratio'] = ratio
+        target_rate = self.assignment['target rate']
+        if target_rate is None:
+            config['config'].pop('target rate', None)
+        else:
+            target_rate = dict(target_rate)
+            target_rate['queries'] = float(target_rate['queries']) / self.assignment['nodes']
+            config['config']['target rate'] = target_rate
+
+    def report(self, latencies, shutdown, window):
+        """ Sends the latency summaries of the finished seconds and the
+        number of queries in flight to the controller shortly after every
+        second, removing the summaries from latencies, until the controller
+        or the shutdown signal tell to stop. Runs in a process of its own
+        instead of watch_and_report.
+
+        :param latencies: the synchronized dict of the GeneratorCoordinator
+        :param shutdown: the shutdown Event of the GeneratorCoordinator
+        :param window: the SharedInFlightWindow of the GeneratorCoordinator
+        """
+        connection = self.connection
+        try:
+            while not shutdown.is_set():
+                # wait until shortly after the next second, but handle
+                # messages of the controller right away
+                if connection.poll(max(0, int(time()) + 1.1 - time())):
+                    message, _ = connection.recv()
+                    if message == 'shutdown':
+                        print '%s the controller is shutting down' % datetime.now().replace(microsecond=0)
+                        shutdown.set()
+                    continue
+                self.send_latencies(latencies, int(time()), window)
+            # send all that is left
+            self.send_latencies(latencies, None, window)
+            connection.send(('goodbye', None))
+        except (EOFError, IOError, socket_error):
+            print '%s lost the controller, shutting down' % datetime.now().replace(microsecond=0)
+            shutdown.set()
+        finally:
+            connection.close()
+
+    def send_latencies(self, latencies, before, window):
+        """ Sends and removes the summaries of the seconds before the given
+        one, or of all seconds if it is None, along with the number of
+        queries in flight.
+        """
+        with latencies.lock:
+            seconds = [second for second in latencies.keys()
+                       if before is None or second < before]
+            summaries = dict((second, latencies.pop(second))
+                             for second in seconds)
+        self.connection.send(('latencies', (summaries, window.in_flight())))
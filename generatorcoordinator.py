@@ -1,48 +1,36 @@
-from multiprocessing import Event, Lock, Process
-from multiprocessing.managers import SyncManager, MakeProxyType
+from multiprocessing import Event, Process
+from multiprocessing.managers import SyncManager
+from sys import maxint
 from time import time, sleep
 from datetime import datetime
 
-from bitarray import bitarray
-from pyjudy import JudyLIntInt
-
-from datagenerator import DataGenerator, WorkloadGenerator, QueryGenerator, LogGenerator
+from autoscaler import Autoscaler
+from datagenerator import DataGenerator, WorkloadGenerator, QueryGenerator, LogGenerator, FusedGenerator
+from distributed import Controller
+from sharedmemory.checkpoint import KeyStateCheckpoint, checkpoint_periodically
+from sharedmemory.hashtable import SharedHashTable
+from sharedmemory.inflightwindow import SharedInFlightWindow
+from sharedmemory.keybitmap import SharedKeyBitmap
+from sharedmemory.keyspace import StatelessKeySpace
+from sharedmemory.ringbuffer import SharedRingBuffer
+from sharedmemory.tokenbucket import SharedTokenBucket
+from sharedmemory.valuepool import create_pools
 
 class GeneratorCoordinator(object):
-    # Create a proxys for non-standard types so all their methods can be used.
-    # First, define all methods that should not be exposed, than substract
-    # them from all methods offered by that type. Finally, make a proxy type
-    # with all wanted methods.
-    non_exposed = set(("__class__", "__copy__", "__deepcopy__", "__delattr__",
-                       "__dict__", "__doc__", "__format__", "__getattribute__",
-                       "__init__", "__module__", "__new__", "__repr__",
-                       "__setattr__", "__str__", "__subclasshook__"))
-
-    bitarray_methods = tuple(set(dir(bitarray)) - non_exposed)
-    bitarrayProxy = MakeProxyType('bitarrayProxy', bitarray_methods)
-
-    JudyLIntInt_methods = tuple(set(dir(JudyLIntInt)) - non_exposed)
-    JudyLIntIntProxy = MakeProxyType('JudyLIntIntProxy', JudyLIntInt_methods)
-
-
-    # register the types to use them as a managed object
-    SyncManager.register('bitarray', bitarray, bitarrayProxy)
-    SyncManager.register('JudyLIntInt', JudyLIntInt, JudyLIntIntProxy)
-
     manager = SyncManager()
     manager.start()
 
     def __init__(self, config, random_class, connection_class, connection_args={},
-                 queue_target_size=100, max_processes=4):
+                 queue_target_size=100, max_processes=8, agent=None):
         # TODO: complete docstring
         """ The GeneratorCoordinator spawns multiple processes for data
         and query generation. Generators communicate via queues,
         each generator shares a queue for input and/or output with
-        other generators ot the same type. In case the input queue gets to
-        small each generator can emit a signal to the coordinator, which
-        then (under certain conditions) spawns a new process filling that queue.
+        other generators ot the same type. The coordinator samples the
+        queues and lets an Autoscaler decide which stage gets another
+        process, see supervise().
         Workload generators are supposed to "report" the generation
-        of new data via adding information to the seed bitmap vector, new data
+        of new data via appending seeds to the shared key bitmap, new data
         items written to the database should increment the max_generated
         structure.
 
@@ -51,6 +39,7 @@ class GeneratorCoordinator(object):
         :param max_processes:
         :param random_class:
         :param connection_class:
+        :param agent: the Agent if this is an agent of a distributed run, see distributed.py
         :return:
         """
         # TODO: correct docstring
@@ -61,40 +50,194 @@ class GeneratorCoordinator(object):
         # integrated locking mechanism. Maximum is (2^64)-1.
         # Because of the separation of data generation and querying
         # two dicts are needed to handle both processes separately.
+
+        # the config overrides the maximum number of generator processes
+        try:
+            max_processes = config['config']['max processes']
+        except KeyError:
+            pass
+
+        # If key sharding is enabled, every WorkloadGenerator gets a shard of
+        # seeds of its own, so inserts need no lock at all. As there can't be
+        # more WorkloadGenerators than processes, max_processes shards are
+        # enough. Otherwise all WorkloadGenerators share a single shard.
+        try:
+            key_sharding = config['config']['key sharding']
+        except KeyError:
+            key_sharding = False
+        self.key_sharding = key_sharding
+        if key_sharding:
+            shards = max_processes
+        else:
+            shards = 1
+        # shards not assigned to any WorkloadGenerator yet
+        self.free_shards = range(shards)
+
+        # The key model decides how the WorkloadGenerators find the keys of
+        # existing items: 'bitmap' keeps state for every seed, 'stateless'
+        # computes the partition seed from the cluster seed.
+        try:
+            self.key_model = config['config']['key model']
+        except KeyError:
+            self.key_model = 'bitmap'
+        if self.key_model not in ('bitmap', 'stateless'):
+            raise ValueError('unknown key model %s' % self.key_model)
+        # Compressing the key bitmaps cuts their memory by a factor of about
+        # six, see SharedKeyBitmap, at the cost of slower lookups.
+        try:
+            compressed = config['config']['compressed key state']
+        except KeyError:
+            compressed = False
+        # The key state can be saved to a checkpoint periodically and be
+        # restored from it on the next start, continuing with the data
+        # already in the database.
+        try:
+            key_state = config['config']['key state']
+        except KeyError:
+            key_state = {}
+
+        # DataGenerators can generate the values of many items at once, see
+        # DataGenerator.process_batch.
+        try:
+            self.data_batch_size = config['config']['data batch size']
+        except KeyError:
+            self.data_batch_size = 1
+
+        # The pipeline is either split into a process per stage, which
+        # the coordinator adds to where the queues run dry, or fused into
+        # identical workers running the workload, data and query stages
+        # each, see FusedGenerator.
+        try:
+            self.pipeline = config['config']['pipeline']
+        except KeyError:
+            self.pipeline = 'split'
+        if self.pipeline not in ('split', 'fused'):
+            raise ValueError('unknown pipeline %s' % self.pipeline)
+        try:
+            self.fused_workers = config['config']['fused workers']
+        except KeyError:
+            # leave a process for the LogGenerator
+            self.fused_workers = max(1, max_processes - 1)
+        if key_sharding and self.pipeline == 'fused':
+            shards = max(shards, self.fused_workers)
+            self.free_shards = range(shards)
+
+        self.config = config
+        # the generators only get the compiled workloads
+        self.plan = config['plan']
+
+        # In a distributed run, the controller only collects the latencies
+        # of the agents, which generate the load, each with seeds from the
+        # range it got from the controller, see distributed.py.
+        try:
+            distributed = config['config']['distributed']
+        except KeyError:
+            distributed = {}
+        self.controller = None
+        if distributed.get('role') == 'controller':
+            self.controller = Controller(distributed)
+        self.agent = agent
+        if agent is not None:
+            seed_base = agent.assignment['seed base']
+        else:
+            seed_base = 0
+
         self.key_structs = {}
         for table in config['tables'].keys():
             self.key_structs[table] = {}
 
-            bitmap = self.manager.bitarray()
-            bitmap.lock = Lock()
-            self.key_structs[table]['bitmap'] = bitmap
+            if self.key_model == 'stateless':
+                self.key_structs[table]['keyspace'] = StatelessKeySpace(
+                    fanout=self.fanout(table), shards=shards,
+                    exclusive=key_sharding, seed_base=seed_base)
+                continue
 
-            update_dict = self.manager.JudyLIntInt()
-            update_dict.lock = Lock()
-            self.key_structs[table]['update_dict'] = update_dict
-            # TODO: import old data: import key bitmap or regenerate?
+            # the key bitmap lives in shared memory and brings its own locks
+            self.key_structs[table]['bitmap'] = SharedKeyBitmap(
+                shards=shards, exclusive=key_sharding,
+                compressed=compressed, seed_base=seed_base)
+
+            # maps updated seeds to the seed of their last update
+            self.key_structs[table]['update_dict'] = SharedHashTable()
+
+        self.checkpoint = None
+        # the gate the changes of the key state pass, see CheckpointGate
+        self.gate = None
+        if 'directory' in key_state:
+            self.checkpoint = KeyStateCheckpoint(key_state['directory'])
+            self.gate = self.checkpoint.gate
+            try:
+                self.checkpoint_interval = key_state['checkpoint interval']
+            except KeyError:
+                self.checkpoint_interval = 60
+            try:
+                resume = key_state['resume']
+            except KeyError:
+                resume = False
+            if resume:
+                if self.checkpoint.restore(self.key_structs):
+                    print 'resuming from the key state in %s' % key_state['directory']
+                else:
+                    print 'no key state found in %s, starting from scratch' % key_state['directory']
 
         # target sizes of queues
         self.queue_target_size = queue_target_size
-        # size at which the coordinator should be notified if queue
-        # has less items than this.
-        self.queue_notify_size = .5 * self.queue_target_size
 
-        # All the queues needed for inter process communication
-        self.queues = {'next_workload': self.manager.Queue(),
-                       'workload_data': self.manager.Queue(),
-                       'executed_queries': self.manager.Queue()}
-
-        # Events for the coordinator to check if new processes have to be
-        # created. Each class of generators gets it own Event.
-        self.events = {'DataGenerators': Event(), 'QueryGenerators': Event(),
-                       'LogGenerators': Event(), 'LogGenerators2': Event(),
-                       'shutdown': Event()}
-
-        # Event to tell all child processes to shut down
-
-        # convenience event to wait for all events simultaneously
-        self.supervision_needed = OrEvent(*self.events.values())
+        # All the queues needed for inter process communication. They are
+        # ring buffers in shared memory, so the items don't pass through
+        # the manager process.
+        try:
+            queue_capacity = config['config']['queue capacity']
+        except KeyError:
+            queue_capacity = 1 << 24
+        self.queues = {'next_workload': SharedRingBuffer(queue_capacity),
+                       'workload_data': SharedRingBuffer(queue_capacity),
+                       'executed_queries': SharedRingBuffer(queue_capacity)}
+
+        # the stages of the pipeline with their input and output queues
+        if self.pipeline == 'fused':
+            stages = [('Fused', None, self.queues['executed_queries'])]
+        else:
+            stages = [('Workload', None, self.queues['next_workload']),
+                      ('Data', self.queues['next_workload'],
+                       self.queues['workload_data']),
+                      ('Query', self.queues['workload_data'],
+                       self.queues['executed_queries'])]
+        stages.append(('Log', self.queues['executed_queries'], None))
+
+        # With a target rate, the load is open-loop: the QueryGenerators
+        # send the queries at that rate, no matter how fast the database
+        # answers, see SharedTokenBucket.
+        try:
+            target_rate = config['config']['target rate']
+        except KeyError:
+            target_rate = None
+        self.token_bucket = None
+        if target_rate is not None:
+            self.token_bucket = SharedTokenBucket(
+                target_rate['queries'],
+                target_rate.get('arrivals', 'constant'))
+            target_rate = target_rate['queries']
+        # The queries executing at once on this host are counted and,
+        # given a maximum, bounded, see SharedInFlightWindow.
+        try:
+            max_in_flight = config['config']['max in flight']
+        except KeyError:
+            max_in_flight = None
+        self.window = SharedInFlightWindow(max_in_flight)
+        # The fused workers are started once, one per shard with key
+        # sharding, so only the LogGenerators are scaled in fused mode.
+        self.autoscaler = Autoscaler(stages, self.queues['executed_queries'],
+                                     queue_target_size,
+                                     target_rate=target_rate,
+                                     in_flight=self.window,
+                                     fixed=('Fused',))
+
+        # Event telling all processes to shut down
+        self.events = {'shutdown': Event()}
+
+        # Event telling the checkpoint process that all generators ended
+        self.generators_stopped = Event()
 
         # Log data of execution times
         self.latencies = self.manager.dict()
@@ -102,29 +245,81 @@ class GeneratorCoordinator(object):
 
         # list of all running processes
         self.processes = []
-        # maximum number of processes
+        # retired generators that didn't end yet
+        self.retiring = []
+        # maximum number of generator processes
         self.max_processes = max_processes
 
         self.random_class = random_class
+        # pre-generated values of the attributes asking for a pool, created
+        # here to share them with all DataGenerators
+        self.pools = create_pools(self.plan, random_class)
         self.connection_class = connection_class
         self.connection_args = connection_args
         # TODO: share one connection with all processes if possible (see http://www.datastax.com/dev/blog/4-simple-rules-when-using-the-datastax-drivers-for-cassandra for details why)
         self.connection = connection_class(**connection_args)
 
-        self.config = config
+    def fanout(self, table):
+        """ Computes the number of seeds per partition of a table for the
+        stateless key model from the chance of the insert queries into that
+        table to create a new partition.
+
+        :param string table: the combined keyspace and table name
+        :return: number of seeds per partition
+        :rtype: int
+        """
+        chances = set()
+        for workload in self.config['workloads'].values():
+            for query in workload['queries']:
+                if query['type'] == 'insert' and query['table'] == table:
+                    chances.add(query['chance'])
+        if len(chances) > 1:
+            msg = 'The stateless key model needs the same chance for all ' \
+                  'insert queries into a table, found %s for table %s.'
+            raise ValueError(msg % (sorted(chances), table))
+        if len(chances) == 0:
+            return 1
+        chance = chances.pop()
+        if chance <= 0:
+            # all items share one partition
+            return maxint
+        return max(1, int(round(1. / chance)))
 
     def start(self):
-        wl_generator = self.create_generator('Workload')
-        data_generator = self.create_generator('Data')
-        query_generator = self.create_generator('Query')
+        if self.controller is not None:
+            self.control()
+            return
+        if self.pipeline == 'fused':
+            self.processes = [self.create_generator('Fused')
+                              for _ in xrange(self.fused_workers)]
+        else:
+            self.processes = [self.create_generator('Workload'),
+                              self.create_generator('Data'),
+                              self.create_generator('Query')]
         logger = self.create_generator('Log')
-        watcher = Process(target=watch_and_report,
-                          args=(self.config, self.latencies, self.events))
-        self.processes = [wl_generator, data_generator,
-                          query_generator, logger,
-                          watcher]
+        if self.agent is not None:
+            # the controller watches the latencies of all agents
+            watcher = Process(target=self.agent.report,
+                              args=(self.latencies, self.events['shutdown'],
+                                    self.window))
+        else:
+            # The watcher sets the shutdown signal supervise() waits on.
+            watcher = Process(target=watch_and_report,
+                              args=(self.config, self.latencies, self.events),
+                              kwargs={'window': self.window})
+        self.processes += [logger, watcher]
         for process in self.processes:
             process.start()
+        # The checkpoint process is kept apart from the generators, as it
+        # has to end after them.
+        if self.checkpoint is not None:
+            self.checkpointer = Process(target=checkpoint_periodically,
+                                        args=(self.checkpoint,
+                                              self.key_structs,
+                                              self.checkpoint_interval,
+                                              self.events['shutdown'],
+                                              self.generators_stopped))
+            self.checkpointer.start()
 
         # wait for some time for the queues to fill before starting
         # to supervise, but don't ignore the shutdown signal
@@ -132,59 +327,106 @@ class GeneratorCoordinator(object):
 
         self.supervise()
 
+    def control(self):
+        """ Runs the controller of a distributed run: hands out the seed
+        ranges and the workload mix to the agents, then merges their
+        latencies for watch_and_report until the shutdown signal is set.
+        """
+        ratios = dict(zip(self.plan.names, self.plan.ratios))
+        try:
+            target_rate = self.config['config']['target rate']
+        except KeyError:
+            target_rate = None
+        self.controller.accept(ratios, target_rate)
+        watcher = Process(target=watch_and_report,
+                          args=(self.config, self.latencies, self.events),
+                          kwargs={'window': self.controller})
+        watcher.start()
+        self.controller.collect(self.latencies, self.events['shutdown'])
+        watcher.join()
+
     def create_generator(self, generator_type):
         print 'creating new %sGenerator' % generator_type
         if generator_type == 'Workload':
+            # Take the first free shard if each WorkloadGenerator owns its
+            # shard, otherwise all of them share the only one.
+            if self.key_sharding:
+                shard = self.free_shards.pop(0)
+            else:
+                shard = 0
             return WorkloadGenerator(queue_out=self.queues['next_workload'],
                                      shutdown=self.events['shutdown'],
                                      queue_target_size=self.queue_target_size,
-                                     queue_notify_size=self.queue_notify_size,
-                                     config=self.config,
+                                         plan=self.plan,
                                      key_structs=self.key_structs,
-                                     generator_class=self.random_class)
+                                     generator_class=self.random_class,
+                                     shard=shard,
+                                     key_model=self.key_model,
+                                     gate=self.gate)
+        if generator_type == 'Fused':
+            # fused workers own a shard like WorkloadGenerators do
+            if self.key_sharding:
+                shard = self.free_shards.pop(0)
+            else:
+                shard = 0
+            return FusedGenerator(queue_out=self.queues['executed_queries'],
+                                  shutdown=self.events['shutdown'],
+                                  queue_target_size=self.queue_target_size,
+                                   plan=self.plan,
+                                  key_structs=self.key_structs,
+                                  generator_class=self.random_class,
+                                  shard=shard,
+                                  key_model=self.key_model,
+                                  batch_size=self.data_batch_size,
+                                  pools=self.pools,
+                                  connection_class=self.connection_class,
+                                  connection_args=self.connection_args,
+                                  token_bucket=self.token_bucket,
+                                  window=self.window,
+                                  gate=self.gate)
         if generator_type == 'Data':
             return DataGenerator(queue_in=self.queues['next_workload'],
                                  queue_out=self.queues['workload_data'],
-                                 needs_more_input=self.events['DataGenerators'],
                                  shutdown=self.events['shutdown'],
                                  queue_target_size=self.queue_target_size,
-                                 queue_notify_size=self.queue_notify_size,
-                                 config=self.config,
-                                 generator_class=self.random_class)
+                                 plan=self.plan,
+                                 generator_class=self.random_class,
+                                 batch_size=self.data_batch_size,
+                                 pools=self.pools)
         if generator_type == 'Query':
             return QueryGenerator(queue_in=self.queues['workload_data'],
                                   queue_out=self.queues['executed_queries'],
-                                  needs_more_input=self.events['QueryGenerators'],
                                   shutdown=self.events['shutdown'],
                                   queue_target_size=self.queue_target_size,
-                                  queue_notify_size=self.queue_notify_size,
-                                  config=self.config,
+                                   plan=self.plan,
                                   connection_class=self.connection_class,
-                                  connection_args=self.connection_args)
+                                  connection_args=self.connection_args,
+                                  token_bucket=self.token_bucket,
+                                  window=self.window)
         if generator_type == 'Log':
             return LogGenerator(queue_in=self.queues['executed_queries'],
-                                needs_more_input=self.events['LogGenerators'],
                                 shutdown=self.events['shutdown'],
                                 queue_target_size=self.queue_target_size,
-                                queue_notify_size=self.queue_notify_size,
-                                config=self.config,
-                                # time an item is allowed to be queued
-                                # TODO: set this to value of connection/query timeout
-                                queue_max_time=10,
-                                latencies=self.latencies,
-                                needs_more_processes=self.events['LogGenerators2'])
+                                plan=self.plan,
+                                latencies=self.latencies)
 
     def supervise(self):
+        """ Samples the queues every second and lets the autoscaler decide
+        which stage gets another process or gives one back, until the
+        shutdown signal is set.
+        """
         events = self.events
         queues = self.queues
-        notify_size = self.queue_notify_size
-        target_size = self.queue_target_size
         while True:
-            # wait until something has do be done
-            self.supervision_needed.wait()
+            # wait for a second, but wake up if receiving the shutdown
+            # signal
+            events['shutdown'].wait(1)
 
             # if it was decided it is time to shut down - do so!
             if events['shutdown'].is_set():
+                # wake the generators waiting for space or items
+                for queue in queues.values():
+                    queue.close()
                 # wait for all child processes to end before leaving the
                 # while-loop
                 while len(self.processes) > 0:
@@ -192,53 +434,83 @@ class GeneratorCoordinator(object):
                     proc.join(.1)
                     if proc.is_alive():
                         self.processes.append(proc)
+                # now the key state can't change anymore, so save it a
+                # last time
+                self.generators_stopped.set()
+                if self.checkpoint is not None:
+                    self.checkpointer.join()
                 break
 
-            new_processes = []
-
-            if len(self.processes) >= self.max_processes:
+            self.reap_retired()
+            self.autoscaler.sample(time())
+            processes = {}
+            for proc in self.processes:
+                stage = self.stage(proc)
+                if stage is not None and proc not in self.retiring:
+                    processes[stage] = processes.get(stage, 0) + 1
+            # the watcher doesn't count
+            room = sum(processes.values()) + len(self.retiring) < self.max_processes
+            decision = self.autoscaler.decide(processes, room)
+            if decision is None:
                 continue
-
-            # check which queue needs more input and create the
-            # corresponding generator if needed
-            # TODO: Signal raising only considers the preceding generator class.
-            # This generator class might also not have enough input data, so it
-            # might be senseless to create a new process for that class.
-            if events['DataGenerators'].is_set() and \
-                        queues['next_workload'].qsize() < notify_size:
-                new_processes.append(self.create_generator('Workload'))
-            if events['QueryGenerators'].is_set() and \
-                        queues['workload_data'].qsize() < notify_size:
-                new_processes.append(self.create_generator('Data'))
-            if events['LogGenerators'] and \
-                        queues['executed_queries'].qsize() < notify_size:
-                new_processes.append(self.create_generator('Query'))
-
-            # check if more LogGenerators are needed
-            if events['LogGenerators2'] or \
-                        queues['executed_queries'].qsize() > target_size:
-                new_processes.append(self.create_generator('Log'))
-
-            # start all newly generated processes
-            for proc in new_processes:
-                if len(self.processes) >= self.max_processes:
-                    print 'Maximum number of processes reached.'
-                    break
+            action, stage = decision
+            if action == 'add':
+                proc = self.create_generator(stage)
                 self.processes.append(proc)
                 proc.start()
+            else:
+                self.retire_generator(stage)
 
-            # reset all signals
-            for event in events.values():
-                event.clear()
-
-            # now wait for a second, but wake up if receiving the
-            # shutdown signal
-            events['shutdown'].wait(1)
-        # TODO: what needs to be done before shutting down?
+    @staticmethod
+    def stage(proc):
+        """ Returns the name of the stage of a generator, as used by
+        create_generator(), or None for other processes.
+        """
+        for stage, generator_class in (('Workload', WorkloadGenerator),
+                                       ('Data', DataGenerator),
+                                       ('Query', QueryGenerator),
+                                       ('Log', LogGenerator),
+                                       ('Fused', FusedGenerator)):
+            if isinstance(proc, generator_class):
+                return stage
+        return None
+
+    def retire_generator(self, stage):
+        """ Tells the youngest generator of a stage to end after its current
+        item. Its queues are interrupted, so it notices even while waiting
+        for input or for space.
+
+        :param string stage: name of the stage, see create_generator()
+        """
+        for proc in reversed(self.processes):
+            if self.stage(proc) == stage and proc not in self.retiring:
+                proc.retire.set()
+                self.retiring.append(proc)
+                for queue in (proc.queue_in, proc.queue_out):
+                    if queue is not None:
+                        queue.interrupt()
+                return
+
+    def reap_retired(self):
+        """ Removes the retired generators that ended, giving their shards
+        back.
+        """
+        for proc in self.retiring[:]:
+            if proc.is_alive():
+                continue
+            proc.join()
+            self.retiring.remove(proc)
+            self.processes.remove(proc)
+            if self.key_sharding and \
+                    isinstance(proc, (WorkloadGenerator, FusedGenerator)):
+                self.free_shards.insert(0, proc.shard)
+            print 'retired %s' % proc.name
 
 
-def watch_and_report(config, logs, events):
+def watch_and_report(config, logs, events, window=None):
     # TODO: docstring
+    # window is anything with an in_flight() method counting the queries
+    # executing, a SharedInFlightWindow or the Controller of the agents
     # TODO: check for arbitrary termination conditions?
     term_conds = config['config']['termination conditions']
     max_latency = term_conds['latency']['max']
@@ -248,14 +520,23 @@ def watch_and_report(config, logs, events):
     except KeyError:
         max_queries = None
     consec_queries = term_conds['queries']['consecutive']
+    # With a target rate, the response times include the time the queries
+    # were late, see SharedTokenBucket, and are reported besides the
+    # service times. The latency condition applies to the response times,
+    # which are the service times otherwise.
+    open_loop = 'target rate' in config['config']
     succ_latencies = 0
     succ_queries = 0
     last_num_queries = 0
     queries_sum = 0
     latency_sum_o = 0
+    response_sum_o = 0
     tests=0
 
     while True:
+        # end with the others if another process decided to shut down
+        if events['shutdown'].is_set():
+            break
         last_second = int(time())-1
         timepoint = datetime.fromtimestamp(last_second)
         try:
@@ -263,16 +544,14 @@ def watch_and_report(config, logs, events):
             # print only values of the last second, as the older ones
             # don't change anymore
             tests += 1
-            latencies = logs[last_second]
-            queries = len(latencies)
+            service_times, response_times = logs[last_second]
+            queries = service_times.count
             queries_sum += queries
-            latency_sum = 0
+            latency_sum_o += service_times.total
+            response_sum_o += response_times.total
 
-            for latency, _, _ in latencies:
-                latency_sum += latency.total_seconds()*1000
-            latency_sum_o += latency_sum
-
-            latency = latency_sum/queries
+            latency = service_times.mean()
+            response_time = response_times.mean()
 
         except KeyError:
             print timepoint, 'No data'
@@ -281,11 +560,19 @@ def watch_and_report(config, logs, events):
             continue
         msg = '%s     queries/sec: %10i     avg latency (last secons): %10.2f ms     ' \
               'queries/sec avg: %10i     latency avg (runtime): %10.2f ms'
-        print msg % (timepoint, queries, latency, queries_sum/tests, latency_sum_o/queries_sum)
+        msg = msg % (timepoint, queries, latency, queries_sum/tests, latency_sum_o/queries_sum)
+        if window is not None:
+            msg += '     in flight: %6i' % window.in_flight()
+        print msg
+        if open_loop:
+            msg = '%s     response time (last second): avg %10.2f ms, 99th percentile %10.2f ms     ' \
+                  'response time avg (runtime): %10.2f ms'
+            print msg % (timepoint, response_time, response_times.percentile(99),
+                         response_sum_o/queries_sum)
 
         # if the latency exceeds the defined threshold, increment the value
         # of successive latencies over the threshold
-        if latency > max_latency:
+        if response_time > max_latency:
             succ_latencies += 1
         else:
             # reset the counter if the latency was below the threshold
@@ -326,37 +613,3 @@ def watch_and_report(config, logs, events):
 
         # sleep until the next second
         sleep(max(last_second+2.25-time(),0))
-
-
-# helper functions to provide waiting for multiple events simultaneously,
-# found at https://stackoverflow.com/a/12320352/1065901
-def or_set(self):
-    self._set()
-    self.changed()
-
-
-def or_clear(self):
-    self._clear()
-    self.changed()
-
-
-def orify(e, changed_callback):
-    e._set = e.set
-    e._clear = e.clear
-    e.changed = changed_callback
-    e.set = lambda: or_set(e)
-    e.clear = lambda: or_clear(e)
-
-
-def OrEvent(*events):
-    or_event = Event()
-    def changed():
-        bools = [e.is_set() for e in events]
-        if any(bools):
-            or_event.set()
-        else:
-            or_event.clear()
-    for e in events:
-        orify(e, changed)
-    changed()
-    return or_event
\ No newline at end of file
@@ -0,0 +1,100 @@
+from math import ceil, log
+
+# upper bound of each bucket of the histogram relative to the one before,
+# i.e. latencies are kept with a relative error of at most one percent
+bucket_base = 1.01
+log_base = log(bucket_base)
+# upper bound of the lowest bucket in ms, lower latencies are counted there
+min_latency = .001
+
+
+class LatencySummary(object):
+    """ Summary of the latencies of the queries executed within some time:
+    their number, sum and maximum and a histogram with logarithmic
+    buckets. Summaries of the same time from different processes or hosts
+    are combined by merge(), which yields the same summary as adding all
+    their latencies to a single one. A pickled summary takes a few
+    kilobytes at most, no matter how many queries it covers, so summaries
+    can be sent over the network every second.
+
+    Percentiles are taken from the histogram, so they are up to one percent
+    above the exact ones.
+    """
+    def __init__(self):
+        self.count = 0
+        # sum and maximum of the latencies in ms
+        self.total = 0.
+        self.maximum = 0.
+        # number of latencies by the number of their bucket
+        self.buckets = {}
+
+    def add(self, latency):
+        """ Adds a latency.
+
+        :param float latency: the latency in ms
+        """
+        self.count += 1
+        self.total += latency
+        if latency > self.maximum:
+            self.maximum = latency
+        if latency <= min_latency:
+            bucket = 0
+        else:
+            bucket = int(ceil(log(latency / min_latency) / log_base))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        """ Adds the latencies of another summary to this one.
+
+        :param LatencySummary other: the summary to add
+        """
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        buckets = self.buckets
+        for bucket, count in other.buckets.iteritems():
+            buckets[bucket] = buckets.get(bucket, 0) + count
+
+    def mean(self):
+        """ Returns the mean latency in ms, or 0 if there is none.
+        """
+        if self.count == 0:
+            return 0.
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """ Returns the latency in ms that the given percentage of the
+        latencies doesn't exceed, or 0 if there is none.
+
+        :param float percent: the percentage, between 0 and 100
+        """
+        rank = percent / 100. * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.maximum, min_latency * bucket_base ** bucket)
+        return self.maximum
+
+    def __repr__(self):
+        return 'LatencySummary(count=%i, mean=%.3f ms, max=%.3f ms)' % (
+            self.count, self.mean(), self.maximum)
+
+
+def merge_into(latencies, second, summaries):
+    """ Merges the summaries of a second into a synchronized dict holding a
+    (service time, response time) tuple of LatencySummaries per second,
+    like the one of the GeneratorCoordinator.
+
+    :param latencies: the synchronized dict, with a lock as its attribute
+    :param int second: the second in seconds since the epoch
+    :param tuple summaries: the service time and response time LatencySummary
+    """
+    with latencies.lock:
+        try:
+            merged = latencies[second]
+            for summary, other in zip(merged, summaries):
+                summary.merge(other)
+        except KeyError:
+            merged = summaries
+        latencies[second] = merged
@@ -1,6 +1,8 @@
 from preparation.preparationinterface import PreparationInterface
 from randomdata.cassandratypes import CassandraTypes
+from randomdata.counterrandom import CounterCassandraTypes
 from connection.cassandraconnection import CassandraConnection
+from workloadplan import WorkloadPlan
 
 
 class CassandraPreparation(PreparationInterface):
@@ -8,7 +10,16 @@ class CassandraPreparation(PreparationInterface):
     def __init__(self, config=None):
 
         self.connection_class = CassandraConnection
-        self.randomdata_class = CassandraTypes
+        # The counter-based generator makes reseeding, which is done for
+        # every generated value, nearly free, but generates other values.
+        try:
+            counter_based = config['config']['counter-based random']
+        except KeyError:
+            counter_based = False
+        if counter_based:
+            self.randomdata_class = CounterCassandraTypes
+        else:
+            self.randomdata_class = CassandraTypes
 
         self.schemata = {}
         # string used to join arguments if needed,
@@ -88,6 +99,9 @@ class CassandraPreparation(PreparationInterface):
 
                 query['attributes'] = attributes
 
+        # compile the workloads for the generators
+        self.config['plan'] = WorkloadPlan(self.config['workloads'])
+
     def delete_old_schema(self):
         drop_msg =  'dropping keyspace %s'
         statement = 'DROP KEYSPACE IF EXISTS %s'
@@ -111,9 +125,24 @@ class CassandraPreparation(PreparationInterface):
         for table_name, table_data in ks_data['tables'].items():
             print 'creating table %s with definition "%s"' % (table_name, table_data['definition'])
             self.create_table(table_data)
-            # combine the keyspace and table name to get unique table names
-            combined_name = self.join_string.join([ks_name, table_name])
-            self.config['tables'][combined_name] = table_data
+            self.register_table(ks_name, table_name, table_data)
+
+    def load_schema(self):
+        self.config['tables'] = {}
+        for ks_name, ks_data in self.config['schemata'].items():
+            for table_name, table_data in ks_data['tables'].items():
+                self.register_table(ks_name, table_name, table_data)
+
+    def register_table(self, ks_name, table_name, table_data):
+        """ Adds a table to self.config['tables'].
+
+        :param string ks_name: name of the keyspace of the table
+        :param string table_name: name of the table
+        :param dict table_data: self.config['schemata'][keyspace_name]['tables'][tablename] where the table is defined
+        """
+        # combine the keyspace and table name to get unique table names
+        combined_name = self.join_string.join([ks_name, table_name])
+        self.config['tables'][combined_name] = table_data
 
     def create_table(self, table_data):
         """ Creates the table defined in table_data, which is a part of
@@ -141,4 +170,5 @@ workloads:
 			       generator args: <dict of args for generator>	# can it be empty?
 			      ]
 		  ]
+plan: <WorkloadPlan>        # the workloads compiled for the generators
 """
\ No newline at end of file
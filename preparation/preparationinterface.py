@@ -1,8 +1,10 @@
 from yaml import dump
 
+from distributed import Agent
 from generatorcoordinator import GeneratorCoordinator
 from connection.connectioninterface import ConnectionInterface
 from randomdata.pythontypes import PythonTypes
+from sharedmemory.checkpoint import KeyStateCheckpoint
 
 class PreparationInterface(object):
     """ Interface to load and process Config objects. Loads and parses
@@ -24,16 +26,43 @@ class PreparationInterface(object):
 
         self.connection = self.connection_class(**self.connection_args)
 
-        # TODO: add option to choose if database should be reinitialized, discarding all present data
-        self.delete_old_schema()
-        self.initialize_schema()
+        # An agent of a distributed run joins the controller first, which
+        # creates the schema and hands out the workload mix, see
+        # distributed.py.
+        try:
+            distributed = config['config']['distributed']
+        except KeyError:
+            distributed = {}
+        self.agent = None
+        if distributed.get('role') == 'agent':
+            self.agent = Agent(distributed)
+            self.agent.apply(self.config)
+
+        # When resuming from a checkpoint of the key state, the data in the
+        # database has to be kept, as it matches the checkpoint. If there
+        # is no checkpoint yet, the run starts from scratch. Agents keep
+        # the schema created by the controller.
+        try:
+            key_state = config['config']['key state']
+            resume = key_state['resume']
+        except KeyError:
+            resume = False
+        if resume:
+            checkpoint = KeyStateCheckpoint(key_state['directory'])
+            resume = checkpoint.read_manifest() is not None
+        if resume or self.agent is not None:
+            self.load_schema()
+        else:
+            self.delete_old_schema()
+            self.initialize_schema()
 
         self.process_config()
 
         gc = GeneratorCoordinator(self.config,
                                   self.randomdata_class,
                                   self.connection_class,
-                                  self.connection_args)
+                                  self.connection_args,
+                                  agent=self.agent)
         gc.start()
 
     def delete_old_schema(self):
@@ -49,6 +78,13 @@ class PreparationInterface(object):
         '''
         raise NotImplementedError
 
+    def load_schema(self):
+        ''' Register everything defined in the schemata part of the config as
+        initialize_schema() does, but without changing the database. Used
+        when resuming from a checkpoint of the key state.
+        '''
+        raise NotImplementedError
+
     def process_config(self):
         """ Method called on initialization to process the parsed YAML file
         further. This method should check for validity of the config statements
@@ -0,0 +1,53 @@
+class AliasTable(object):
+    """ Walker's alias table for choosing one of a fixed set of values with
+    given weights in constant time, using a single random number per choice.
+
+    The n values are spread over n equally likely columns. Column i holds
+    value i with probability probabilities[i] and the value aliases[i]
+    otherwise, so a choice needs one random column and one comparison.
+    The table is built in O(n) with Vose's method.
+
+    :param list values: the values to choose from
+    :param list weights: non-negative weight of each value, not all zero
+    """
+    def __init__(self, values, weights):
+        if len(values) != len(weights) or len(values) == 0:
+            raise ValueError('Needs the same positive number of values and weights.')
+        total = float(sum(weights))
+        if total <= 0 or min(weights) < 0:
+            raise ValueError('The weights must be non-negative and not all zero.')
+        size = len(values)
+        self.values = list(values)
+        self.size = size
+
+        # scale the weights so the average column is filled exactly
+        scaled = [weight * size / total for weight in weights]
+        self.probabilities = [1.] * size
+        self.aliases = range(size)
+        small = [i for i, weight in enumerate(scaled) if weight < 1]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            # fill the column of less with the surplus of more
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left is full up to rounding errors, so the
+        # probabilities of 1 set above stay.
+
+    def choice(self, uniform):
+        """ Maps a random number to one of the values.
+
+        :param float uniform: random number in [0,1)
+        :return: the chosen value
+        """
+        position = uniform * self.size
+        column = int(position)
+        if position - column < self.probabilities[column]:
+            return self.values[column]
+        return self.values[self.aliases[column]]
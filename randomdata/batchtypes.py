@@ -0,0 +1,244 @@
+from datetime import datetime
+from decimal import Decimal
+from time import mktime
+from uuid import UUID
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# whether batches can be generated at all
+batch_available = numpy is not None
+
+from counterrandom import CounterPythonTypes, golden, mask64, maxwidth, recip_bpf
+from pythontypes import compressible, printable_deletions, printable_table, unique_size
+from sizedistribution import SizeDistribution
+
+# The functions of this module generate the values of many seeds at once
+# with NumPy. They reproduce the values of the scalar methods of
+# CounterPythonTypes and CounterCassandraTypes exactly, i.e. the value of
+# seed s equals the one generated after seed(s): the d-th random float of
+# s is computed from the word mix64(mix64(s) + d * golden) like
+# CounterRandom.random() does, NumPy's uint64 arithmetic wraps just like
+# the masked arithmetic there. Each function takes the mixed seeds and the
+# generator args of the column and returns the list of values, or None if
+# the arguments can't be vectorized, in which case the scalar method has
+# to be used.
+
+
+# generator for the values that can't be vectorized completely
+generator = CounterPythonTypes()
+
+
+def mix(z):
+    """ mix64 of counterrandom for an array of uint64.
+    """
+    z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+    return z ^ (z >> numpy.uint64(31))
+
+
+def states(seeds):
+    """ Returns the states of CounterRandom after seeding with each seed.
+
+    :param list seeds: integer seeds
+    :rtype: numpy.ndarray
+    """
+    return mix(numpy.array([seed & mask64 for seed in seeds],
+                           dtype=numpy.uint64))
+
+
+def floats(states, first, count):
+    """ Returns the random floats first to first+count-1 drawn after
+    seeding, one row per seed.
+
+    :rtype: numpy.ndarray
+    """
+    draws = numpy.arange(first + 1, first + count + 1, dtype=numpy.uint64)
+    words = mix(states[:, None] + numpy.uint64(golden) * draws[None, :])
+    return (words >> numpy.uint64(11)).astype(numpy.float64) * recip_bpf
+
+
+def fits(*numbers):
+    """ Whether all numbers fit into an int64.
+    """
+    return all(-(1 << 63) <= number < (1 << 63) for number in numbers)
+
+
+def randrange(states, first, low, high):
+    """ Vectorized CounterRandom.randrange(low, high) for ranges narrower
+    than 2**53, drawing random float first.
+    """
+    width = high - low
+    values = (floats(states, first, 1)[:, 0] * width).astype(numpy.int64)
+    return values + numpy.int64(low)
+
+
+def uniform(states, first, low, high):
+    """ Vectorized random.Random.uniform(low, high).
+    """
+    return low + (high - low) * floats(states, first, 1)[:, 0]
+
+
+def batch_int(states, low=-2147483648, high=2147483647):
+    if not (0 < high + 1 - low < maxwidth and fits(low, high + 1)):
+        return None
+    return randrange(states, 0, low, high + 1).tolist()
+
+
+def batch_long(states, low=-1 * (1 << 63), high=(1 << 63) - 1):
+    # Wider ranges use rejection sampling in random.Random, which can't
+    # be vectorized.
+    return batch_int(states, low, high)
+
+
+def batch_float(states, low=-3.4028235E38, high=3.4028235E38):
+    return uniform(states, 0, low, high).tolist()
+
+
+def batch_boolean(states, chance=.5):
+    return (floats(states, 0, 1)[:, 0] <= chance).tolist()
+
+
+def timestamps(states, start_date, end_date, start_timestamp, end_timestamp):
+    """ The timestamps of PythonTypes.pydate as floats.
+    """
+    if (start_date is not None) & (end_date is not None):
+        start_timestamp = mktime(start_date.timetuple())
+        end_timestamp = mktime(end_date.timetuple())
+    return uniform(states, 0, start_timestamp, end_timestamp).tolist()
+
+
+def batch_date(states, start_date=None, end_date=None,
+               start_timestamp=1388530800, end_timestamp=1420066799):
+    fromtimestamp = datetime.fromtimestamp
+    return [fromtimestamp(timestamp) for timestamp in
+            timestamps(states, start_date, end_date,
+                       start_timestamp, end_timestamp)]
+
+
+def batch_decimal(states, low=-3.4028235E38, high=3.4028235E38,
+                  decimal_places=3):
+    return [Decimal('%.*f' % (decimal_places, value))
+            for value in uniform(states, 0, low, high).tolist()]
+
+
+def batch_uuid(states, timestamp=None):
+    # see PythonTypes.pyuuid for the computation of the fields
+    if timestamp is not None:
+        nanoseconds = [int(timestamp * 1e9)] * len(states)
+        first = 0
+    else:
+        fromtimestamp = datetime.fromtimestamp
+        nanoseconds = [int(mktime(fromtimestamp(date).timetuple()) * 1e9)
+                       for date in timestamps(states, None, None,
+                                              1388530800, 1420066799)]
+        first = 1
+    clock_seqs = randrange(states, first, 0, 1 << 14).tolist()
+    nodes = randrange(states, first + 1, 0, 1 << 47).tolist()
+    uuids = []
+    for nanosecond, clock_seq, node in zip(nanoseconds, clock_seqs, nodes):
+        timestamp = int(nanosecond // 100) + 0x01b21dd213814000L
+        fields = (timestamp & 0xffffffffL, (timestamp >> 32L) & 0xffffL,
+                  (timestamp >> 48L) & 0x0fffL, (clock_seq >> 8L) & 0x3fL,
+                  clock_seq & 0xffL, node)
+        uuids.append(UUID(fields=fields, version=1))
+    return uuids
+
+
+def randbytes(states, count):
+    """ Vectorized CounterRandom.randbytes(count), one row per seed.
+
+    :rtype: numpy.ndarray
+    """
+    words = (count + 7) // 8
+    draws = numpy.arange(1, words + 1, dtype=numpy.uint64)
+    words = mix(states[:, None] + numpy.uint64(golden) * draws[None, :])
+    # the words in big-endian order, byte by byte
+    codes = words.astype('>u8').view(numpy.uint8)
+    return codes[:, :count]
+
+
+def batch_string(states, size=10, compression_ratio=1):
+    if isinstance(size, SizeDistribution):
+        # the rows would need different numbers of random bytes
+        return None
+    if compression_ratio > 1:
+        return [compressible(unique, size, compression_ratio) for unique in
+                batch_string(states, unique_size(size, compression_ratio))]
+    if size <= 0:
+        return [''] * len(states)
+    # the first round of PythonTypes.pystring, which nearly always yields
+    # enough characters
+    strings = [row.tostring().translate(printable_table, printable_deletions)
+               for row in randbytes(states, size * 3 // 2 + 16)]
+    for index, string in enumerate(strings):
+        if len(string) < size:
+            # repeat the whole generation for the few others
+            generator.setstate((int(states[index]), None))
+            strings[index] = generator.pystring(size)
+        else:
+            strings[index] = string[:size]
+    return strings
+
+
+def batch_bytearray(states, size=50, compression_ratio=1):
+    if isinstance(size, SizeDistribution):
+        return None
+    if size <= 0:
+        return [bytearray() for _ in xrange(len(states))]
+    if compression_ratio > 1:
+        unique = unique_size(size, compression_ratio)
+        return [bytearray(compressible(row.tostring(), size, compression_ratio))
+                for row in randbytes(states, unique)]
+    return [bytearray(row.tostring()) for row in randbytes(states, size)]
+
+
+def batch_ip(states, ip_type='ipv4'):
+    if ip_type == 'ipv4':
+        parts = (floats(states, 0, 4) * 255).astype(numpy.int64).tolist()
+        return ['.'.join([str(part) for part in row]) for row in parts]
+    parts = (floats(states, 0, 8) * 65535).astype(numpy.int64).tolist()
+    return [':'.join([hex(part)[2:] for part in row]) for row in parts]
+
+
+# the batch functions of the types of CounterPythonTypes and
+# CounterCassandraTypes
+batch_methods = dict(
+    # PythonTypes
+    date=batch_date,
+    uuid=batch_uuid,
+    bytearray=batch_bytearray,
+    boolean=batch_boolean,
+    string=batch_string,
+    int=batch_int,
+    long=batch_long,
+    float=batch_float,
+    decimal=batch_decimal,
+    # CassandraTypes
+    ascii=batch_string,
+    bigint=batch_long,
+    blob=batch_bytearray,
+    counter=batch_int,
+    double=batch_float,
+    inet=batch_ip,
+    text=batch_string,
+    timestamp=batch_date,
+    timeuuid=batch_uuid,
+    varchar=batch_string,
+    varint=batch_long
+)
+
+
+def generate_batch(type, seeds, generator_args):
+    """ Generates the values of a column for many seeds at once.
+
+    :param string type: the type of the column
+    :param list seeds: the seeds of the values
+    :param dict generator_args: the generator args of the column
+    :return: the values, or None if the type or its arguments can't be vectorized
+    :rtype: list or None
+    """
+    if numpy is None or type not in batch_methods:
+        return None
+    return batch_methods[type](states(seeds), **generator_args)
@@ -0,0 +1,131 @@
+from binascii import hexlify
+from os import urandom
+from random import Random
+from struct import pack
+
+from cassandratypes import CassandraTypes
+from pythontypes import PythonTypes
+
+mask64 = (1 << 64) - 1
+# increment of the splitmix64 state, 2**64 divided by the golden ratio
+golden = 0x9E3779B97F4A7C15
+# 2**-53, turns 53 random bits into a float in [0,1)
+recip_bpf = 2. ** -53
+# widths of ranges up to which a single random float is used
+maxwidth = 1 << 53
+
+
+def mix64(z):
+    """ The output function of splitmix64, a bijection of 64 bit integers
+    that spreads every input bit over all output bits.
+    """
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask64
+    return z ^ (z >> 31)
+
+
+class CounterRandom(Random):
+    """ Replacement for the Mersenne Twister of random.Random by the
+    counter-based generator splitmix64. The n-th 64 bit word drawn after
+    seeding with s is mix64(mix64(s) + n * golden), so seeding takes
+    constant time instead of rebuilding the 624 words of state of the
+    Mersenne Twister. This makes regenerating a value from its seed several
+    times cheaper as long as the value needs only a few random numbers.
+    All other methods of random.Random draw from random() and getrandbits()
+    and hence work unchanged, randrange() is only sped up. Values depend
+    only on the seed, but differ from the ones of random.Random for the
+    same seed.
+
+    :param optional seed: the initial seed, see seed(). default = None
+    """
+    def seed(self, a=None, mask64=mask64):
+        """ Seeds the generator. Integers are used as they are, other
+        hashable objects by their hash, and None by random bytes of the
+        operating system.
+        """
+        if a is None:
+            a = long(hexlify(urandom(8)), 16)
+        try:
+            z = a & mask64
+        except TypeError:
+            z = hash(a) & mask64
+        # Mix the seed, otherwise the streams of two seeds differing by a
+        # multiple of golden would be shifted copies of each other. mix64
+        # is inlined here and below, as these are the hot paths.
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask64
+        self.state = z ^ (z >> 31)
+        self.gauss_next = None
+
+    def random(self, mask64=mask64, golden=golden, recip_bpf=recip_bpf):
+        """ Returns the next random float in [0,1).
+        """
+        self.state = z = (self.state + golden) & mask64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask64
+        return ((z ^ (z >> 31)) >> 11) * recip_bpf
+
+    def getrandbits(self, k):
+        """ Returns an integer with k random bits, drawing one word per 64
+        bits.
+        """
+        if k <= 0:
+            raise ValueError('number of bits must be greater than zero')
+        words = (k + 63) >> 6
+        state = self.state
+        result = 0
+        for _ in xrange(words):
+            state = (state + golden) & mask64
+            result = (result << 64) | mix64(state)
+        self.state = state
+        # drop the surplus bits of the last word
+        return result >> ((words << 6) - k)
+
+    def randbytes(self, n):
+        """ Like PythonTypes.randbytes, i.e. the bytes of getrandbits(8*n)
+        in big-endian order, but packs the words directly.
+        """
+        if n <= 0:
+            return ''
+        words = (n + 7) >> 3
+        state = self.state
+        values = []
+        for _ in xrange(words):
+            state = (state + golden) & mask64
+            values.append(mix64(state))
+        self.state = state
+        return pack('>%iQ' % words, *values)[:n]
+
+    def randrange(self, start, stop=None, step=1):
+        """ Like random.Random.randrange, but without its costly argument
+        checks in the common case of integer bounds and step 1.
+        """
+        if step != 1 or stop is None:
+            return Random.randrange(self, start, stop, step)
+        width = stop - start
+        if 0 < width < maxwidth:
+            return start + int(self.random() * width)
+        return Random.randrange(self, start, stop)
+
+    def getstate(self):
+        return self.state, self.gauss_next
+
+    def setstate(self, state):
+        self.state, self.gauss_next = state
+
+    def jumpahead(self, n):
+        """ Skips n words, as if they had been drawn.
+        """
+        self.state = (self.state + n * golden) & mask64
+
+
+class CounterPythonTypes(CounterRandom, PythonTypes):
+    """ PythonTypes drawing its random numbers from CounterRandom.
+    """
+    pass
+
+
+class CounterCassandraTypes(CounterRandom, CassandraTypes):
+    """ CassandraTypes drawing its random numbers from CounterRandom.
+    """
+    pass
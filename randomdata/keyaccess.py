@@ -0,0 +1,158 @@
+from math import log
+
+from counterrandom import mix64
+
+# number of terms of the zeta function that are summed up exactly, the
+# rest is approximated
+exact_terms = 1000
+# number of items of the scrambled zipfian distribution, the ranks drawn
+# from it are hashed onto the actual key space
+scrambled_items = 10 ** 10
+
+
+class KeyAccess(object):
+    """ Distribution of the keys accessed by the queries of a workload that
+    read, update or delete existing data. It maps random numbers to the age
+    rank of a key among the n keys in use, 0 being the oldest key and n-1
+    the newest one, in constant time for any n, so the key space may grow
+    during the run.
+
+    The distribution is given as a dict, as found in the config:
+    - distribution: one of
+      - 'zipfian': the key of rank r is accessed with a probability
+        proportional to 1/(r+1)**exponent. Sampled with the method of Gray
+        et al., "Quickly generating billion-record synthetic databases",
+        which needs an exponent between 0 and 1.
+      - 'hotspot': a share of the accesses goes to a fraction of the
+        keys, the oldest ones, the rest to the others. Both are uniform.
+      - 'latest': uniform over a fraction of the keys, the newest ones.
+      - 'exponential': the probability of a key decreases exponentially
+        with its distance from the newest key, so that a share of the
+        accesses goes to a fraction of the keys.
+    - exponent: exponent of 'zipfian'. default = .99
+    - scrambled: whether 'zipfian' spreads the popular keys over the whole
+      key space by hashing their ranks instead of favouring the oldest
+      keys. The hash is cut to the bits of the next power of two of the
+      number of keys and drawn again if it is too large, so popular keys
+      stay where they are as the key space grows, until its size passes a
+      power of two and half of them move. default = True
+    - fraction: fraction of the keys of 'hotspot', 'latest' and
+      'exponential'. default = .2 for 'hotspot' and .1 otherwise
+    - share: share of the accesses of 'hotspot' and 'exponential'.
+      default = .8 for 'hotspot' and .95 for 'exponential'
+
+    :param dict spec: the distribution as described above
+    """
+    def __init__(self, spec):
+        self.spec = dict(spec)
+        self.kind = spec.get('distribution', 'zipfian')
+        if self.kind == 'zipfian':
+            self.theta = float(spec.get('exponent', .99))
+            if not 0 < self.theta < 1:
+                raise ValueError('the exponent of a zipfian key access has '
+                                 'to be between 0 and 1')
+            self.scrambled = spec.get('scrambled', True)
+            self.zeta2 = 1 + .5 ** self.theta
+            self.alpha = 1 / (1 - self.theta)
+            # prefix sums of the zeta function for small numbers of keys
+            self.zetas = [0.]
+            for i in xrange(1, exact_terms + 1):
+                self.zetas.append(self.zetas[-1] + i ** -self.theta)
+            # number of keys the constants below are computed for
+            self.items = None
+            self.zetan = self.eta = None
+            if self.scrambled:
+                self.set_items(scrambled_items)
+        elif self.kind == 'hotspot':
+            self.fraction = float(spec.get('fraction', .2))
+            self.share = float(spec.get('share', .8))
+            if not (0 < self.fraction <= 1 and 0 < self.share < 1):
+                raise ValueError('invalid hotspot key access %s' % spec)
+        elif self.kind == 'latest':
+            self.fraction = float(spec.get('fraction', .1))
+            if not 0 < self.fraction <= 1:
+                raise ValueError('invalid latest key access %s' % spec)
+        elif self.kind == 'exponential':
+            self.fraction = float(spec.get('fraction', .1))
+            share = float(spec.get('share', .95))
+            if not (0 < self.fraction <= 1 and 0 < share < 1):
+                raise ValueError('invalid exponential key access %s' % spec)
+            # rate of the distribution per key space, i.e. ages are
+            # exponentially distributed with rate self.rate / n
+            self.rate = -log(1 - share) / self.fraction
+        else:
+            raise ValueError('unknown key access %s' % self.kind)
+
+    def zeta(self, n):
+        """ Returns the sum of 1/i**exponent for i from 1 to n, approximating
+        all terms after the first 1000 by the Euler-Maclaurin formula.
+        """
+        if n <= exact_terms:
+            return self.zetas[n]
+        theta = self.theta
+        return (self.zetas[exact_terms] +
+                (n ** (1 - theta) - exact_terms ** (1 - theta)) / (1 - theta) +
+                (n ** -theta - exact_terms ** -theta) / 2)
+
+    def set_items(self, n):
+        """ Computes the constants of the zipfian distribution for n keys.
+        """
+        self.items = n
+        self.zetan = self.zeta(n)
+        if n <= 2:
+            # zipfian() never gets past the first two ranks
+            self.eta = 0.
+        else:
+            self.eta = ((1 - (2. / n) ** (1 - self.theta)) /
+                        (1 - self.zeta2 / self.zetan))
+
+    def zipfian(self, uniform, n):
+        """ Returns the zipfian rank for a random number, 0 being the most
+        popular one.
+        """
+        if n != self.items:
+            self.set_items(n)
+        scaled = uniform * self.zetan
+        if scaled < 1:
+            return 0
+        if scaled < self.zeta2:
+            return 1
+        rank = int(n * (self.eta * uniform - self.eta + 1) ** self.alpha)
+        return min(rank, n - 1)
+
+    def rank(self, random, n):
+        """ Chooses the age rank of a key.
+
+        :param random: function returning random numbers in [0,1)
+        :param int n: number of keys in use, has to be positive
+        :return: the age rank, 0 for the oldest key and n-1 for the newest
+        :rtype: int
+        """
+        kind = self.kind
+        if n == 1:
+            return 0
+        if kind == 'zipfian':
+            if self.scrambled:
+                mask = (1 << (n - 1).bit_length()) - 1
+                # at most half of the hashes are too large
+                while True:
+                    rank = mix64(self.zipfian(random(), scrambled_items)) & mask
+                    if rank < n:
+                        return rank
+            return self.zipfian(random(), n)
+        if kind == 'hotspot':
+            uniform = random()
+            hot = max(1, int(n * self.fraction))
+            if uniform < self.share or hot == n:
+                return int(uniform / self.share * hot) % hot
+            return hot + int((uniform - self.share) / (1 - self.share) * (n - hot))
+        if kind == 'latest':
+            return n - 1 - int(random() * max(1, int(n * self.fraction)))
+        # exponential, ages beyond the oldest key are drawn again
+        while True:
+            age = int(-log(1 - random()) * n / self.rate)
+            if age < n:
+                return n - 1 - age
+
+    def __repr__(self):
+        return 'KeyAccess(%r)' % sorted(self.spec.items())
@@ -1,11 +1,69 @@
+from binascii import unhexlify
 from datetime import datetime
 from time import mktime
 from uuid import UUID
 from decimal import Decimal
+from inspect import getargspec
+from math import ceil
 from random import Random
 
+from sizedistribution import SizeDistribution
+
 # TODO: printables don't include '\t', '\n', '\r', '\x0b' and '\x0c', but for some string these might be needed. add a paramter to optionally include these
 printable = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ '
+# Translation of random bytes into printable characters: the first
+# 2*len(printable) byte values map onto printable twice, the remaining ones
+# are deleted, so every character is equally likely.
+printable_bytes = 2 * len(printable)
+printable_table = 2 * printable + '\0' * (256 - printable_bytes)
+printable_deletions = ''.join(chr(byte) for byte in xrange(printable_bytes, 256))
+
+# length of the parts of compressible values that repeat on their own
+compressible_segment = 4096
+
+
+def segment_unique_size(length, compression_ratio):
+    """ Returns the number of random bytes of a segment, see compressible().
+    """
+    return max(1, int(ceil(length / float(compression_ratio))))
+
+
+def unique_size(size, compression_ratio):
+    """ Returns the number of random bytes or characters of a value of the
+    given size and compression ratio, see compressible().
+    """
+    segments, rest = divmod(size, compressible_segment)
+    unique = segments * segment_unique_size(compressible_segment,
+                                            compression_ratio)
+    if rest > 0:
+        unique += segment_unique_size(rest, compression_ratio)
+    return unique
+
+
+def compressible(unique, size, compression_ratio):
+    """ Builds a value of the given size from the random string unique of
+    length unique_size(size, compression_ratio). The value is split into
+    segments of 4 KB, each of which repeats its own share of unique, so
+    LZ77-based compressors like LZ4, Snappy, Deflate and Zstd shrink it by
+    about compression_ratio, whatever the size of their window. Random
+    printable characters carry only about 6.6 bits each, so compressors
+    using entropy coding shrink strings by another 20 percent.
+
+    :param string unique: the random part of the value
+    :param int size: length of the value
+    :param float compression_ratio: the ratio of the size to the compressed size
+    :rtype: string
+    """
+    parts = []
+    position = 0
+    for start in xrange(0, size, compressible_segment):
+        length = min(compressible_segment, size - start)
+        segment_unique = segment_unique_size(length, compression_ratio)
+        part = unique[position:position + segment_unique]
+        position += segment_unique
+        parts.append((part * (length // segment_unique + 1))[:length])
+    return ''.join(parts)
+
 
 class PythonTypes(Random):
     """
@@ -119,14 +177,33 @@ class PythonTypes(Random):
 
         return UUID(fields=(time_low, time_mid, time_hi_version, clock_seq_hi_variant, clock_seq_low, node), version=1)
 
-    def pybytearray(self, size=50):
+    def randbytes(self, n):
+        """Generates a string of random bytes from a single call to
+        getrandbits.
+
+        :param int n: number of bytes
+        :return: random bytes
+        :rtype: string
+        """
+        if n <= 0:
+            return ''
+        return unhexlify('%0*x' % (2 * n, self.getrandbits(8 * n)))
+
+    def pybytearray(self, size=50, compression_ratio=1):
         """Generates a random bytearray.
 
-        :param optional int size: number of bytes in resulting bytearray
+        :param optional size: number of bytes in resulting bytearray, int or SizeDistribution
+        :param optional float compression_ratio: approximate ratio of the size to the compressed size, see compressible(). default = 1
         :return: random bytearray
         :rtype: bytearray
         """
-        return bytearray([self.randrange(0, 256) for x in xrange(size)])
+        if isinstance(size, SizeDistribution):
+            size = size.sample(self.random())
+        if compression_ratio > 1:
+            return bytearray(compressible(
+                self.randbytes(unique_size(size, compression_ratio)), size,
+                compression_ratio))
+        return bytearray(self.randbytes(size))
 
     def pyboolean(self, chance=.5):
         """Generates a random boolean.
@@ -137,17 +214,29 @@ class PythonTypes(Random):
         """
         return self.random() <= chance
 
-    def pystring(self, size=10):
+    def pystring(self, size=10, compression_ratio=1):
         """ Generates a random string.
 
-        :param optional int size: length of the string to generate. default = 10
+        :param optional size: length of the string to generate, int or SizeDistribution. default = 10
+        :param optional float compression_ratio: approximate ratio of the size to the compressed size, see compressible(). default = 1
         :return: random string
         :rtype: string
         """
-        lp = len(printable)
-        choice = [printable[int(self.random() * lp)] for _ in range(size)]
-        res = ''.join(choice)
-        return res
+        if isinstance(size, SizeDistribution):
+            size = size.sample(self.random())
+        if compression_ratio > 1:
+            return compressible(
+                self.pystring(unique_size(size, compression_ratio)), size,
+                compression_ratio)
+        # Translate random bytes, dropping the ones outside of the table.
+        # About three quarters are kept, so half again as many bytes as
+        # needed are drawn, and more in the rare case that wasn't enough.
+        res = ''
+        while len(res) < size:
+            missing = size - len(res)
+            res += self.randbytes(missing * 3 // 2 + 16).translate(
+                printable_table, printable_deletions)
+        return res[:size]
 
     def pyint(self, low=-2147483648, high=2147483647):
         """Generates a random integer.
@@ -195,96 +284,131 @@ class PythonTypes(Random):
         # wanted number of decimal places.
         return Decimal('%.*f' % (decimal_places, self.uniform(low, high)))
 
-    def pylist(self, min_elems=0, max_elems=10, elem_type='int', **elem_args):
+    def collection_size(self, min_elems, max_elems, elems):
+        """ Returns the number of elements of a collection, drawn from elems
+        if given and uniformly between min_elems and max_elems otherwise.
+        """
+        if elems is not None:
+            return elems.sample(self.random())
+        return self.randrange(min_elems, max_elems+1)
+
+    def element_method(self, elem_type):
+        """ Returns the method generating elements of a collection.
+
+        :param string elem_type: type of the elements
+        """
+        try:
+            return self.methods_switch[elem_type]
+        except KeyError:
+            raise NotImplementedError(
+                'Generation of type {} not implemented in {}'.format(elem_type, self.__class__.__name__))
+
+    def distinct_values(self, elems, elem_type, elem_args):
+        """ Generates up to elems distinct values of a type in time linear in
+        elems. Integers are sampled without replacement if they are drawn
+        from a range less than twice as large as elems, so the number of
+        values is only cut down if the range is too small. Other values are
+        drawn until enough distinct ones are found, but at most
+        10 * elems + 100 times and stopping after 1000 draws in a row
+        without a new value, so collections of types with few distinct
+        values, e.g. booleans, end up smaller instead of looping forever.
+
+        :param int elems: number of values
+        :param string elem_type: type of the values
+        :param dict elem_args: keyword dict of arguments for generation of the values
+        :return: the distinct values
+        :rtype: list
+        """
+        method = self.element_method(elem_type)
+        if method == self.pyint or method == self.pylong:
+            # the bounds of the method, including its defaults
+            spec = getargspec(method)
+            bounds = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+            bounds.update(elem_args)
+            low = bounds['low']
+            domain = max(bounds['high'] - low + 1, 0)
+            if domain < 2 * elems:
+                return [low + offset for offset in
+                        self.sample(xrange(domain), min(elems, domain))]
+        values = set()
+        add = values.add
+        # number of draws in a row that did not yield a new value
+        misses = 0
+        for _ in xrange(10 * elems + 100):
+            if len(values) >= elems or misses >= 1000:
+                break
+            count = len(values)
+            add(method(**elem_args))
+            if len(values) == count:
+                misses += 1
+            else:
+                misses = 0
+        return list(values)
+
+    def pylist(self, min_elems=0, max_elems=10, elem_type='int', elems=None, **elem_args):
         """ Generates a list of definable random length with items of definable
         type.
 
         :param option int min_elems: minimum length of list. default = 0
         :param option int max_elems: maximum length of list. default = 10
         :param optional string elem_type: type of elements in list. default = 'int'
+        :param optional SizeDistribution elems: distribution of the length, replaces min_elems and max_elems. default = None
         :param optional dict elem_args: keyword dict of arguments for generation of list elements
         :return: list with length between min_elems and max_elems, containing items of type elem_type
         :rtype: list
         """
-        result = []
-        elems = self.randrange(min_elems, max_elems+1)
-        for _ in xrange(elems):
-            try:
-                result.append(self.methods_switch[elem_type](**elem_args))
-            except KeyError:
-                raise NotImplementedError(
-                    'Generation of type {} not implemented in {}'.format(type, self.__class__.__name__))
-        return result
+        method = self.element_method(elem_type)
+        elems = self.collection_size(min_elems, max_elems, elems)
+        return [method(**elem_args) for _ in xrange(elems)]
 
-    def pytuple(self, min_elems=0, max_elems=10, elem_type='int', **elem_args):
+    def pytuple(self, min_elems=0, max_elems=10, elem_type='int', elems=None, **elem_args):
         """ Generates a tuple of definable random length with items of
         definable type.
 
         :param option int min_elems: minimum length of list. default = 0
         :param option int max_elems: maximum length of list. default = 10
         :param optional string elem_type: type of elements in list. default = 'int'
+        :param optional SizeDistribution elems: distribution of the length, replaces min_elems and max_elems. default = None
         :param optional dict elem_args: keyword dict of arguments for generation of list elements
         :return: tupel with length between min_elems and max_elems, containing items of type elem_type
-        :rtype: list
+        :rtype: tuple
         """
-        result = ()
-        elems = self.randrange(min_elems, max_elems+1)
-        for _ in xrange(elems):
-            try:
-                result += (self.methods_switch[elem_type](**elem_args),)
-            except KeyError:
-                raise NotImplementedError(
-                    'Generation of type {} not implemented in {}'.format(type, self.__class__.__name__))
-        return result
+        # build a list first, appending to a tuple copies it every time
+        return tuple(self.pylist(min_elems, max_elems, elem_type, elems,
+                                 **elem_args))
 
-    def pydict(self, min_elems=0, max_elems=10, key_type='int', elem_type='int', **elem_args):
+    def pydict(self, min_elems=0, max_elems=10, key_type='int', elem_type='int', elems=None, **elem_args):
         """ Generates a dict of definable random size with keys and items of
-        definable type.
-        Warning: it is not checked whether enough distinct keys can be
-        generated, thus this method could end up in an infinite loop!
+        definable type. The keys are generated by distinct_values(), so the
+        dict might be smaller than min_elems if there are not enough
+        distinct keys.
 
         :param optional int min_elems: minimal size of dict. default = 0
         :param optional int max_elems: maximal size of dict. default = 10
         :param optional string key_type: type of dict keys. default = 'int'
         :param optional string elem_type: type of elements in dict. default = 'int'
+        :param optional SizeDistribution elems: distribution of the size, replaces min_elems and max_elems. default = None
         :param optional dict elem_args: keyword dict of arguments for generation of dict elements
         :return: dict with size between min_elems and max_elems, containing keys of type key_type and items of type elem_type
         :rtype: dict
         """
-        result = dict()
-        elems = self.randrange(min_elems, max_elems+1)
-        # Warning: it is not checked whether enough distinct keys
-        # can be generated, thus we could end up in an infinite loop!
-        while len(result) < elems:
-            try:
-                result[self.methods_switch[key_type]()] = (
-                    self.methods_switch[elem_type](**elem_args))
-            except KeyError:
-                raise NotImplementedError(
-                    'Generation of type {} not implemented in {}'.format(type, self.__class__.__name__))
-        return result
+        method = self.element_method(elem_type)
+        elems = self.collection_size(min_elems, max_elems, elems)
+        keys = self.distinct_values(elems, key_type, {})
+        return dict(zip(keys, [method(**elem_args) for _ in keys]))
 
-    def pyset(self, min_elems=0, max_elems=10, elem_type='int', **elem_args):
+    def pyset(self, min_elems=0, max_elems=10, elem_type='int', elems=None, **elem_args):
         """ Generates a set of definable random size with items of definable
-        type.
-        Warning: it is not checked whether enough distinct elements can be
-        generated, thus this method could end up in an infinite loop!
+        type. The items are generated by distinct_values(), so the set might
+        be smaller than min_elems if there are not enough distinct items.
 
         :param optional int min_elems: minimum size of set. default = 0
         :param optional int max_elems: maximum size of set. default = 10
         :param optional string elem_type: type of elements in set. default = 'int'
+        :param optional SizeDistribution elems: distribution of the size, replaces min_elems and max_elems. default = None
         :param optional dict elem_args: keyword dict of arguments for generation of set elements
         :return: set with size between min_elem and max_elem, containing items of type elem_type
         :rtype: set
         """
-        result = set()
-        elems = self.randrange(min_elems, max_elems+1)
-        # Warning: it is not checked whether enough distinct elements
-        # can be generated, thus we could end up in an infinite loop!
-        while len(result) < elems:
-            try:
-                result.add(self.methods_switch[elem_type](**elem_args))
-            except KeyError:
-                raise NotImplementedError(
-                    'Generation of type {} not implemented in {}'.format(type, self.__class__.__name__))
-        return result
\ No newline at end of file
+        elems = self.collection_size(min_elems, max_elems, elems)
+        return set(self.distinct_values(elems, elem_type, elem_args))
@@ -0,0 +1,157 @@
+from math import erf, log, sqrt
+
+from aliastable import AliasTable
+
+# largest number of distinct sizes sampled with an alias table, larger
+# ranges use the inverse-CDF table
+max_alias_sizes = 1 << 16
+# number of quantiles in the inverse-CDF table
+quantiles = 4096
+# distributions by their spec, so attributes with the same spec share one
+distributions = {}
+
+
+class SizeDistribution(object):
+    """ Distribution of the sizes of generated values, i.e. the lengths of
+    strings and bytearrays or the numbers of elements of collections. All
+    the work is done on creation: sampling maps a single random float to a
+    size in constant time, either with an alias table over all possible
+    sizes or, for ranges of more than 2**16 sizes, with a table of the
+    quantiles of the distribution.
+
+    The distribution is given as a dict, as found in the config:
+    - distribution: 'uniform', 'normal', 'lognormal' or 'empirical'
+    - min, max: bounds of the sizes, the continuous distributions are
+      truncated to them. default = 0 and 1000
+    - mean, stddev: parameters of 'normal'. default = middle of the bounds
+      and a sixth of their distance
+    - mu, sigma: mean and standard deviation of the logarithm of the sizes
+      for 'lognormal'. default = 4 and 1
+    - file: location of the histogram of 'empirical', each line holds a
+      size and optionally its weight, which defaults to 1. Lines starting
+      with '#' are ignored.
+
+    :param dict spec: the distribution as described above
+    """
+    def __init__(self, spec):
+        self.spec = dict(spec)
+        kind = spec.get('distribution', 'uniform')
+        self.table = None
+        self.quantiles = None
+        self.low = int(spec.get('min', 0))
+        self.high = int(spec.get('max', 1000))
+
+        if kind == 'empirical':
+            sizes, weights = read_histogram(spec['file'])
+            self.table = AliasTable(sizes, weights)
+            return
+        if self.high < self.low or self.low < 0:
+            raise ValueError('invalid bounds of size distribution %s' % spec)
+        if kind == 'uniform':
+            # sampled directly
+            return
+        if kind == 'normal':
+            mean = float(spec.get('mean', (self.low + self.high) / 2.))
+            stddev = float(spec.get('stddev', (self.high - self.low) / 6.))
+            cdf = lambda x: .5 * (1 + erf((x - mean) / (stddev * sqrt(2))))
+        elif kind == 'lognormal':
+            mu = float(spec.get('mu', 4))
+            sigma = float(spec.get('sigma', 1))
+            cdf = lambda x: 0. if x <= 0 else \
+                .5 * (1 + erf((log(x) - mu) / (sigma * sqrt(2))))
+        else:
+            raise ValueError('unknown size distribution %s' % kind)
+
+        if self.high - self.low < max_alias_sizes:
+            # the chance of each size is the mass of the continuous
+            # distribution rounding to it
+            sizes = range(self.low, self.high + 1)
+            weights = [cdf(size + .5) - cdf(size - .5) for size in sizes]
+            if sum(weights) <= 0:
+                raise ValueError('size distribution %s has no mass between '
+                                 'its bounds' % spec)
+            self.table = AliasTable(sizes, weights)
+        else:
+            self.quantiles = quantile_table(cdf, self.low, self.high)
+
+    def sample(self, uniform):
+        """ Maps a random number to a size.
+
+        :param float uniform: random number in [0,1)
+        :rtype: int
+        """
+        if self.table is not None:
+            return self.table.choice(uniform)
+        if self.quantiles is None:
+            return self.low + int(uniform * (self.high - self.low + 1))
+        # interpolate between the neighbouring quantiles
+        position = uniform * quantiles
+        index = int(position)
+        low = self.quantiles[index]
+        return int(low + (position - index) * (self.quantiles[index + 1] - low) + .5)
+
+    def __repr__(self):
+        # used to tell apart columns and pools, so it has to be stable
+        return 'SizeDistribution(%r)' % sorted(self.spec.items())
+
+
+def size_distribution(spec):
+    """ Returns the SizeDistribution of a spec, creating it only once.
+
+    :param dict spec: the distribution, see SizeDistribution
+    :rtype: SizeDistribution
+    """
+    key = repr(sorted(spec.items()))
+    try:
+        return distributions[key]
+    except KeyError:
+        distributions[key] = SizeDistribution(spec)
+        return distributions[key]
+
+
+def quantile_table(cdf, low, high):
+    """ Returns the quantiles at 0, 1/quantiles, ..., 1 of the continuous
+    distribution with the given CDF, truncated to [low, high].
+    """
+    cdf_low = cdf(low)
+    mass = cdf(high) - cdf_low
+    if mass <= 0:
+        raise ValueError('size distribution has no mass between its bounds')
+    table = []
+    for index in xrange(quantiles + 1):
+        target = cdf_low + mass * index / float(quantiles)
+        # bisect the CDF, sizes are integers anyway
+        left, right = float(low), float(high)
+        while right - left > .01:
+            middle = (left + right) / 2
+            if cdf(middle) < target:
+                left = middle
+            else:
+                right = middle
+        table.append(right)
+    return table
+
+
+def read_histogram(path):
+    """ Reads the sizes and weights of an empirical size distribution.
+
+    :param string path: location of the histogram, see SizeDistribution
+    :return: sizes and weights
+    :rtype: tuple
+    """
+    sizes = []
+    weights = []
+    with open(path) as histogram:
+        for line in histogram:
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            fields = line.split()
+            sizes.append(int(fields[0]))
+            if len(fields) > 1:
+                weights.append(float(fields[1]))
+            else:
+                weights.append(1.)
+    if len(sizes) == 0:
+        raise ValueError('empty size histogram %s' % path)
+    return sizes, weights
@@ -0,0 +1,324 @@
+import json
+import os
+from ctypes import c_ulonglong
+from multiprocessing import Condition, Lock
+from multiprocessing.sharedctypes import RawArray
+from zlib import crc32
+
+from sharedbuffer import SharedBuffer
+
+# size of the chunks files are compared and written in
+CHUNK = 1 << 20
+
+# indices of the state of the checkpoint gate
+CHANGES = 0  # number of changes of the key structures in progress
+PAUSED = 1   # whether the checkpoint process keeps new changes out
+EPOCH = 2    # number of pauses so far
+
+
+class CheckpointGate(object):
+    """ Lets the checkpoint process pause the processes changing the key
+    structures, so the bitmap and the update_dict of a table are saved in
+    the same state. Each change of the key structures, e.g. an update
+    writing the update_dict and then the was_updated bit, passes the gate
+    as a whole by running within a with statement on it. pause() waits
+    for the changes in progress to end and keeps new ones waiting until
+    resume(). Every pause starts a new epoch, which is recorded for each
+    structure saved during the pause, see KeyStateCheckpoint.
+
+    The gate has to be created before the processes using it are forked.
+    """
+    def __init__(self):
+        self.state = RawArray(c_ulonglong, 3)
+        self.lock = Lock()
+        self.changed = Condition(self.lock)
+
+    def __enter__(self):
+        state = self.state
+        with self.lock:
+            while state[PAUSED]:
+                self.changed.wait()
+            state[CHANGES] += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        state = self.state
+        with self.lock:
+            state[CHANGES] -= 1
+            if state[PAUSED] and state[CHANGES] == 0:
+                self.changed.notify_all()
+        return False
+
+    def pause(self):
+        """ Waits until no change is in progress and keeps new ones from
+        starting.
+
+        :return: the epoch of this pause
+        :rtype: int
+        """
+        state = self.state
+        with self.lock:
+            state[PAUSED] = 1
+            state[EPOCH] += 1
+            while state[CHANGES]:
+                self.changed.wait()
+            return int(state[EPOCH])
+
+    def resume(self):
+        """ Lets the waiting changes go on.
+        """
+        with self.lock:
+            self.state[PAUSED] = 0
+            self.changed.notify_all()
+
+
+class KeyStateCheckpoint(object):
+    """ Crash-consistent, incremental checkpoints of the key structures of
+    all tables, i.e. of objects with a save(writer) and a load(reader)
+    method like SharedKeyBitmap, SharedHashTable and StatelessKeySpace.
+
+    The checkpoint directory holds two slots, which are written
+    alternately, and a manifest naming the slot of the last complete
+    checkpoint together with the counters and the lengths of the files of
+    that slot. The manifest is replaced atomically by renaming it, after all
+    files of the slot have been synced to disk, so a crash while saving
+    leaves the previous checkpoint intact.
+    The structures of a table are copied into memory while their changes
+    are paused by the gate of the checkpoint, so they fit together, and
+    written to the files after the changes resume, so the pause only takes
+    as long as copying the key state of the table. The epoch of the
+    pause is recorded for the table in the manifest and for each of its
+    structures, and loading a structure of another epoch fails.
+    Files are compared chunkwise with the content last written to the same
+    slot and only changed chunks are written, so saving the mostly
+    unchanged state of a large key space is cheap.
+
+    :param string directory: location of the checkpoint, created if needed
+    """
+    manifest_name = 'manifest.json'
+
+    def __init__(self, directory):
+        self.directory = directory
+        for slot in (0, 1):
+            path = self.slot_path(slot)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        manifest = self.read_manifest()
+        if manifest is None:
+            # the first checkpoint goes into slot 0
+            self.slot = 1
+        else:
+            self.slot = manifest['slot']
+        # checksums of the chunks of all files, for each slot, as last
+        # written by this process
+        self.checksums = ({}, {})
+        # counters and file lengths of the checkpoint being written
+        self.counters = {}
+        self.files = {}
+        self.writing = None
+        # names and contents of the files copied but not written yet
+        self.copies = []
+        # the processes changing the key structures pass this gate
+        self.gate = CheckpointGate()
+
+    def slot_path(self, slot):
+        return os.path.join(self.directory, 'slot%i' % slot)
+
+    def read_manifest(self):
+        """ Returns the manifest of the last complete checkpoint, or None if
+        there is none.
+        """
+        try:
+            with open(os.path.join(self.directory, self.manifest_name)) as manifest:
+                return json.load(manifest)
+        except IOError:
+            return None
+
+    def save(self, key_structs):
+        """ Writes a new checkpoint of the key structures.
+
+        :param dict key_structs: the key structures of all tables, as created by the GeneratorCoordinator
+        """
+        slot = 1 - self.slot
+        self.writing = slot
+        self.counters = {}
+        self.files = {}
+        epochs = {}
+        for table, structs in key_structs.items():
+            epoch = self.gate.pause()
+            try:
+                for name, struct in structs.items():
+                    writer = CheckpointWriter(self, '%s.%s.' % (table, name))
+                    struct.save(writer)
+                    writer.counter('epoch', epoch)
+            finally:
+                self.gate.resume()
+            epochs[table] = epoch
+            for name, data in self.copies:
+                self.write_file(name, data, len(data))
+            self.copies = []
+
+        manifest = {'slot': slot, 'counters': self.counters,
+                    'files': self.files, 'epochs': epochs}
+        path = os.path.join(self.directory, self.manifest_name)
+        with open(path + '.tmp', 'w') as tmp:
+            json.dump(manifest, tmp)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.rename(path + '.tmp', path)
+        # make the rename itself durable
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.slot = slot
+
+    def copy_file(self, name, source, length):
+        """ Copies the first length bytes of source into memory, to be
+        written to the file name by save() later.
+
+        :param string name: name of the file
+        :param source: a SharedBuffer or a string
+        :param int length: number of bytes to copy
+        """
+        if isinstance(source, SharedBuffer):
+            source = source.ensure(length)
+        self.copies.append((name, source[0:length]))
+
+    def write_file(self, name, source, length):
+        """ Writes the first length bytes of source to the file name of the
+        slot currently written, skipping unchanged chunks.
+
+        :param string name: name of the file
+        :param source: a SharedBuffer or a string
+        :param int length: number of bytes to write
+        """
+        if isinstance(source, SharedBuffer):
+            source = source.ensure(length)
+        checksums = self.checksums[self.writing]
+        path = os.path.join(self.slot_path(self.writing), name)
+        if os.path.exists(path):
+            mode = 'r+b'
+        else:
+            mode = 'w+b'
+            # nothing of this file was written before
+            for key in [key for key in checksums if key[0] == name]:
+                del checksums[key]
+        with open(path, mode) as target:
+            for offset in xrange(0, length, CHUNK):
+                data = source[offset:min(offset + CHUNK, length)]
+                checksum = crc32(data)
+                if checksums.get((name, offset)) != checksum:
+                    target.seek(offset)
+                    target.write(data)
+                    checksums[(name, offset)] = checksum
+            target.truncate(length)
+            target.flush()
+            os.fsync(target.fileno())
+        self.files[name] = length
+
+    def restore(self, key_structs):
+        """ Loads the last complete checkpoint into the key structures, which
+        have to be new and must not be used by any process yet.
+
+        :param dict key_structs: the key structures of all tables, as created by the GeneratorCoordinator
+        :return: whether there was a checkpoint to load
+        :rtype: bool
+        """
+        manifest = self.read_manifest()
+        if manifest is None:
+            return False
+        self.counters = manifest['counters']
+        self.files = manifest['files']
+        for table, structs in key_structs.items():
+            epoch = manifest['epochs'][table]
+            for name, struct in structs.items():
+                reader = CheckpointReader(self, manifest['slot'],
+                                          '%s.%s.' % (table, name))
+                if reader.counter('epoch') != epoch:
+                    msg = 'The %s of table %s was saved apart from the rest of its key state.'
+                    raise ValueError(msg % (name, table))
+                struct.load(reader)
+        return True
+
+
+class CheckpointWriter(object):
+    """ Passed to the save() method of a key structure to write its counters
+    and data to a checkpoint. All names are prefixed with the name of the
+    structure.
+    """
+    def __init__(self, checkpoint, prefix):
+        self.checkpoint = checkpoint
+        self.prefix = prefix
+
+    def counter(self, name, value):
+        """ Stores an integer.
+        """
+        self.checkpoint.counters[self.prefix + name] = int(value)
+
+    def data(self, name, source, length):
+        """ Stores the first length bytes of a SharedBuffer or string.
+        """
+        self.checkpoint.copy_file(self.prefix + name, source, length)
+
+    def child(self, name):
+        """ Returns a writer for a part of the structure, e.g. a shard.
+        """
+        return CheckpointWriter(self.checkpoint, self.prefix + name + '.')
+
+
+class CheckpointReader(object):
+    """ Passed to the load() method of a key structure to read its counters
+    and data from a checkpoint.
+    """
+    def __init__(self, checkpoint, slot, prefix):
+        self.checkpoint = checkpoint
+        self.slot = slot
+        self.prefix = prefix
+
+    def counter(self, name):
+        """ Returns an integer stored by CheckpointWriter.counter().
+        """
+        return self.checkpoint.counters[self.prefix + name]
+
+    def load(self, name, buffer):
+        """ Copies data stored by CheckpointWriter.data() into a
+        SharedBuffer.
+
+        :return: number of bytes copied
+        :rtype: int
+        """
+        name = self.prefix + name
+        path = os.path.join(self.checkpoint.slot_path(self.slot), name)
+        if os.path.getsize(path) != self.checkpoint.files[name]:
+            raise ValueError('The checkpoint file %s is damaged.' % path)
+        return buffer.load(path)
+
+    def child(self, name):
+        """ Returns a reader for a part of the structure, e.g. a shard.
+        """
+        return CheckpointReader(self.checkpoint, self.slot,
+                                self.prefix + name + '.')
+
+
+def checkpoint_periodically(checkpoint, key_structs, interval, shutdown,
+                            stopped):
+    """ Saves a checkpoint of the key structures every interval seconds
+    until shutdown is set, then a last one as soon as stopped is set. Runs
+    in a process of its own, which has to be the only one writing to the
+    checkpoint, as the checksums of the written chunks are only known to
+    it. The processes changing the key structures have to pass the gate of
+    the checkpoint, see CheckpointGate.
+
+    :param KeyStateCheckpoint checkpoint: the checkpoint to write
+    :param dict key_structs: the key structures of all tables
+    :param float interval: seconds between two checkpoints
+    :param shutdown: multiprocessing.Event telling the process to end
+    :param stopped: multiprocessing.Event set when no other process changes the key structures anymore
+    """
+    while not shutdown.wait(interval):
+        checkpoint.save(key_structs)
+    stopped.wait()
+    checkpoint.save(key_structs)
+    print 'saved the key state to %s' % checkpoint.directory
@@ -0,0 +1,280 @@
+from ctypes import c_ulonglong
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawValue
+from struct import Struct
+
+from sharedbuffer import SharedBuffer
+
+# states of a slot
+EMPTY = 0
+FULL = 1
+DELETED = 2
+
+# layout of a slot: state, key, value
+slot = Struct('<bqq')
+
+# multiplier for Fibonacci hashing, i.e. 2**64 divided by the golden ratio
+golden = 0x9E3779B97F4A7C15
+mask64 = (1 << 64) - 1
+
+
+class _Segment(object):
+    """ One independently locked part of a SharedHashTable. The slots lie in
+    the buffer of the table, from the offset of the segment on, and use
+    linear probing.
+
+    :param table: the SharedHashTable the segment belongs to
+    :param int capacity: initial number of slots, has to be a power of two
+    """
+    def __init__(self, table, capacity):
+        self.table = table
+        self.lock = Lock()
+        # offset of the slots in the buffer of the table and number of
+        # slots, shared between all processes
+        self.offset = RawValue(c_ulonglong, table.allocate(capacity * slot.size))
+        self.capacity = RawValue(c_ulonglong, capacity)
+        # number of stored items
+        self.count = RawValue(c_ulonglong, 0)
+        # number of slots that are not empty, including deleted ones
+        self.used = RawValue(c_ulonglong, 0)
+
+    def mapping(self):
+        """ Returns the mapping of the buffer, the offset of the slots and
+        the mask for slot indices. Must only be called while holding the
+        lock.
+        """
+        offset = int(self.offset.value)
+        capacity = int(self.capacity.value)
+        mapping = self.table.buffer.ensure(offset + capacity * slot.size)
+        return mapping, offset, capacity - 1
+
+    def find(self, mapping, offset, mask, key, index):
+        """ Searches the slot of key, starting at slot index.
+
+        :return: index of the slot holding key or the first slot key can be stored in, whether key was found, the value stored for key
+        :rtype: tuple
+        """
+        free = None
+        while True:
+            state, k, value = slot.unpack_from(mapping, offset + index * slot.size)
+            if state == EMPTY:
+                if free is None:
+                    free = index
+                return free, False, None
+            if state == FULL:
+                if k == key:
+                    return index, True, value
+            elif free is None:
+                free = index
+            index = (index + 1) & mask
+
+    def rehash(self, capacity):
+        """ Rebuilds the segment with the given number of slots, dropping all
+        deleted slots. A segment keeping its capacity is rebuilt in place, a
+        grown one moves to new space at the end of the buffer. Must only be
+        called while holding the lock.
+
+        :param int capacity: new number of slots, has to be a power of two
+        """
+        mapping, offset, mask = self.mapping()
+        items = []
+        for index in xrange(mask + 1):
+            state, key, value = slot.unpack_from(mapping, offset + index * slot.size)
+            if state == FULL:
+                items.append((key, value))
+
+        size = capacity * slot.size
+        if capacity == mask + 1:
+            mapping[offset:offset + size] = '\0' * size
+        else:
+            # new space of the buffer is zeroed
+            offset = self.table.allocate(size)
+            mapping = self.table.buffer.ensure(offset + size)
+        mask = capacity - 1
+        for key, value in items:
+            index = self.find(mapping, offset, mask, key, ((key * golden) & mask64) & mask)[0]
+            slot.pack_into(mapping, offset + index * slot.size, FULL, key, value)
+        self.offset.value = offset
+        self.capacity.value = capacity
+        self.used.value = len(items)
+
+
+class SharedHashTable(object):
+    """ Hash table mapping signed 64 bit integers to signed 64 bit integers,
+    shared between all processes forked after its creation.
+
+    The table is divided into segments, each with its own lock, so
+    operations on different segments never contend. Each segment is an
+    open-addressing table with linear probing. A segment doubles its
+    capacity as soon as more than half of its slots are used, so it can
+    hold any number of items.
+    All segments share a single SharedBuffer, so a table needs only a
+    single file descriptor (plus the one each mapping duplicates), no
+    matter the number of segments. Space is taken from the end of the
+    buffer and a grown segment leaves its old slots behind, so the buffer
+    takes up to about twice the size of the slots in use.
+    Besides the usual dict operations the table offers an atomic
+    read-modify-write of a single item via modify().
+
+    :param optional int capacity: initial number of slots of the whole table. default = 2**16
+    :param optional int segments: number of segments, rounded up to a power of two. default = 16
+    """
+    max_load = .5
+
+    def __init__(self, capacity=1 << 16, segments=16):
+        self.segment_bits = max(segments - 1, 0).bit_length()
+        num_segments = 1 << self.segment_bits
+        segment_capacity = 1 << max(capacity / num_segments - 1, 1).bit_length()
+        self.buffer = SharedBuffer(num_segments * segment_capacity * slot.size)
+        # bytes of the buffer taken by the segments so far
+        self.end = RawValue(c_ulonglong, 0)
+        self.allocation_lock = Lock()
+        self.segments = [_Segment(self, segment_capacity)
+                         for _ in xrange(num_segments)]
+
+    def allocate(self, size):
+        """ Takes size bytes from the end of the buffer.
+
+        :return: the offset of the bytes
+        :rtype: int
+        """
+        with self.allocation_lock:
+            offset = int(self.end.value)
+            self.end.value = offset + size
+        self.buffer.ensure(offset + size)
+        return offset
+
+    def _locate(self, key):
+        """ Returns the segment of key and the hash of key.
+        """
+        hashed = (key * golden) & mask64
+        return self.segments[hashed >> (64 - self.segment_bits)], hashed
+
+    def __len__(self):
+        return int(sum(segment.count.value for segment in self.segments))
+
+    def __contains__(self, key):
+        segment, hashed = self._locate(key)
+        with segment.lock:
+            mapping, offset, mask = segment.mapping()
+            return segment.find(mapping, offset, mask, key, hashed & mask)[1]
+
+    def get(self, key, default=None):
+        """ Returns the value stored for key, or default if there is none.
+        """
+        segment, hashed = self._locate(key)
+        with segment.lock:
+            mapping, offset, mask = segment.mapping()
+            _, found, value = segment.find(mapping, offset, mask, key, hashed & mask)
+        if found:
+            return value
+        return default
+
+    def __getitem__(self, key):
+        segment, hashed = self._locate(key)
+        with segment.lock:
+            mapping, offset, mask = segment.mapping()
+            _, found, value = segment.find(mapping, offset, mask, key, hashed & mask)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.modify(key, lambda _: value)
+
+    def modify(self, key, func, default=None):
+        """ Atomically replaces the value stored for key by func(value). If
+        key is not in the table, func(default) is stored.
+
+        :param int key: the key whose value should be modified
+        :param func: function computing the new value from the old one
+        :param optional default: value passed to func if key is not in the table. default = None
+        :return: the new value stored for key
+        :rtype: int
+        """
+        segment, hashed = self._locate(key)
+        with segment.lock:
+            mapping, offset, mask = segment.mapping()
+            index, found, value = segment.find(mapping, offset, mask, key, hashed & mask)
+            if found:
+                value = func(value)
+            else:
+                value = func(default)
+                if segment.used.value + 1 > self.max_load * (mask + 1):
+                    # grow the segment, unless most of the used slots are
+                    # just deleted ones
+                    if segment.count.value + 1 > self.max_load * (mask + 1) / 2:
+                        segment.rehash(2 * (mask + 1))
+                    else:
+                        segment.rehash(mask + 1)
+                    mapping, offset, mask = segment.mapping()
+                    index = segment.find(mapping, offset, mask, key, hashed & mask)[0]
+                state = slot.unpack_from(mapping, offset + index * slot.size)[0]
+                if state == EMPTY:
+                    segment.used.value += 1
+                segment.count.value += 1
+            slot.pack_into(mapping, offset + index * slot.size, FULL, key, value)
+        return value
+
+    def pop(self, key, *default):
+        """ Removes key from the table and returns its value. If key is not
+        in the table, default is returned if given, else a KeyError is raised.
+        """
+        segment, hashed = self._locate(key)
+        with segment.lock:
+            mapping, offset, mask = segment.mapping()
+            index, found, value = segment.find(mapping, offset, mask, key, hashed & mask)
+            if found:
+                slot.pack_into(mapping, offset + index * slot.size, DELETED, 0, 0)
+                segment.count.value -= 1
+                return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def save(self, writer):
+        """ Writes the table to a checkpoint, see sharedmemory.checkpoint.
+        The locks of all segments are held while copying the buffer, so
+        the copy is consistent, and released before writing it.
+
+        :param writer: writer of the checkpoint
+        """
+        writer.counter('segments', len(self.segments))
+        for segment in self.segments:
+            segment.lock.acquire()
+        try:
+            end = int(self.end.value)
+            data = self.buffer.ensure(end)[0:end]
+            for segment_num, segment in enumerate(self.segments):
+                segment_writer = writer.child('segment%i' % segment_num)
+                segment_writer.counter('offset', segment.offset.value)
+                segment_writer.counter('capacity', segment.capacity.value)
+                segment_writer.counter('count', segment.count.value)
+                segment_writer.counter('used', segment.used.value)
+        finally:
+            for segment in self.segments:
+                segment.lock.release()
+        writer.counter('end', end)
+        writer.data('slots', data, end)
+
+    def load(self, reader):
+        """ Restores the table from a checkpoint, see
+        sharedmemory.checkpoint. Must only be called on a new table, before
+        any process uses it.
+
+        :param reader: reader of the checkpoint
+        """
+        if reader.counter('segments') != len(self.segments):
+            msg = 'The checkpoint holds %i segments, but the table has %i.'
+            raise ValueError(msg % (reader.counter('segments'), len(self.segments)))
+        reader.load('slots', self.buffer)
+        self.end.value = reader.counter('end')
+        for segment_num, segment in enumerate(self.segments):
+            segment_reader = reader.child('segment%i' % segment_num)
+            segment.offset.value = segment_reader.counter('offset')
+            segment.capacity.value = segment_reader.counter('capacity')
+            segment.count.value = segment_reader.counter('count')
+            segment.used.value = segment_reader.counter('used')
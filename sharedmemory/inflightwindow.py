@@ -0,0 +1,51 @@
+from ctypes import c_longlong
+from multiprocessing import BoundedSemaphore, Lock
+from multiprocessing.sharedctypes import RawValue
+
+
+class SharedInFlightWindow(object):
+    """ Counts the queries executing at once over all connections of the
+    generator processes of a host and optionally bounds their number.
+    A connection acquires a slot of the window before sending a query and
+    releases it in the callback of the result. If all slots are taken,
+    acquiring blocks until a query finishes, which holds the QueryGenerator
+    back until the database catches up, instead of piling up requests in
+    the driver. This runs the load at a fixed concurrency, like the threads
+    of cassandra-stress do.
+
+    The window has to be created before the processes using it are forked.
+
+    :param optional int size: maximum number of queries executing at once, unlimited if None. default = None
+    """
+    def __init__(self, size=None):
+        if size is not None and size < 1:
+            raise ValueError('the in-flight window needs at least one slot')
+        self.size = size
+        if size is not None:
+            self.slots = BoundedSemaphore(size)
+        else:
+            self.slots = None
+        # number of queries executing, also counted without a bound
+        self.count = RawValue(c_longlong, 0)
+        self.lock = Lock()
+
+    def acquire(self):
+        """ Takes a slot for a query, waiting for one if all are taken.
+        """
+        if self.slots is not None:
+            self.slots.acquire()
+        with self.lock:
+            self.count.value += 1
+
+    def release(self):
+        """ Gives the slot of a finished query back.
+        """
+        with self.lock:
+            self.count.value -= 1
+        if self.slots is not None:
+            self.slots.release()
+
+    def in_flight(self):
+        """ Returns the number of queries executing, without locking.
+        """
+        return int(self.count.value)
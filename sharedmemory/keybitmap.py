@@ -0,0 +1,816 @@
+from ctypes import c_ulonglong
+from multiprocessing import Lock, RLock
+from multiprocessing.sharedctypes import RawValue
+from struct import Struct
+
+from sharedbuffer import SharedBuffer
+
+# bits stored for each seed
+IS_PRIMARY = 1
+WAS_UPDATED = 2
+WAS_DELETED = 4
+
+# number of seeds per block of the rank index
+RANK_BLOCK = 256
+# translation table mapping the flags of a seed to '\x01' if the seed is
+# primary and to '\x00' otherwise, used to count primary seeds in C
+primary_table = ''.join(chr(flags & IS_PRIMARY) for flags in xrange(256))
+
+# number of seeds per block of the live index
+LIVE_BLOCK = 64
+# initial number of blocks covered by the tree of the live index
+LIVE_TREE_BLOCKS = 1024
+# translation table mapping the flags of a seed to '\x01' if the seed was
+# not deleted and to '\x00' otherwise
+live_table = ''.join(chr(not flags & WAS_DELETED) for flags in xrange(256))
+
+# number of seeds per container of the compressed was_updated and
+# was_deleted planes and the size of a container in bytes
+CHUNK = 1 << 16
+CHUNK_BYTES = CHUNK / 8
+# number of seeds per block of the live index of compressed shards
+COMPRESSED_LIVE_BLOCK = 512
+# translation table mapping a byte to the number of its set bits
+popcount_table = ''.join(chr(bin(byte).count('1')) for byte in xrange(256))
+# maps a byte of the was_deleted plane to the string of its eight bits,
+# lowest bit first, holding '\x01' for seeds that were not deleted
+live_bits = [''.join(chr(not byte >> bit & 1) for bit in xrange(8))
+             for byte in xrange(256)]
+
+uint32 = Struct('<I')
+uint64 = Struct('<Q')
+
+
+def check_seed_base(reader, seed_base):
+    """ Raises a ValueError if a checkpoint was saved with another seed
+    base.
+
+    :param reader: reader of the checkpoint
+    :param int seed_base: the seed base of the restored key structure
+    """
+    saved = reader.counter('seed base')
+    if saved != seed_base:
+        msg = 'The checkpoint holds the seeds from %i on, but the seed base is %i.'
+        raise ValueError(msg % (saved, seed_base))
+
+
+class NoLock(object):
+    """ Stand-in for a lock that isn't needed, e.g. the lock of a shard
+    only a single process appends to.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class KeyShard(object):
+    """ The seeds of a SharedKeyBitmap belonging to one shard. Seeds are
+    addressed by their index within the shard, the global seed is computed
+    by SharedKeyBitmap.seed().
+
+    Appending is not locked by the shard itself: processes sharing a shard
+    have to hold its lock while appending. If the shard is exclusive to a
+    single process, its lock is a NoLock.
+
+    Besides the flags, the shard keeps a rank/select index over its primary
+    seeds, maintained while appending:
+        * select: the indices of all primary seeds in the order they were
+          appended, so the j-th primary seed is a single lookup,
+        * rank: for every block of RANK_BLOCK seeds, the number of primary
+          seeds before the block. The number of primary seeds before any
+          seed is that count plus the primary seeds counted within the
+          block, which is done in C by translating and counting the flags.
+    It costs 8 bytes per primary seed and 8 bytes per RANK_BLOCK seeds.
+
+    Finally, the shard keeps an index of the seeds that were not deleted,
+    i.e. the live seeds: a Fenwick tree holding the number of deleted seeds
+    per block of LIVE_BLOCK seeds. As every block holds LIVE_BLOCK seeds,
+    the number of live seeds covered by a node of the tree follows from the
+    number of deleted ones, so appending a seed never touches the tree and
+    the n-th live seed is found in O(log n) steps, no matter how many seeds
+    were deleted. The tree costs 8 bytes per LIVE_BLOCK seeds and doubles
+    its size whenever a seed beyond its range is deleted.
+
+    :param int initial_seeds: number of seeds space is allocated for on creation
+    :param bool exclusive: whether only a single process appends to the shard
+    """
+    # number of seeds per block of the live index
+    live_block = LIVE_BLOCK
+
+    def __init__(self, initial_seeds, exclusive):
+        # number of seeds appended so far, i.e. the high-water mark
+        self.seeds = RawValue(c_ulonglong, 0)
+        # number of primary seeds
+        self.primary_count = RawValue(c_ulonglong, 0)
+        self.init_storage(initial_seeds)
+        # number of primary seeds before each block of RANK_BLOCK seeds
+        self.ranks = SharedBuffer(initial_seeds / RANK_BLOCK * uint64.size)
+        # Fenwick tree of the deleted seeds per block, the number of blocks
+        # it covers and the number of deleted seeds. The tree is 1-based,
+        # hence it needs one more node than it covers blocks.
+        self.tree = SharedBuffer((LIVE_TREE_BLOCKS + 1) * uint64.size)
+        self.tree_blocks = RawValue(c_ulonglong, LIVE_TREE_BLOCKS)
+        self.deleted = RawValue(c_ulonglong, 0)
+        self.tree_lock = Lock()
+        # Lock for appending seeds. It is reentrant, so the insert path of
+        # the WorkloadGenerator can hold it while determining the flags of a
+        # new seed and then append the seed.
+        if exclusive:
+            self.lock = NoLock()
+        else:
+            self.lock = RLock()
+
+    def init_storage(self, initial_seeds):
+        """ Creates the buffers holding the flags of the seeds and the
+        indices of the primary seeds.
+        """
+        self.flags = SharedBuffer(initial_seeds)
+        self.primaries = SharedBuffer(initial_seeds)
+
+    def __len__(self):
+        return int(self.seeds.value)
+
+    def get(self, index):
+        """ Returns the flags of the seed with the given index as an int.
+        """
+        flags = self.flags
+        if index >= flags.mapped:
+            flags.ensure(index + 1)
+        return ord(flags.map[index])
+
+    def is_primary(self, index):
+        return bool(self.get(index) & IS_PRIMARY)
+
+    def set_flag(self, index, flag):
+        """ Sets a bit of an already appended seed. This is a
+        read-modify-write, so the caller has to hold the stripe lock of the
+        seed, see SharedKeyBitmap.stripe().
+
+        :param int index: index of the seed whose bit should be set
+        :param int flag: WAS_UPDATED or WAS_DELETED
+        :return: the flags of the seed before setting the bit
+        :rtype: int
+        """
+        mapping = self.flags.ensure(index + 1)
+        flags = ord(mapping[index])
+        mapping[index] = chr(flags | flag)
+        return flags
+
+    def live_seeds(self, start, end):
+        """ Returns a string holding '\\x01' for every seed from start to end
+        that was not deleted and '\\x00' for every deleted one.
+        """
+        flags = self.flags
+        if end > flags.mapped:
+            flags.ensure(end)
+        return flags.map[start:end].translate(live_table)
+
+    def rank(self, index):
+        """ Returns the number of primary seeds with an index lower than
+        index. index must be lower than the number of seeds.
+
+        :param int index: index of a seed within the shard
+        :return: number of primary seeds before that seed
+        :rtype: int
+        """
+        block, offset = divmod(index, RANK_BLOCK)
+        ranks = self.ranks
+        if (block + 1) * uint64.size > ranks.mapped:
+            ranks.ensure((block + 1) * uint64.size)
+        rank = uint64.unpack_from(ranks.map, block * uint64.size)[0]
+        if offset:
+            flags = self.flags
+            if index > flags.mapped:
+                flags.ensure(index)
+            start = index - offset
+            rank += flags.map[start:index].translate(primary_table).count('\x01')
+        return int(rank)
+
+    def select(self, rank):
+        """ Returns the index of the primary seed with the given rank, i.e.
+        the index of the (rank+1)-th primary seed.
+
+        :param int rank: number of primary seeds before the wanted one
+        :return: index of the primary seed within the shard
+        :rtype: int
+        """
+        primaries = self.primaries
+        offset = rank * uint64.size
+        if offset + uint64.size > primaries.mapped:
+            primaries.ensure(offset + uint64.size)
+        return int(uint64.unpack_from(primaries.map, offset)[0])
+
+    def live(self):
+        """ Returns the number of seeds that were not deleted.
+        """
+        deleted = self.deleted.value
+        return int(self.seeds.value - deleted)
+
+    def count_deletion(self, index):
+        """ Adds a deleted seed to the live index. Every seed must only be
+        counted once.
+
+        :param int index: index of the deleted seed
+        """
+        with self.tree_lock:
+            self.add_deletions(index // self.live_block, 1)
+
+    def add_deletions(self, block, deleted):
+        """ Adds deleted seeds of a block to the tree of the live index. The
+        caller has to hold the tree lock.
+
+        :param int block: number of the block holding the seeds
+        :param int deleted: number of deleted seeds
+        """
+        blocks = int(self.tree_blocks.value)
+        while block >= blocks:
+            # Double the range of the tree. The new root covers the old
+            # tree, all other new nodes cover only new blocks.
+            mapping = self.tree.ensure((2 * blocks + 1) * uint64.size)
+            root = uint64.unpack_from(mapping, blocks * uint64.size)[0]
+            uint64.pack_into(mapping, 2 * blocks * uint64.size, root)
+            blocks *= 2
+            self.tree_blocks.value = blocks
+        mapping = self.tree.ensure((blocks + 1) * uint64.size)
+        node = block + 1
+        while node <= blocks:
+            offset = node * uint64.size
+            count = uint64.unpack_from(mapping, offset)[0]
+            uint64.pack_into(mapping, offset, count + deleted)
+            node += node & -node
+        self.deleted.value += deleted
+
+    def deleted_blocks(self):
+        """ Yields the number of every block of the live index that holds
+        deleted seeds, together with the number of deleted seeds in it.
+        """
+        seeds = len(self)
+        live_block = self.live_block
+        # translate large ranges at once and skip them if nothing in them
+        # was deleted
+        step = live_block * 16384
+        for start in xrange(0, seeds, step):
+            live = self.live_seeds(start, min(start + step, seeds))
+            if '\x00' not in live:
+                continue
+            for offset in xrange(0, len(live), live_block):
+                deleted = live.count('\x00', offset, offset + live_block)
+                if deleted:
+                    yield (start + offset) // live_block, deleted
+
+    def rebuild_live_index(self):
+        """ Recomputes the live index from the was_deleted bits. The tree
+        has to be empty, i.e. this is only done after loading a shard.
+        """
+        with self.tree_lock:
+            for block, deleted in self.deleted_blocks():
+                self.add_deletions(block, deleted)
+
+    def save(self, writer):
+        """ Writes the shard to a checkpoint, see sharedmemory.checkpoint.
+        Seeds appended while saving are left out. The live index is not
+        saved, it is rebuilt from the was_deleted bits when loading.
+
+        :param writer: writer of the checkpoint
+        """
+        seeds = len(self)
+        # The number of primary seeds might already include seeds appended
+        # after reading the number of seeds, so compute it from the index.
+        if seeds > 0:
+            primary_count = self.rank(seeds - 1) + self.is_primary(seeds - 1)
+        else:
+            primary_count = 0
+        writer.counter('seeds', seeds)
+        writer.counter('primary_count', primary_count)
+        blocks = (seeds + RANK_BLOCK - 1) // RANK_BLOCK
+        writer.data('ranks', self.ranks, blocks * uint64.size)
+        self.save_storage(writer, seeds, primary_count)
+
+    def save_storage(self, writer, seeds, primary_count):
+        """ Writes the flags and indices of the primary seeds to a
+        checkpoint.
+        """
+        writer.data('flags', self.flags, seeds)
+        writer.data('primaries', self.primaries, primary_count * uint64.size)
+
+    def load(self, reader):
+        """ Restores the shard from a checkpoint, see sharedmemory.checkpoint.
+        Must only be called on a new shard, before any process uses it.
+
+        :param reader: reader of the checkpoint
+        """
+        reader.load('ranks', self.ranks)
+        self.load_storage(reader)
+        self.primary_count.value = reader.counter('primary_count')
+        self.seeds.value = reader.counter('seeds')
+        self.rebuild_live_index()
+
+    def load_storage(self, reader):
+        """ Restores the flags and indices of the primary seeds from a
+        checkpoint.
+        """
+        reader.load('flags', self.flags)
+        reader.load('primaries', self.primaries)
+
+    def nth_live(self, n):
+        """ Returns the index of the n-th live seed. If seeds are deleted
+        concurrently, there might be no such seed anymore.
+
+        :param int n: number of the seed, should be lower than self.live()
+        :return: the index of the seed, or None if there is no such seed
+        :rtype: int or None
+        """
+        seeds = len(self)
+        # Descend the tree to find the block holding the seed. Blocks beyond
+        # the range of the tree don't hold any deleted seeds.
+        blocks = int(self.tree_blocks.value)
+        tree = self.tree
+        if (blocks + 1) * uint64.size > tree.mapped:
+            tree.ensure((blocks + 1) * uint64.size)
+        mapping = tree.map
+        block = 0
+        # start with the largest power of two not above the number of
+        # blocks, never probing nodes beyond the tree
+        step = 1
+        while step * 2 <= blocks:
+            step *= 2
+        live_block = self.live_block
+        while step:
+            if block + step <= blocks:
+                live = step * live_block - uint64.unpack_from(mapping, (block + step) * uint64.size)[0]
+                if n >= live:
+                    block += step
+                    n -= live
+            step >>= 1
+        # seeds beyond the tree are all live
+        block += n // live_block
+        n %= live_block
+
+        # find the seed within the block
+        start = block * live_block
+        end = min(start + live_block, seeds)
+        if start + n >= end:
+            return None
+        live = self.live_seeds(start, end)
+        position = -1
+        for _ in xrange(n + 1):
+            position = live.find('\x01', position + 1)
+            if position < 0:
+                return None
+        return start + position
+
+    def append(self, is_primary):
+        """ Appends a new seed to the shard.
+
+        :param bool is_primary: whether the seed generated a completely new item
+        :return: the index of the appended seed within the shard
+        :rtype: int
+        """
+        index = int(self.seeds.value)
+        primary_count = int(self.primary_count.value)
+        # start a new block of the rank index if necessary
+        block, offset = divmod(index, RANK_BLOCK)
+        if offset == 0:
+            mapping = self.ranks.ensure((block + 1) * uint64.size)
+            uint64.pack_into(mapping, block * uint64.size, primary_count)
+        mapping = self.flags.ensure(index + 1)
+        if is_primary:
+            mapping[index] = chr(IS_PRIMARY)
+            offset = primary_count * uint64.size
+            mapping = self.primaries.ensure(offset + uint64.size)
+            uint64.pack_into(mapping, offset, index)
+            self.primary_count.value = primary_count + 1
+        else:
+            mapping[index] = chr(0)
+        # publish the seed only after its flags and indices are written
+        self.seeds.value = index + 1
+        return index
+
+
+class CompressedKeyShard(KeyShard):
+    """ KeyShard storing the bits of its seeds in three separate planes:
+        * is_primary is packed into one bit per seed. It is only written
+          while appending, so it never needs a lock.
+        * was_updated and was_deleted are mostly zero, so they are divided
+          into containers of CHUNK seeds in the style of roaring bitmaps.
+          A container is allocated when the first bit within it is set, a
+          missing container means all its bits are zero.
+    The indices of the primary seeds are not stored, select() searches the
+    rank index instead, which makes it O(log n) instead of O(1). The live
+    index uses blocks of COMPRESSED_LIVE_BLOCK seeds.
+    """
+    live_block = COMPRESSED_LIVE_BLOCK
+
+    def init_storage(self, initial_seeds):
+        """ Creates the buffers holding the bit planes.
+        """
+        self.primary_bits = SharedBuffer(initial_seeds / 8)
+        # For every chunk of seeds, the number of the container of the
+        # was_updated plane and the one of the was_deleted plane, plus one.
+        # Zero means there is no container.
+        self.directory = SharedBuffer()
+        self.containers = SharedBuffer(CHUNK_BYTES)
+        self.container_count = RawValue(c_ulonglong, 0)
+        self.container_lock = Lock()
+
+    def container(self, plane, chunk, create=False):
+        """ Returns the offset of a container within self.containers.
+
+        :param int plane: 0 for the was_updated plane, 1 for the was_deleted plane
+        :param int chunk: number of the chunk of seeds
+        :param optional bool create: whether to create the container if it doesn't exist. default = False
+        :return: offset of the container or None if it doesn't exist
+        :rtype: int or None
+        """
+        offset = (2 * chunk + plane) * uint32.size
+        directory = self.directory
+        if offset + uint32.size > directory.mapped:
+            if offset + uint32.size > directory.size.value and not create:
+                return None
+            directory.ensure(offset + uint32.size)
+        number = uint32.unpack_from(directory.map, offset)[0]
+        if number == 0:
+            if not create:
+                return None
+            with self.container_lock:
+                number = uint32.unpack_from(directory.map, offset)[0]
+                if number == 0:
+                    number = int(self.container_count.value) + 1
+                    self.containers.ensure(number * CHUNK_BYTES)
+                    self.container_count.value = number
+                    uint32.pack_into(directory.map, offset, number)
+        return (number - 1) * CHUNK_BYTES
+
+    def plane_bit(self, plane, index):
+        """ Returns the bit of the seed with the given index in a plane.
+        """
+        chunk, position = divmod(index, CHUNK)
+        offset = self.container(plane, chunk)
+        if offset is None:
+            return 0
+        offset += position >> 3
+        containers = self.containers
+        if offset >= containers.mapped:
+            containers.ensure(offset + 1)
+        return ord(containers.map[offset]) >> (position & 7) & 1
+
+    def get(self, index):
+        primary_bits = self.primary_bits
+        if index >> 3 >= primary_bits.mapped:
+            primary_bits.ensure((index >> 3) + 1)
+        flags = ord(primary_bits.map[index >> 3]) >> (index & 7) & 1
+        if self.plane_bit(0, index):
+            flags |= WAS_UPDATED
+        if self.plane_bit(1, index):
+            flags |= WAS_DELETED
+        return flags
+
+    def set_flag(self, index, flag):
+        old_flags = self.get(index)
+        chunk, position = divmod(index, CHUNK)
+        plane = 1 if flag == WAS_DELETED else 0
+        offset = self.container(plane, chunk, create=True) + (position >> 3)
+        mapping = self.containers.ensure(offset + 1)
+        mapping[offset] = chr(ord(mapping[offset]) | 1 << (position & 7))
+        return old_flags
+
+    def live_seeds(self, start, end):
+        # live blocks never span multiple chunks
+        chunk, position = divmod(start, CHUNK)
+        offset = self.container(1, chunk)
+        if offset is None:
+            return '\x01' * (end - start)
+        offset += position >> 3
+        length = (end - start + 7) >> 3
+        containers = self.containers
+        if offset + length > containers.mapped:
+            containers.ensure(offset + length)
+        deleted = containers.map[offset:offset + length]
+        return ''.join([live_bits[ord(byte)] for byte in deleted])[:end - start]
+
+    def rank(self, index):
+        block, offset = divmod(index, RANK_BLOCK)
+        ranks = self.ranks
+        if (block + 1) * uint64.size > ranks.mapped:
+            ranks.ensure((block + 1) * uint64.size)
+        rank = uint64.unpack_from(ranks.map, block * uint64.size)[0]
+        if offset:
+            primary_bits = self.primary_bits
+            if (index >> 3) + 1 > primary_bits.mapped:
+                primary_bits.ensure((index >> 3) + 1)
+            mapping = primary_bits.map
+            start = (index - offset) >> 3
+            # count the bits of all full bytes in C, then the remaining ones
+            rank += sum(bytearray(mapping[start:index >> 3].translate(popcount_table)))
+            rank += bin(ord(mapping[index >> 3]) & ((1 << (index & 7)) - 1)).count('1')
+        return int(rank)
+
+    def select(self, rank):
+        # search the last block with less primary seeds before it than rank
+        ranks = self.ranks
+        blocks = (len(self) + RANK_BLOCK - 1) // RANK_BLOCK
+        if blocks * uint64.size > ranks.mapped:
+            ranks.ensure(blocks * uint64.size)
+        low = 0
+        high = blocks - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if uint64.unpack_from(ranks.map, middle * uint64.size)[0] <= rank:
+                low = middle
+            else:
+                high = middle - 1
+        rank -= uint64.unpack_from(ranks.map, low * uint64.size)[0]
+
+        # search the seed within the block
+        start = low * RANK_BLOCK >> 3
+        primary_bits = self.primary_bits
+        if start + RANK_BLOCK / 8 > primary_bits.mapped:
+            primary_bits.ensure(start + RANK_BLOCK / 8)
+        for position, byte in enumerate(bytearray(primary_bits.map[start:start + RANK_BLOCK / 8])):
+            count = ord(popcount_table[byte])
+            if rank < count:
+                for bit in xrange(8):
+                    if byte >> bit & 1:
+                        if rank == 0:
+                            return ((start + position) << 3) + bit
+                        rank -= 1
+            rank -= count
+        raise IndexError('rank out of range')
+
+    def deleted_blocks(self):
+        seeds = len(self)
+        block_bytes = self.live_block / 8
+        # only chunks with a container of the was_deleted plane hold
+        # deleted seeds
+        for chunk in xrange((seeds + CHUNK - 1) // CHUNK):
+            offset = self.container(1, chunk)
+            if offset is None:
+                continue
+            mapping = self.containers.ensure(offset + CHUNK_BYTES)
+            counts = mapping[offset:offset + CHUNK_BYTES].translate(popcount_table)
+            for position in xrange(0, CHUNK_BYTES, block_bytes):
+                deleted = sum(bytearray(counts[position:position + block_bytes]))
+                if deleted:
+                    yield (chunk * CHUNK + position * 8) // self.live_block, deleted
+
+    def save_storage(self, writer, seeds, primary_count):
+        writer.data('primary_bits', self.primary_bits, (seeds + 7) // 8)
+        # Containers are counted before they are entered into the
+        # directory, so save the containers first. Entries of containers
+        # created in between are dropped when loading.
+        containers = int(self.container_count.value)
+        writer.counter('container_count', containers)
+        writer.data('containers', self.containers, containers * CHUNK_BYTES)
+        writer.data('directory', self.directory, self.directory.size.value)
+
+    def load_storage(self, reader):
+        reader.load('primary_bits', self.primary_bits)
+        reader.load('containers', self.containers)
+        length = reader.load('directory', self.directory)
+        containers = reader.counter('container_count')
+        self.container_count.value = containers
+        # drop the bits of seeds appended while saving
+        seeds = reader.counter('seeds')
+        if seeds & 7:
+            mapping = self.primary_bits.ensure((seeds >> 3) + 1)
+            mapping[seeds >> 3] = chr(ord(mapping[seeds >> 3]) & ((1 << (seeds & 7)) - 1))
+        # drop the containers created while saving
+        mapping = self.directory.map
+        for offset in xrange(0, length, uint32.size):
+            if uint32.unpack_from(mapping, offset)[0] > containers:
+                uint32.pack_into(mapping, offset, 0)
+
+    def append(self, is_primary):
+        index = int(self.seeds.value)
+        primary_count = int(self.primary_count.value)
+        # start a new block of the rank index if necessary
+        block, offset = divmod(index, RANK_BLOCK)
+        if offset == 0:
+            mapping = self.ranks.ensure((block + 1) * uint64.size)
+            uint64.pack_into(mapping, block * uint64.size, primary_count)
+        mapping = self.primary_bits.ensure((index >> 3) + 1)
+        if is_primary:
+            mapping[index >> 3] = chr(ord(mapping[index >> 3]) | 1 << (index & 7))
+            self.primary_count.value = primary_count + 1
+        # publish the seed only after its bits and indices are written
+        self.seeds.value = index + 1
+        return index
+
+
+class SharedKeyBitmap(object):
+    """ Key state of a table, shared between all generator processes.
+
+    For every seed used by a WorkloadGenerator three bits are stored:
+        * is_primary: the seed generated a completely new item, i.e. a new
+          partition key,
+        * was_updated: the item generated by the seed was updated, so the
+          seed of the last update can be found in the update_dict,
+        * was_deleted: the item generated by the seed was deleted.
+    The bits of each seed are kept in one byte of a SharedBuffer, hence all
+    processes read and write them directly without any round trip to a
+    manager process.
+
+    The seeds are divided into shards by their remainder modulo the number
+    of shards, i.e. the seed with index i in shard s is s + i * shards,
+    plus the seed base. Hosts generating load for the same tables get
+    different seed bases, so their seeds never meet.
+    Every shard has its own high-water mark, so the seeds in use are known
+    by all processes. If the bitmap is exclusive, each shard is owned by a
+    single WorkloadGenerator, which appends to it without any lock.
+    Seeds are appended atomically: the flags of a new seed are written
+    before the high-water mark of its shard is increased, so readers never
+    see a seed whose flags are not yet valid and need no lock at all.
+
+    If the bitmap is compressed, the bits are kept in the separate planes
+    of a CompressedKeyShard instead of one byte per seed.
+
+    Memory cost per million seeds, not counting the update_dict:
+        * uncompressed: 977 KB of flags, 31 KB of rank index, 122 KB of
+          live index, plus 8 bytes per primary seed (e.g. 8 KB for a chance
+          of .001, 781 KB for a chance of .1)
+        * compressed: 122 KB for is_primary, 31 KB of rank index, 15 KB of
+          live index, plus 8 KB for each chunk of 65536 seeds holding an
+          updated seed and for each one holding a deleted seed, i.e. up to
+          244 KB if updates and deletions are spread over all seeds.
+
+    :param optional int shards: number of shards. default = 1
+    :param optional bool exclusive: whether every shard is appended to by a single process only. default = False
+    :param optional bool compressed: whether to store the bits in compressed planes. default = False
+    :param optional int initial_seeds: number of seeds space is allocated for on creation in each shard. default = 2**16
+    :param optional int stripes: number of locks guarding the flag updates of existing seeds. default = 64
+    :param optional int seed_base: the lowest seed. default = 0
+    """
+    def __init__(self, shards=1, exclusive=False, compressed=False,
+                 initial_seeds=1 << 16, stripes=64, seed_base=0):
+        if compressed:
+            shard_class = CompressedKeyShard
+        else:
+            shard_class = KeyShard
+        self.shards = [shard_class(initial_seeds, exclusive)
+                       for _ in xrange(shards)]
+        # Setting a bit of an existing seed is a read-modify-write of its
+        # byte, so concurrent updates of the same seed have to be
+        # serialized. Striping the locks keeps the contention low.
+        self.stripes = [Lock() for _ in xrange(stripes)]
+        self.seed_base = seed_base
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def seed(self, shard, index):
+        """ Returns the seed with the given index within shard.
+        """
+        return self.seed_base + shard + index * len(self.shards)
+
+    def locate(self, seed):
+        """ Returns the number of the shard of seed and the index of seed
+        within that shard.
+
+        :rtype: tuple of int
+        """
+        index, shard = divmod(seed - self.seed_base, len(self.shards))
+        return shard, index
+
+    def live(self):
+        """ Returns the number of seeds in use that were not deleted.
+        """
+        return sum(shard.live() for shard in self.shards)
+
+    def nth_live(self, n):
+        """ Returns the n-th seed in use that was not deleted, counting the
+        live seeds of each shard one after another. If seeds are deleted
+        concurrently, there might be no such seed anymore.
+
+        :param int n: number of the seed, should be lower than self.live()
+        :return: the n-th live seed, or None if there is no such seed
+        :rtype: int or None
+        """
+        for shard_num, shard in enumerate(self.shards):
+            live = shard.live()
+            if n < live:
+                index = shard.nth_live(n)
+                if index is None:
+                    return None
+                return self.seed(shard_num, index)
+            n -= live
+        return None
+
+    def nth_live_by_age(self, n):
+        """ Returns the live seed with age rank n, 0 being the oldest one.
+        The shards grow side by side, so their live seeds are interleaved:
+        age rank n is taken as the (n // shards)-th live seed of shard
+        n % shards, or the newest one of that shard if it holds fewer.
+
+        :param int n: age rank of the seed, should be lower than self.live()
+        :return: the seed, or None if there is no such seed
+        :rtype: int or None
+        """
+        shard_num = n % len(self.shards)
+        shard = self.shards[shard_num]
+        live = shard.live()
+        if live == 0:
+            return self.nth_live(n)
+        index = shard.nth_live(min(n // len(self.shards), live - 1))
+        if index is None:
+            return None
+        return self.seed(shard_num, index)
+
+    def __getitem__(self, seed):
+        """ Returns the bits stored for seed.
+
+        :param int seed: the seed to look up
+        :return: is_primary, was_updated, was_deleted
+        :rtype: tuple of bool
+        """
+        shard, index = self.locate(seed)
+        flags = self.shards[shard].get(index)
+        return (bool(flags & IS_PRIMARY), bool(flags & WAS_UPDATED),
+                bool(flags & WAS_DELETED))
+
+    def is_primary(self, seed):
+        shard, index = self.locate(seed)
+        return bool(self.shards[shard].get(index) & IS_PRIMARY)
+
+    def was_updated(self, seed):
+        shard, index = self.locate(seed)
+        return bool(self.shards[shard].get(index) & WAS_UPDATED)
+
+    def was_deleted(self, seed):
+        shard, index = self.locate(seed)
+        return bool(self.shards[shard].get(index) & WAS_DELETED)
+
+    def append(self, is_primary, shard=0):
+        """ Appends a new seed to a shard while holding the lock of the
+        shard.
+
+        :param bool is_primary: whether the seed generated a completely new item
+        :param optional int shard: the shard to append to. default = 0
+        :return: the appended seed
+        :rtype: int
+        """
+        key_shard = self.shards[shard]
+        with key_shard.lock:
+            return self.seed(shard, key_shard.append(is_primary))
+
+    def stripe(self, shard, index):
+        """ Returns the lock guarding the flag updates of the seed with the
+        given index within shard. Seeds whose bits might share a byte use
+        the same lock.
+        """
+        return self.stripes[(index // 8 * len(self.shards) + shard) % len(self.stripes)]
+
+    def set_flag(self, seed, flag):
+        """ Sets a bit of an already appended seed.
+
+        :param int seed: the seed whose bit should be set
+        :param int flag: WAS_UPDATED or WAS_DELETED
+        :return: the flags of the seed before setting the bit
+        :rtype: int
+        """
+        shard, index = self.locate(seed)
+        with self.stripe(shard, index):
+            return self.shards[shard].set_flag(index, flag)
+
+    def set_updated(self, seed):
+        self.set_flag(seed, WAS_UPDATED)
+
+    def set_deleted(self, seed):
+        """ Sets the was_deleted bit of an already appended seed and removes
+        the seed from the live index.
+
+        :param int seed: the deleted seed
+        """
+        shard_num, index = self.locate(seed)
+        shard = self.shards[shard_num]
+        with self.stripe(shard_num, index):
+            if not shard.set_flag(index, WAS_DELETED) & WAS_DELETED:
+                shard.count_deletion(index)
+
+    def save(self, writer):
+        """ Writes the bitmap to a checkpoint, see sharedmemory.checkpoint.
+
+        :param writer: writer of the checkpoint
+        """
+        writer.counter('shards', len(self.shards))
+        writer.counter('compressed', isinstance(self.shards[0], CompressedKeyShard))
+        writer.counter('seed base', self.seed_base)
+        for shard_num, shard in enumerate(self.shards):
+            shard.save(writer.child('shard%i' % shard_num))
+
+    def load(self, reader):
+        """ Restores the bitmap from a checkpoint, see
+        sharedmemory.checkpoint. Must only be called on a new bitmap, before
+        any process uses it.
+
+        :param reader: reader of the checkpoint
+        """
+        if reader.counter('shards') != len(self.shards):
+            msg = 'The checkpoint holds %i shards, but the bitmap has %i.'
+            raise ValueError(msg % (reader.counter('shards'), len(self.shards)))
+        if reader.counter('compressed') != isinstance(self.shards[0], CompressedKeyShard):
+            raise ValueError('The checkpoint and the bitmap differ in compression.')
+        check_seed_base(reader, self.seed_base)
+        for shard_num, shard in enumerate(self.shards):
+            shard.load(reader.child('shard%i' % shard_num))
@@ -0,0 +1,112 @@
+from ctypes import c_ulonglong
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
+
+from keybitmap import NoLock, check_seed_base
+
+
+class StatelessKeySpace(object):
+    """ Key state of a table for the stateless key model of the
+    WorkloadGenerator. Nothing is stored per seed: the seeds are divided
+    into shards like in the SharedKeyBitmap, and within each shard every
+    fanout consecutive seeds form a partition whose partition seed is the
+    first of them. Only the number of seeds per shard is kept, so the key
+    space needs no memory per seed and can grow to any size. All seeds are
+    offset by the seed base, like in the SharedKeyBitmap.
+
+    :param optional int fanout: number of seeds per partition. default = 1
+    :param optional int shards: number of shards. default = 1
+    :param optional bool exclusive: whether every shard is appended to by a single process only. default = False
+    :param optional int seed_base: the lowest seed. default = 0
+    """
+    def __init__(self, fanout=1, shards=1, exclusive=False, seed_base=0):
+        self.fanout = fanout
+        self.seed_base = seed_base
+        # number of seeds used so far in each shard
+        self.counts = RawArray(c_ulonglong, shards)
+        # incrementing the count of a shard only needs a lock if the shard
+        # is shared by multiple processes
+        if exclusive:
+            self.locks = [NoLock() for _ in xrange(shards)]
+        else:
+            self.locks = [Lock() for _ in xrange(shards)]
+
+    def __len__(self):
+        return int(sum(self.counts))
+
+    def seed(self, shard, index):
+        """ Returns the seed with the given index within shard.
+        """
+        return self.seed_base + shard + index * len(self.counts)
+
+    def append(self, shard=0):
+        """ Appends a new seed to a shard.
+
+        :param optional int shard: the shard to append to. default = 0
+        :return: the appended seed
+        :rtype: int
+        """
+        with self.locks[shard]:
+            index = int(self.counts[shard])
+            self.counts[shard] = index + 1
+        return self.seed(shard, index)
+
+    def nth(self, n):
+        """ Returns the n-th seed in use, counting the seeds of each shard
+        one after another.
+
+        :param int n: number of the seed, has to be lower than len(self)
+        :return: the n-th seed
+        :rtype: int
+        """
+        for shard, seeds in enumerate(self.counts):
+            if n < seeds:
+                return self.seed(shard, n)
+            n -= seeds
+        raise IndexError('seed number out of range')
+
+    def nth_by_age(self, n):
+        """ Returns the seed with age rank n, 0 being the oldest one, taking
+        the seeds of the shards as interleaved like
+        SharedKeyBitmap.nth_live_by_age() does.
+
+        :param int n: age rank of the seed, has to be lower than len(self)
+        :return: the seed
+        :rtype: int
+        """
+        shard = n % len(self.counts)
+        seeds = int(self.counts[shard])
+        if seeds == 0:
+            return self.nth(n)
+        return self.seed(shard, min(n // len(self.counts), seeds - 1))
+
+    def partition(self, seed):
+        """ Returns the partition seed of seed, i.e. the first seed of the
+        group of fanout seeds within its shard that seed belongs to.
+        """
+        index, shard = divmod(seed - self.seed_base, len(self.counts))
+        return self.seed(shard, index - index % self.fanout)
+
+    def save(self, writer):
+        """ Writes the key space to a checkpoint, see sharedmemory.checkpoint.
+
+        :param writer: writer of the checkpoint
+        """
+        writer.counter('fanout', self.fanout)
+        writer.counter('shards', len(self.counts))
+        writer.counter('seed base', self.seed_base)
+        for shard, seeds in enumerate(self.counts):
+            writer.counter('shard%i.seeds' % shard, seeds)
+
+    def load(self, reader):
+        """ Restores the key space from a checkpoint, see
+        sharedmemory.checkpoint.
+
+        :param reader: reader of the checkpoint
+        """
+        if reader.counter('fanout') != self.fanout or\
+                reader.counter('shards') != len(self.counts):
+            raise ValueError('The fanout or number of shards of the checkpoint differ.')
+        check_seed_base(reader, self.seed_base)
+        for shard in xrange(len(self.counts)):
+            self.counts[shard] = reader.counter('shard%i.seeds' % shard)
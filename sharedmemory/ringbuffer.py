@@ -0,0 +1,218 @@
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from ctypes import c_ulonglong
+from multiprocessing import Condition, Lock
+from multiprocessing.sharedctypes import RawArray
+from Queue import Empty, Full
+from struct import Struct
+from time import time
+
+from sharedbuffer import SharedBuffer
+
+# length prefix of a record
+length = Struct('<I')
+# length prefix telling the reader that the next record starts at offset 0
+WRAP = 0xFFFFFFFF
+
+# indices of the state of the ring buffer
+HEAD = 0    # offset of the next record to read
+TAIL = 1    # offset the next record is written to
+USED = 2    # bytes in use, including the ones skipped at the end when wrapping
+COUNT = 3   # number of records
+CLOSED = 4  # whether the ring was closed, see SharedRingBuffer.close()
+WAKEUPS = 5 # number of calls of SharedRingBuffer.interrupt()
+PUTS = 6    # number of items put into the ring so far
+GETS = 7    # number of items taken out of the ring so far
+
+
+class SharedRingBuffer(object):
+    """ Multi-producer, multi-consumer queue of items in a ring of shared
+    memory, a drop-in replacement for the queues of multiprocessing for the
+    queues between the generators.
+
+    Every item is pickled once by the process putting it and stored as a
+    record of a length prefix followed by the pickle. A record never wraps
+    around the end of the ring: if it doesn't fit in the space left at the
+    end, the rest of the ring is skipped. Unlike a manager's queue, no item
+    passes through another process, and unlike multiprocessing.Queue, no
+    feeder thread or pipe is involved. Writers and readers copy their
+    records while holding a single lock, which is cheap compared to the
+    pickling done outside of it. The number of records is kept in shared
+    memory, so qsize() only reads a counter.
+
+    The ring has to be created before the processes using it are forked.
+    The threads of a process may share it, too. Producers can wait for the
+    consumers to drain the ring with wait_below() instead of polling its
+    size, and closing or interrupting the ring ends all waits. The numbers
+    of items put and taken so far are counted for measuring throughput.
+
+    :param optional int capacity: size of the ring in bytes, the largest item has to be smaller. default = 2**24
+    """
+    def __init__(self, capacity=1 << 24):
+        self.capacity = capacity
+        self.buffer = SharedBuffer(capacity)
+        self.state = RawArray(c_ulonglong, 8)
+        self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+        self.not_full = Condition(self.lock)
+
+    def qsize(self):
+        """ Returns the number of items in the ring, without locking.
+        """
+        return int(self.state[COUNT])
+
+    def empty(self):
+        return self.state[COUNT] == 0
+
+    def put(self, item, block=True, timeout=None):
+        """ Puts an item into the ring, waiting for space if necessary.
+
+        :param item: a picklable object
+        :param optional bool block: whether to wait for space. default = True
+        :param optional float timeout: seconds to wait at most, forever if None. default = None
+        :raises Queue.Full: if there is no space for the item in time
+        """
+        data = dumps(item, HIGHEST_PROTOCOL)
+        size = length.size + len(data)
+        capacity = self.capacity
+        if size > capacity:
+            raise ValueError('item of %i bytes exceeds the capacity of the '
+                             'ring buffer' % len(data))
+        state = self.state
+        deadline = None
+        with self.lock:
+            while True:
+                tail = state[TAIL]
+                # the record goes to the beginning of the ring if it
+                # doesn't fit at the end, skipping the rest
+                wrap = tail + size > capacity
+                skipped = capacity - tail if wrap else 0
+                if state[USED] + skipped + size <= capacity:
+                    break
+                if not block or state[CLOSED]:
+                    raise Full
+                if timeout is not None:
+                    if deadline is None:
+                        deadline = time() + timeout
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise Full
+                    self.not_full.wait(remaining)
+                else:
+                    self.not_full.wait()
+            mapping = self.buffer.map
+            if wrap:
+                if skipped >= length.size:
+                    length.pack_into(mapping, tail, WRAP)
+                tail = 0
+            length.pack_into(mapping, tail, len(data))
+            mapping[tail + length.size:tail + size] = data
+            state[TAIL] = tail + size
+            state[USED] += skipped + size
+            state[COUNT] += 1
+            state[PUTS] += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item):
+        return self.put(item, False)
+
+    def get(self, block=True, timeout=None):
+        """ Removes and returns the oldest item of the ring, waiting for one
+        if necessary.
+
+        :param optional bool block: whether to wait for an item. default = True
+        :param optional float timeout: seconds to wait at most, forever if None. default = None
+        :raises Queue.Empty: if there is no item in time
+        """
+        state = self.state
+        capacity = self.capacity
+        deadline = None
+        with self.lock:
+            wakeups = state[WAKEUPS]
+            while state[COUNT] == 0:
+                if not block or state[CLOSED] or state[WAKEUPS] != wakeups:
+                    raise Empty
+                if timeout is not None:
+                    if deadline is None:
+                        deadline = time() + timeout
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise Empty
+                    self.not_empty.wait(remaining)
+                else:
+                    self.not_empty.wait()
+            mapping = self.buffer.map
+            head = state[HEAD]
+            skipped = 0
+            if capacity - head < length.size:
+                skipped = capacity - head
+                head = 0
+            else:
+                size = length.unpack_from(mapping, head)[0]
+                if size == WRAP:
+                    skipped = capacity - head
+                    head = 0
+            size = length.unpack_from(mapping, head)[0]
+            end = head + length.size + size
+            data = mapping[head + length.size:end]
+            count = state[COUNT] - 1
+            state[COUNT] = count
+            state[GETS] += 1
+            if count == 0:
+                # start over at the beginning, so fewer records wrap
+                state[HEAD] = state[TAIL] = state[USED] = 0
+            else:
+                state[HEAD] = end
+                state[USED] -= skipped + end - head
+            self.not_full.notify_all()
+        return loads(data)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def wait_below(self, size):
+        """ Waits until the ring holds at most size items. Every get() wakes
+        the waiting processes, so they use no CPU while the ring stays
+        full, but react right away when it is drained.
+
+        :param int size: number of items
+        :return: False if the wait ended because the ring was closed or interrupted
+        :rtype: bool
+        """
+        state = self.state
+        with self.lock:
+            wakeups = state[WAKEUPS]
+            while state[COUNT] > size:
+                if state[CLOSED] or state[WAKEUPS] != wakeups:
+                    return False
+                self.not_full.wait()
+        return True
+
+    def interrupt(self):
+        """ Ends the current waits in get() and wait_below() like close()
+        does, but the ring stays usable. Waits for space in put() go on, so
+        no item is lost. Used to make waiting processes check their
+        signals.
+        """
+        with self.lock:
+            self.state[WAKEUPS] += 1
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def counts(self):
+        """ Returns the numbers of items put into and taken out of the ring
+        so far.
+
+        :rtype: tuple of int
+        """
+        return int(self.state[PUTS]), int(self.state[GETS])
+
+    def close(self):
+        """ Closes the ring, ending all waits for space or items: blocking
+        calls of put() raise Queue.Full if there is no space and get()
+        raises Queue.Empty if there is no item. Items can still be taken
+        out.
+        """
+        with self.lock:
+            self.state[CLOSED] = 1
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
@@ -0,0 +1,112 @@
+import mmap
+import os
+from ctypes import c_ulonglong
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawValue
+from tempfile import mkstemp
+
+# bytes copied at once when loading a buffer from a file
+COPY_CHUNK = 1 << 20
+
+# Use the RAM-backed filesystem if it is available, so the operating system
+# never has to write the pages of the buffers back to disk.
+if os.path.isdir('/dev/shm'):
+    shm_dir = '/dev/shm'
+else:
+    shm_dir = None
+
+
+class SharedBuffer(object):
+    """ Growable byte buffer in shared memory.
+
+    The buffer is backed by a file mapped into memory. Unless a path is
+    given, the file is unlinked right after its creation, so it vanishes
+    as soon as the last process using it ends. All processes forked after
+    the creation of the buffer share its file descriptor, hence growing the
+    buffer in one process makes the new space available to all the others,
+    which remap the file lazily as soon as they access an offset beyond
+    their current mapping. The buffer never shrinks, so mappings created
+    before a growth stay valid.
+
+    :param optional int size: initial size of the buffer in bytes. default = mmap.PAGESIZE
+    :param optional string path: location of the backing file, the file will not be unlinked if given. default = None
+    """
+    def __init__(self, size=mmap.PAGESIZE, path=None):
+        if path is None:
+            self.fd, path = mkstemp(prefix='colt-', dir=shm_dir)
+            os.unlink(path)
+        else:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        self.path = path
+
+        # the size of the backing file, shared between all processes
+        self.size = RawValue(c_ulonglong, os.fstat(self.fd).st_size)
+        # lock guarding the growth of the backing file
+        self.lock = Lock()
+
+        # the mapping of this process and its size
+        self.map = None
+        self.mapped = 0
+        self.ensure(max(size, 1))
+
+    def ensure(self, size):
+        """ Makes sure that at least size bytes are mapped into the memory of
+        the calling process, growing the buffer if needed.
+
+        :param int size: number of bytes needed
+        :return: the mapping of the buffer
+        :rtype: mmap.mmap
+        """
+        if size > self.mapped:
+            if size > self.size.value:
+                self.grow(size)
+            self.remap()
+        return self.map
+
+    def grow(self, size):
+        """ Grows the backing file to at least size bytes. To keep the number
+        of growths low, the size is at least doubled.
+
+        :param int size: minimal size of the buffer in bytes
+        """
+        with self.lock:
+            old_size = self.size.value
+            if size <= old_size:
+                # another process was faster
+                return
+            new_size = max(size, 2 * old_size)
+            # round up to whole pages
+            new_size += -new_size % mmap.PAGESIZE
+            os.ftruncate(self.fd, new_size)
+            self.size.value = new_size
+
+    def remap(self):
+        """ Maps the whole backing file into the memory of the calling
+        process. The old mapping is left to the garbage collector, as it
+        may still be referenced.
+        """
+        size = self.size.value
+        self.map = mmap.mmap(self.fd, size)
+        self.mapped = size
+
+    def flush(self):
+        """ Writes all changes of the mapping back to the backing file.
+        """
+        if self.map is not None:
+            self.map.flush()
+
+    def load(self, path):
+        """ Copies the content of a file to the start of the buffer, growing
+        the buffer if needed.
+
+        :param string path: location of the file
+        :return: number of bytes copied
+        :rtype: int
+        """
+        length = os.path.getsize(path)
+        mapping = self.ensure(length)
+        with open(path, 'rb') as source:
+            for offset in xrange(0, length, COPY_CHUNK):
+                data = source.read(COPY_CHUNK)
+                mapping[offset:offset + len(data)] = data
+        return length
@@ -0,0 +1,71 @@
+from ctypes import c_double
+from math import log
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawValue
+from os import getpid
+from random import Random
+from time import time
+
+
+class SharedTokenBucket(object):
+    """ Token bucket shared by all QueryGenerators, limiting the queries to
+    a target rate for open-loop load. Tokens arrive at the target rate,
+    either evenly spaced or as a Poisson process, and every query takes
+    one, waiting for it if there is none yet.
+
+    Each token carries the time it arrived, which is the intended start of
+    the query taking it. The bucket holds any number of tokens, so if the
+    database or the generators fall behind, the queries go out back to back
+    until they catch up, but still report their intended start. Measuring
+    the response time from there includes the time a query waited for its
+    predecessors, which a closed loop leaves out (coordinated omission).
+
+    Only the arrival time of the next token is kept, in shared memory, so
+    the bucket has to be created before the processes using it are forked.
+
+    :param float rate: number of tokens per second
+    :param optional string arrivals: 'constant' or 'poisson'. default = 'constant'
+    """
+    def __init__(self, rate, arrivals='constant'):
+        if rate <= 0:
+            raise ValueError('the target rate has to be positive')
+        if arrivals not in ('constant', 'poisson'):
+            raise ValueError('unknown arrivals %s' % arrivals)
+        self.rate = float(rate)
+        self.poisson = arrivals == 'poisson'
+        # arrival time of the next token, 0 until the first one is taken
+        self.next_arrival = RawValue(c_double, 0)
+        self.lock = Lock()
+        # random numbers for the Poisson arrivals, created in each process
+        # on first use, so the processes don't share their sequence
+        self.random = None
+        self.pid = None
+
+    def interval(self):
+        """ Returns the time between two tokens in seconds.
+        """
+        if not self.poisson:
+            return 1 / self.rate
+        if self.pid != getpid():
+            self.random = Random()
+            self.pid = getpid()
+        return -log(1 - self.random.random()) / self.rate
+
+    def take(self, shutdown):
+        """ Takes the next token, waiting for its arrival unless the
+        shutdown signal is set first.
+
+        :param shutdown: multiprocessing.Event ending the wait
+        :return: the arrival time of the token in seconds since the epoch, i.e. the intended start of the query, or None if shutting down
+        :rtype: float or None
+        """
+        interval = self.interval()
+        with self.lock:
+            arrival = self.next_arrival.value
+            if arrival == 0:
+                arrival = time()
+            self.next_arrival.value = arrival + interval
+        delay = arrival - time()
+        if delay > 0 and shutdown.wait(delay):
+            return None
+        return arrival
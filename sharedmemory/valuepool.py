@@ -0,0 +1,118 @@
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from struct import Struct
+
+from sharedbuffer import SharedBuffer
+
+# start and end offset of a value, the end is the start of the next value
+bounds = Struct('<QQ')
+offset = Struct('<Q')
+
+# how the values of a pool are stored
+RAW = 0         # strings, stored as they are
+BYTEARRAY = 1   # bytearrays, stored as strings
+PICKLED = 2     # everything else
+
+
+class ValuePool(object):
+    """ Pre-generated values of a column, kept in shared memory and picked
+    by seed. Meant for payload attributes whose values need not be unique:
+    generating a pool once at startup makes getting a large text or blob
+    value as cheap as copying it out of the shared mapping.
+
+    The pool has to be created before the processes using it are forked.
+    Strings and bytearrays are stored as they are, all other values
+    pickled.
+
+    :param generator: instance of the random data class to generate the values with
+    :param generate: function generating one value, using generator
+    :param int size: number of values in the pool
+    :param optional int seed: seed of the generator. default = 0
+    """
+    def __init__(self, generator, generate, size, seed=0):
+        if size <= 0:
+            raise ValueError('The size of a value pool has to be positive.')
+        self.size = size
+        self.offsets = SharedBuffer((size + 1) * offset.size)
+        self.data = SharedBuffer()
+
+        generator.seed(seed)
+        self.kind = None
+        position = 0
+        offsets = self.offsets.map
+        for index in xrange(size):
+            value = generate()
+            if self.kind is None:
+                if isinstance(value, str):
+                    self.kind = RAW
+                elif isinstance(value, bytearray):
+                    self.kind = BYTEARRAY
+                else:
+                    self.kind = PICKLED
+            if self.kind == RAW:
+                encoded = value
+            elif self.kind == BYTEARRAY:
+                encoded = str(value)
+            else:
+                encoded = dumps(value, HIGHEST_PROTOCOL)
+            mapping = self.data.ensure(position + len(encoded))
+            mapping[position:position + len(encoded)] = encoded
+            offset.pack_into(offsets, index * offset.size, position)
+            position += len(encoded)
+        offset.pack_into(offsets, size * offset.size, position)
+        # The pool never changes from now on, so the mapping created here
+        # stays valid in all forked processes.
+        self.data.ensure(max(position, 1))
+
+    def __len__(self):
+        return self.size
+
+    def get(self, seed):
+        """ Returns the value at position seed modulo the size of the pool.
+
+        :param int seed: the seed of the value
+        """
+        start, end = bounds.unpack_from(self.offsets.map,
+                                        (seed % self.size) * offset.size)
+        value = self.data.map[start:end]
+        if self.kind == RAW:
+            return value
+        if self.kind == BYTEARRAY:
+            return bytearray(value)
+        return loads(value)
+
+
+def create_pools(plan, generator_class):
+    """ Creates a ValuePool for every distinct type, generator args and pool
+    size of the attributes of the plan that ask for a pool.
+
+    :param WorkloadPlan plan: the compiled workloads
+    :param generator_class: the random data class to generate the values with
+    :return: the pools by their key, see pool_key()
+    :rtype: dict
+    """
+    generator = generator_class()
+    pools = {}
+    for queries in plan.generators:
+        for attributes in queries:
+            for type, generator_args, pool_size in attributes:
+                if pool_size == 0:
+                    continue
+                key = pool_key(type, generator_args, pool_size)
+                if key in pools:
+                    continue
+                try:
+                    method = generator.methods_switch[type]
+                except KeyError:
+                    msg = "generator for type %s not implemented!" % type
+                    raise NotImplementedError(msg)
+                print 'generating a pool of %i %s values' % (pool_size, type)
+                pools[key] = ValuePool(generator,
+                                       lambda: method(**generator_args),
+                                       pool_size)
+    return pools
+
+
+def pool_key(type, generator_args, pool_size):
+    """ Returns the key of the pool of an attribute.
+    """
+    return type, repr(sorted(generator_args.items())), pool_size
@@ -0,0 +1,64 @@
+from unittest import TestCase, main
+
+from autoscaler import Autoscaler
+
+
+class FakeQueue(object):
+    """ A queue of a fixed depth whose items pass at a fixed rate. """
+    def __init__(self, depth, rate):
+        self.depth = depth
+        self.rate = rate
+        self.passed = 0
+
+    def qsize(self):
+        return self.depth
+
+    def counts(self):
+        return self.passed, self.passed
+
+    def tick(self):
+        self.passed += self.rate
+
+
+class FixedStageTest(TestCase):
+    """ In fused mode the fused workers keep their number, the autoscaler
+    only adds LogGenerators.
+    """
+    def decide(self, executed_depth):
+        executed = FakeQueue(executed_depth, 100)
+        stages = [('Fused', None, executed), ('Log', executed, None)]
+        autoscaler = Autoscaler(stages, executed, 100, fixed=('Fused',))
+        processes = {'Fused': 3, 'Log': 1}
+        decisions = []
+        for second in xrange(20):
+            executed.tick()
+            autoscaler.sample(second)
+            decision = autoscaler.decide(processes, True)
+            if decision is not None:
+                decisions.append(decision)
+        return decisions
+
+    def test_fixed_stage_not_added(self):
+        # the executed queries are taken right away, so the fused workers
+        # are the bottleneck
+        self.assertEqual(self.decide(0), [])
+
+    def test_other_stages_added(self):
+        decisions = self.decide(100)
+        self.assertTrue(decisions)
+        self.assertTrue(all(decision == ('add', 'Log')
+                            for decision in decisions))
+
+    def test_fixed_stage_not_retired(self):
+        executed = FakeQueue(100, 100)
+        stages = [('Fused', None, executed), ('Log', executed, None)]
+        autoscaler = Autoscaler(stages, executed, 100, fixed=('Fused',))
+        for second in xrange(5):
+            executed.tick()
+            autoscaler.sample(second)
+            decision = autoscaler.decide({'Fused': 3, 'Log': 1}, False)
+        self.assertEqual(decision, None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+from Queue import Queue
+from random import Random
+from unittest import TestCase, main, skipUnless
+
+from datagenerator import DataGenerator
+from randomdata.batchtypes import batch_available, generate_batch
+from randomdata.counterrandom import CounterCassandraTypes
+from randomdata.sizedistribution import SizeDistribution
+
+# types with generator args whose values are generated in batches
+batch_columns = [
+    ('int', {}), ('int', {'low': -5, 'high': 5}), ('counter', {}),
+    ('bigint', {'low': 0, 'high': 1 << 40}), ('varint', {'low': -100, 'high': 100}),
+    ('double', {}), ('float', {'low': 0, 'high': 1}),
+    ('decimal', {}), ('decimal', {'low': -1, 'high': 1, 'decimal_places': 6}),
+    ('boolean', {}), ('boolean', {'chance': .1}),
+    ('timestamp', {}), ('uuid', {}), ('timeuuid', {'timestamp': 1400000000}),
+    ('text', {}), ('ascii', {'size': 200}), ('varchar', {'size': 0}),
+    ('text', {'size': 100, 'compression_ratio': 4}),
+    ('blob', {}), ('blob', {'size': 1000, 'compression_ratio': 3}),
+    ('inet', {}), ('inet', {'ip_type': 'ipv6'})]
+# types with generator args that can't be vectorized
+scalar_columns = [
+    ('bigint', {}), ('varint', {}),
+    ('text', {'size': SizeDistribution({'distribution': 'uniform', 'min': 1, 'max': 20})}),
+    ('list', {}), ('set', {'elem_type': 'text'}), ('map', {})]
+
+
+def scalar(type, seeds, generator_args):
+    generator = CounterCassandraTypes()
+    method = generator.methods_switch[type]
+    values = []
+    for seed in seeds:
+        generator.seed(seed)
+        values.append(method(**generator_args))
+    return values
+
+
+class Plan(object):
+    """ The generators of a workload plan with a single query using all
+    given columns, see WorkloadPlan.
+    """
+    def __init__(self, columns):
+        self.generators = (((tuple((type, generator_args, 0)
+                                   for type, generator_args in columns)),),)
+
+
+@skipUnless(batch_available, 'NumPy is not installed')
+class BatchTypesTest(TestCase):
+    """ Keys are only found again if the batches reproduce the values of
+    the scalar methods exactly.
+    """
+    def setUp(self):
+        random = Random(1)
+        self.seeds = [random.getrandbits(64) - (1 << 63) for _ in xrange(200)]
+        self.seeds += [0, 1, -1, (1 << 63) - 1, -(1 << 63)]
+
+    def test_batch_equals_scalar(self):
+        for type, generator_args in batch_columns:
+            batch = generate_batch(type, self.seeds, generator_args)
+            self.assertIsNotNone(batch, (type, generator_args))
+            self.assertEqual(batch, scalar(type, self.seeds, generator_args),
+                             (type, generator_args))
+
+    def test_unsupported_types(self):
+        for type, generator_args in scalar_columns:
+            self.assertIsNone(generate_batch(type, self.seeds, generator_args),
+                              (type, generator_args))
+
+    def test_data_generator_falls_back(self):
+        columns = batch_columns + scalar_columns
+        outputs = []
+        for batch_size in (1, 16):
+            generator = DataGenerator(queue_in=Queue(), queue_out=Queue(),
+                                      plan=Plan(columns),
+                                      generator_class=CounterCassandraTypes,
+                                      batch_size=batch_size)
+            generator.after_init()
+            self.assertEqual(generator.batching, batch_size > 1)
+            for offset in xrange(0, 160, len(columns)):
+                seeds = self.seeds[offset:offset + len(columns)]
+                generator.queue_in.put((0, [(False, seeds)]))
+            output = []
+            while not generator.queue_in.empty():
+                generator.process_item()
+            while not generator.queue_out.empty():
+                output.append(generator.queue_out.get())
+            outputs.append(output)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertTrue(outputs[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import json
+import os
+from multiprocessing import Event, Process
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, main
+
+from sharedmemory.checkpoint import KeyStateCheckpoint, PAUSED
+from sharedmemory.hashtable import SharedHashTable
+from sharedmemory.keybitmap import SharedKeyBitmap
+
+seeds = 20000
+
+
+def key_structs():
+    return {'t': {'bitmap': SharedKeyBitmap(),
+                  'update_dict': SharedHashTable()}}
+
+
+def change(structs, gate, stop):
+    """ Updates and deletes random seeds like WorkloadGenerator.bitmap_seeds
+    does, until stop is set.
+    """
+    bitmap = structs['t']['bitmap']
+    update_dict = structs['t']['update_dict']
+    random = Random(1)
+    while not stop.is_set():
+        seed = random.randrange(seeds)
+        is_primary, was_updated, was_deleted = bitmap[seed]
+        if was_deleted:
+            continue
+        if random.random() < .8:
+            with gate:
+                update_dict.modify(seed, lambda update_seed: update_seed + 1, seed)
+                if not was_updated:
+                    bitmap.set_updated(seed)
+        else:
+            with gate:
+                bitmap.set_deleted(seed)
+                if was_updated:
+                    update_dict.pop(seed, None)
+
+
+class CheckpointTest(TestCase):
+    """ Saves checkpoints while another process changes the key state and
+    checks that the bitmap and the update_dict of each one fit together.
+    """
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_consistent_while_changing(self):
+        structs = key_structs()
+        for _ in xrange(seeds):
+            structs['t']['bitmap'].append(True)
+        checkpoint = KeyStateCheckpoint(self.directory)
+        stop = Event()
+        writer = Process(target=change, args=(structs, checkpoint.gate, stop))
+        writer.start()
+        try:
+            for _ in xrange(20):
+                checkpoint.save(structs)
+                restored = key_structs()
+                self.assertTrue(KeyStateCheckpoint(self.directory).restore(restored))
+                bitmap = restored['t']['bitmap']
+                update_dict = restored['t']['update_dict']
+                for seed in xrange(seeds):
+                    is_primary, was_updated, was_deleted = bitmap[seed]
+                    self.assertEqual(seed in update_dict,
+                                     was_updated and not was_deleted)
+        finally:
+            stop.set()
+            writer.join()
+
+    def test_written_after_pause(self):
+        structs = key_structs()
+        for _ in xrange(seeds):
+            structs['t']['bitmap'].append(True)
+        checkpoint = KeyStateCheckpoint(self.directory)
+        write_file = checkpoint.write_file
+        paused = []
+
+        def check_and_write(name, source, length):
+            paused.append(checkpoint.gate.state[PAUSED])
+            write_file(name, source, length)
+        checkpoint.write_file = check_and_write
+        checkpoint.save(structs)
+        self.assertTrue(paused)
+        self.assertFalse(any(paused))
+
+    def test_mismatched_epoch(self):
+        structs = key_structs()
+        structs['t']['bitmap'].append(True)
+        KeyStateCheckpoint(self.directory).save(structs)
+        path = os.path.join(self.directory, KeyStateCheckpoint.manifest_name)
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        manifest['counters']['t.update_dict.epoch'] += 1
+        with open(path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        self.assertRaises(ValueError,
+                          KeyStateCheckpoint(self.directory).restore,
+                          key_structs())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, main
+
+from sharedmemory.checkpoint import KeyStateCheckpoint
+from sharedmemory.hashtable import SharedHashTable
+
+
+class HashTableTest(TestCase):
+    """ Compares a SharedHashTable with a dict under the same operations.
+    """
+    def assertSame(self, table, expected):
+        self.assertEqual(len(table), len(expected))
+        for key, value in expected.iteritems():
+            self.assertEqual(table[key], value)
+
+    def test_growth(self):
+        # start small, so every segment grows several times
+        table = SharedHashTable(capacity=64, segments=4)
+        expected = {}
+        for key in xrange(-20000, 20000, 3):
+            table[key] = key * 7
+            expected[key] = key * 7
+        self.assertSame(table, expected)
+        self.assertTrue(all(segment.capacity.value > 16 for segment in table.segments))
+        self.assertNotIn(0, table)
+        self.assertEqual(table.get(0, 'default'), 'default')
+        self.assertRaises(KeyError, table.__getitem__, 0)
+
+    def test_rehash_over_deleted_slots(self):
+        table = SharedHashTable(capacity=64, segments=1)
+        expected = {}
+        random = Random(1)
+        # keep few items, but churn through many keys, so the slots fill
+        # up with deleted ones and the segment is rebuilt in place
+        for key in xrange(100000):
+            table[key] = key
+            expected[key] = key
+            if len(expected) > 10:
+                old = random.choice(expected.keys())
+                self.assertEqual(table.pop(old), expected.pop(old))
+        self.assertSame(table, expected)
+        self.assertEqual(table.segments[0].capacity.value, 64)
+        end = table.end.value
+        for key in xrange(100000, 110000):
+            table[key] = key
+            table.pop(key)
+        self.assertEqual(table.end.value, end)
+
+    def test_pop_and_modify(self):
+        table = SharedHashTable()
+        self.assertEqual(table.modify(5, lambda value: value * 2, 21), 42)
+        self.assertEqual(table.modify(5, lambda value: value + 1), 43)
+        self.assertEqual(table.pop(5), 43)
+        self.assertEqual(table.pop(5, None), None)
+        self.assertRaises(KeyError, table.pop, 5)
+        self.assertRaises(KeyError, table.__delitem__, 5)
+        table[-1] = -2
+        del table[-1]
+        self.assertEqual(len(table), 0)
+
+    def test_file_descriptors(self):
+        # a table holds its buffer's descriptor and the one of its mapping
+        fds = len(os.listdir('/proc/self/fd'))
+        tables = [SharedHashTable() for _ in xrange(20)]
+        self.assertLessEqual(len(os.listdir('/proc/self/fd')) - fds, 2 * len(tables))
+
+    def test_checkpoint(self):
+        directory = mkdtemp()
+        try:
+            table = SharedHashTable(capacity=64, segments=4)
+            expected = {}
+            for key in xrange(5000):
+                table[key] = -key
+                expected[key] = -key
+            for key in xrange(0, 5000, 5):
+                del table[key]
+                del expected[key]
+            KeyStateCheckpoint(directory).save({'t': {'update_dict': table}})
+            restored = SharedHashTable(capacity=64, segments=4)
+            KeyStateCheckpoint(directory).restore({'t': {'update_dict': restored}})
+            self.assertSame(restored, expected)
+            # the restored table goes on growing
+            for key in xrange(5000, 20000):
+                restored[key] = key
+                expected[key] = key
+            self.assertSame(restored, expected)
+        finally:
+            rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
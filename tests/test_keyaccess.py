@@ -0,0 +1,51 @@
+from random import Random
+from unittest import TestCase, main
+
+from randomdata.keyaccess import KeyAccess
+
+
+class ScrambledZipfianTest(TestCase):
+    """ Checks that the popular keys of the scrambled zipfian distribution
+    stay the same while the key space grows.
+    """
+    accesses = 50000
+
+    def counts(self, start, growth):
+        access = KeyAccess({'distribution': 'zipfian'})
+        random = Random(1).random
+        counts = {}
+        n = start
+        for _ in xrange(self.accesses):
+            rank = access.rank(random, n)
+            self.assertTrue(0 <= rank < n)
+            counts[rank] = counts.get(rank, 0) + 1
+            n += growth
+        return counts
+
+    def top_share(self, counts, keys=100):
+        return float(sum(sorted(counts.values())[-keys:])) / self.accesses
+
+    def test_growing(self):
+        # one insert per access, staying below the next power of two
+        fixed = self.top_share(self.counts(70000, 0))
+        growing = self.top_share(self.counts(70000, 1))
+        self.assertGreater(growing, .9 * fixed)
+
+    def test_hottest_keys_stay(self):
+        # the hottest keys of the start stay among the hottest ones, new
+        # keys may join them
+        access = KeyAccess({'distribution': 'zipfian'})
+        random = Random(2).random
+        hottest = []
+        for n in (70000, 90000, 110000):
+            counts = {}
+            for _ in xrange(self.accesses):
+                rank = access.rank(random, n)
+                counts[rank] = counts.get(rank, 0) + 1
+            hottest.append(sorted(counts, key=counts.get, reverse=True))
+        for later in hottest[1:]:
+            self.assertTrue(set(hottest[0][:5]) <= set(later[:20]))
+
+
+if __name__ == '__main__':
+    main()
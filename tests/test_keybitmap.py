@@ -0,0 +1,43 @@
+from random import Random
+from unittest import TestCase, main
+
+from sharedmemory.keybitmap import SharedKeyBitmap, LIVE_BLOCK, \
+    COMPRESSED_LIVE_BLOCK, LIVE_TREE_BLOCKS
+
+
+class NthLiveTest(TestCase):
+    """ Compares SharedKeyBitmap.nth_live() with a linear scan beyond the
+    range the tree of the live index initially covers.
+    """
+    def check(self, compressed, seeds, delete):
+        bitmap = SharedKeyBitmap(compressed=compressed)
+        random = Random(seeds)
+        for seed in xrange(seeds):
+            bitmap.append(random.random() < .1)
+        if delete:
+            # deletions in the first and in the last blocks, so the tree
+            # has to grow
+            for seed in random.sample(xrange(seeds), seeds // 20):
+                bitmap.set_deleted(seed)
+            bitmap.set_deleted(seeds - 1)
+        live = [seed for seed in xrange(seeds) if not bitmap.was_deleted(seed)]
+        self.assertEqual(bitmap.live(), len(live))
+        positions = set(random.sample(xrange(len(live)), 2000))
+        positions.update((0, len(live) - 1))
+        for n in sorted(positions):
+            self.assertEqual(bitmap.nth_live(n), live[n])
+        self.assertEqual(bitmap.nth_live(len(live)), None)
+
+    def test_uncompressed(self):
+        seeds = LIVE_BLOCK * LIVE_TREE_BLOCKS + 5000
+        self.check(False, seeds, False)
+        self.check(False, seeds, True)
+
+    def test_compressed(self):
+        seeds = COMPRESSED_LIVE_BLOCK * LIVE_TREE_BLOCKS + 5000
+        self.check(True, seeds, False)
+        self.check(True, seeds, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from unittest import TestCase, main
+
+from datagenerator import WorkloadGenerator
+from randomdata.cassandratypes import CassandraTypes
+from randomdata.counterrandom import CounterCassandraTypes
+from randomdata.keyaccess import KeyAccess
+from sharedmemory.hashtable import SharedHashTable
+from sharedmemory.keybitmap import SharedKeyBitmap
+from workloadplan import WorkloadPlan, INSERT, SELECT
+
+
+def workloads():
+    attributes = [{'level': 'partition', 'column name hash': 1,
+                   'type': 'int', 'generator args': {}},
+                  {'level': 'cluster', 'column name hash': 2,
+                   'type': 'int', 'generator args': {}}]
+    return {'insert': {'ratio': 1, 'queries': [
+                {'type': 'insert', 'table': 't', 'chance': .1,
+                 'prepared_statement': None, 'attributes': attributes}]},
+            'select': {'ratio': 1, 'queries': [
+                {'type': 'select', 'table': 't', 'prepared_statement': None,
+                 'attributes': attributes}]}}
+
+
+class KeyChoiceTest(TestCase):
+    """ Counts the distinct keys chosen by selects. Replaying the partition
+    seed of a non-primary seed must not make the next choice depend on the
+    last one.
+    """
+    seeds = 60000
+    selects = 100000
+
+    def distinct_keys(self, generator_class, access):
+        key_struct = {'bitmap': SharedKeyBitmap(),
+                      'update_dict': SharedHashTable()}
+        generator = WorkloadGenerator(plan=WorkloadPlan(workloads()),
+                                      key_structs={'t': key_struct},
+                                      generator_class=generator_class)
+        generator.after_init()
+        for _ in xrange(self.seeds):
+            generator.bitmap_seeds(INSERT, .1, key_struct)
+        return len(set(generator.bitmap_seeds(SELECT, None, key_struct, access)[1]
+                       for _ in xrange(self.selects)))
+
+    def test_uniform(self):
+        # about 1 - 1/e**(5/3) of the keys are expected
+        for generator_class in (CassandraTypes, CounterCassandraTypes):
+            self.assertGreater(self.distinct_keys(generator_class, None), 45000)
+
+    def test_zipfian(self):
+        access = KeyAccess({'distribution': 'zipfian'})
+        for generator_class in (CassandraTypes, CounterCassandraTypes):
+            self.assertGreater(self.distinct_keys(generator_class, access), 35000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from multiprocessing import Process, Queue
+from Queue import Empty, Full
+from random import Random
+from unittest import TestCase, main
+
+from sharedmemory.ringbuffer import SharedRingBuffer
+
+
+def produce(ring, producer, items):
+    for number in xrange(items):
+        # items of varying size, so records wrap at different offsets
+        ring.put((producer, number, 'x' * (number % 300)))
+
+
+def consume(ring, items, results):
+    results.put([ring.get()[:2] for _ in xrange(items)])
+
+
+class RingBufferTest(TestCase):
+    """ Puts and gets items through a small ring, so it wraps around and
+    the producers wait for space.
+    """
+    def test_single_process(self):
+        ring = SharedRingBuffer(1000)
+        random = Random(1)
+        expected = []
+        received = []
+        for number in xrange(20000):
+            if random.random() < .5:
+                item = 'x' * random.randrange(0, 300) + str(number)
+                try:
+                    ring.put(item, block=False)
+                    expected.append(item)
+                except Full:
+                    pass
+            else:
+                try:
+                    received.append(ring.get_nowait())
+                except Empty:
+                    pass
+            self.assertEqual(ring.qsize(), len(expected) - len(received))
+        while ring.qsize():
+            received.append(ring.get())
+        self.assertEqual(received, expected)
+        self.assertRaises(Empty, ring.get, timeout=.01)
+
+    def test_processes(self):
+        producers, consumers, items = 3, 2, 6000
+        ring = SharedRingBuffer(4096)
+        results = Queue()
+        processes = [Process(target=produce, args=(ring, producer, items))
+                     for producer in xrange(producers)]
+        processes += [Process(target=consume,
+                              args=(ring, producers * items // consumers, results))
+                      for _ in xrange(consumers)]
+        for process in processes:
+            process.start()
+        received = [results.get(timeout=60) for _ in xrange(consumers)]
+        for process in processes:
+            process.join()
+        # every item arrives exactly once, and each consumer gets the items
+        # of a producer in the order they were put
+        for items_of_consumer in received:
+            for producer in xrange(producers):
+                numbers = [number for origin, number in items_of_consumer
+                           if origin == producer]
+                self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(sorted(item for items_of_consumer in received
+                                for item in items_of_consumer),
+                         [(producer, number) for producer in xrange(producers)
+                          for number in xrange(items)])
+        self.assertEqual(ring.qsize(), 0)
+        self.assertEqual(ring.counts(), (producers * items, producers * items))
+
+
+if __name__ == '__main__':
+    main()
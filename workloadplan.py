@@ -0,0 +1,110 @@
+from randomdata.keyaccess import KeyAccess
+from randomdata.sizedistribution import size_distribution
+
+# generator args that may hold a size distribution instead of a number
+size_args = ('size', 'elems')
+
+# codes of the query types
+INSERT = 0
+SELECT = 1
+UPDATE = 2
+DELETE = 3
+query_types = {'insert': INSERT, 'select': SELECT,
+               'update': UPDATE, 'delete': DELETE}
+
+# codes of the levels of attributes, the index of the matching seed in the
+# (partition seed, cluster seed, update seed) tuple of the WorkloadGenerator
+PARTITION = 0
+CLUSTER = 1
+ATTRIBUTE = 2
+levels = {'partition': PARTITION, 'cluster': CLUSTER, 'attribute': ATTRIBUTE}
+
+
+class WorkloadPlan(object):
+    """ Compiled form of the workloads section of a processed config, see
+    the end of preparation/cassandrapreparation.py for its format. The
+    generators work off the plan instead of walking the nested dicts of the
+    config for every item, and only the plan is handed to their processes.
+
+    Workloads are identified by their index, queries by their index within
+    their workload. For the workload with index i
+    - names[i] is its name and ratios[i] its ratio,
+    - queries[i] holds a (type code, table, chance, attributes) tuple for
+      each query, where chance is None for all but insert queries and
+      attributes holds a (level code, column name hash) tuple for each
+      attribute,
+    - generators[i] holds a tuple of (type, generator args, pool size)
+      tuples for each query, one per attribute, where a pool size of 0
+      means that the values are not taken from a ValuePool,
+    - statements[i] holds the prepared statement of each query,
+    - access[i] is the KeyAccess choosing the existing keys its queries
+      work on, given as 'access' in the config of the workload, or None if
+      the keys are chosen uniformly.
+
+    :param dict workloads: the workloads section of the processed config
+    """
+    def __init__(self, workloads):
+        self.names = tuple(sorted(workloads.keys()))
+        self.ratios = tuple(workloads[name]['ratio'] for name in self.names)
+        self.access = tuple(KeyAccess(workloads[name]['access'])
+                            if workloads[name].get('access') else None
+                            for name in self.names)
+        queries = []
+        generators = []
+        statements = []
+        for name in self.names:
+            workload_queries = workloads[name]['queries']
+            queries.append(tuple(self.compile_query(query)
+                                 for query in workload_queries))
+            generators.append(tuple(
+                tuple(self.compile_generator(attribute)
+                      for attribute in query['attributes'])
+                for query in workload_queries))
+            statements.append(tuple(query['prepared_statement']
+                                    for query in workload_queries))
+        self.queries = tuple(queries)
+        self.generators = tuple(generators)
+        self.statements = tuple(statements)
+
+    @staticmethod
+    def compile_generator(attribute):
+        """ Returns the (type, generator args, pool size) tuple of an
+        attribute. The pool size is given as 'pool size' in the
+        distribution of the column and is removed from the generator args.
+        Sizes given as a dict are replaced by their SizeDistribution.
+
+        :param dict attribute: an attribute of a query of the processed config
+        """
+        generator_args = dict(attribute['generator args'])
+        pool_size = generator_args.pop('pool size', 0)
+        for name in size_args:
+            if isinstance(generator_args.get(name), dict):
+                generator_args[name] = size_distribution(generator_args[name])
+        if pool_size and attribute['level'] != 'attribute':
+            # keys have to be unique per seed
+            raise ValueError('Value pools are only allowed for columns '
+                             'that are not part of the primary key.')
+        return attribute['type'], generator_args, pool_size
+
+    @staticmethod
+    def compile_query(query):
+        """ Returns the (type code, table, chance, attributes) tuple of a
+        query.
+
+        :param dict query: a query of the processed config
+        """
+        # queries without attributes don't need seeds, so their type
+        # doesn't matter
+        query_type = query_types.get(query['type'])
+        if query_type is None and len(query['attributes']) > 0:
+            msg = 'unsupported query type %s' % query['type']
+            raise NotImplementedError(msg)
+        if query_type == INSERT:
+            chance = query['chance']
+        else:
+            chance = None
+        attributes = tuple((levels[attribute['level']],
+                            attribute['column name hash'])
+                           for attribute in query['attributes'])
+        # queries without attributes don't need a table
+        return query_type, query.get('table'), chance, attributes